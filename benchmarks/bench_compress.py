@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+"""Compare wall clock time and archive size of the zip engine in
+:mod:`pyfilemail.archive` against :class:`zipfile.ZipFile` on a mixed
+payload of compressible text and already compressed media.
+
+usage: python benchmarks/bench_compress.py [MB per file type]
+"""
+import os
+import sys
+import time
+import shutil
+import random
+import tempfile
+from zipfile import ZipFile, ZIP_STORED, ZIP_DEFLATED
+from multiprocessing import cpu_count
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from pyfilemail.archive import write_zip  # noqa
+
+WORDS = ('lorem ipsum dolor sit amet consectetur adipiscing elit sed do '
+         'eiusmod tempor incididunt ut labore et dolore magna aliqua').split()
+
+
+def make_payload(root, megabytes):
+    """Create a folder with text, log, csv, jpg, mp4 and zip files."""
+
+    size = megabytes * 1024 * 1024
+    rnd = random.Random(0)
+
+    for index in range(4):
+        text = ' '.join(rnd.choice(WORDS) for i in range(size // 24))
+        for ext in ('txt', 'log', 'csv'):
+            with open(os.path.join(root, 'doc%d.%s' % (index, ext)), 'wb') as f:
+                f.write(text[:size // 4])
+
+        for ext in ('jpg', 'mp4', 'zip'):
+            with open(os.path.join(root, 'media%d.%s' % (index, ext)), 'wb') as f:
+                f.write(os.urandom(size // 4))
+
+    return [os.path.join(root, name) for name in sorted(os.listdir(root))]
+
+
+def zipfile_archive(compression):
+    def run(filepaths, zip_filename):
+        zip_file = ZipFile(zip_filename, 'w', compression)
+        for filepath in filepaths:
+            zip_file.write(filepath)
+
+        zip_file.close()
+
+    return run
+
+
+def write_zip_archive(workers):
+    def run(filepaths, zip_filename):
+        write_zip(filepaths, zip_filename, workers=workers)
+
+    return run
+
+
+def main():
+    megabytes = len(sys.argv) > 1 and int(sys.argv[1]) or 64
+
+    tmpdir = tempfile.mkdtemp()
+    payload = os.path.join(tmpdir, 'payload')
+    os.makedirs(payload)
+
+    try:
+        filepaths = make_payload(payload, megabytes)
+        total = sum(os.path.getsize(path) for path in filepaths)
+
+        candidates = [
+            ('ZipFile STORED', zipfile_archive(ZIP_STORED)),
+            ('ZipFile DEFLATED', zipfile_archive(ZIP_DEFLATED)),
+            ('write_zip 1 worker', write_zip_archive(1)),
+            ('write_zip %d workers' % cpu_count(),
+             write_zip_archive(cpu_count()))
+            ]
+
+        print('Payload: %d files, %.1f MB' % (len(filepaths), total / 1e6))
+        print('%-24s %10s %12s' % ('engine', 'seconds', 'size MB'))
+
+        for name, run in candidates:
+            zip_filename = os.path.join(tmpdir, 'bench.zip')
+            start = time.time()
+            run(filepaths, zip_filename)
+            elapsed = time.time() - start
+
+            size = os.path.getsize(zip_filename)
+            os.remove(zip_filename)
+
+            print('%-24s %10.2f %12.1f' % (name, elapsed, size / 1e6))
+
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main()
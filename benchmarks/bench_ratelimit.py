@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+"""Measure how accurately :mod:`pyfilemail.ratelimit` holds a bandwidth
+limit shared by concurrent uploads and downloads against a local HTTP
+server, and how it follows a rate change during transfer.
+
+usage: python benchmarks/bench_ratelimit.py [rate KB/s] [streams]
+"""
+import os
+import sys
+import time
+import threading
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from SocketServer import ThreadingMixIn
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from pyfilemail.ratelimit import TokenBucket, ThrottledReader, consume  # noqa
+
+PAYLOAD = os.urandom(4 * 1024 * 1024)
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        remaining = int(self.headers['Content-Length'])
+        while remaining:
+            remaining -= len(self.rfile.read(min(remaining, 65536)))
+
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(PAYLOAD)))
+        self.end_headers()
+        self.wfile.write(PAYLOAD)
+
+
+class Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Benchmark aborts downloads half way
+        pass
+
+
+class Body(object):
+    """Endless upload body of `size` bytes"""
+
+    def __init__(self, size):
+        self.len = size
+
+    def read(self, size=-1):
+        size = min(size < 0 and self.len or size, self.len)
+        self.len -= size
+        return PAYLOAD[:size]
+
+
+def upload(url, bucket, counter, stop):
+    session = requests.Session()
+    while not stop.is_set():
+        reader = ThrottledReader(Body(256 * 1024), [bucket])
+        session.post(url, data=reader)
+        counter[0] += 256 * 1024
+
+
+def download(url, bucket, counter, stop):
+    session = requests.Session()
+    while not stop.is_set():
+        res = session.get(url, stream=True)
+        for chunk in res.iter_content(64 * 1024):
+            consume([bucket], len(chunk))
+            counter[0] += len(chunk)
+            if stop.is_set():
+                break
+
+        res.close()
+
+
+def measure(url, bucket, worker, streams, seconds):
+    counters = [[0] for i in range(streams)]
+    stop = threading.Event()
+    threads = [threading.Thread(target=worker,
+                                args=(url, bucket, counter, stop))
+               for counter in counters]
+
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+
+    # Skip the initial burst
+    time.sleep(1)
+    start = [counter[0] for counter in counters]
+    began = time.time()
+    time.sleep(seconds)
+    elapsed = time.time() - began
+    shares = [(counter[0] - s) / elapsed for counter, s in zip(counters, start)]
+    stop.set()
+
+    return sum(shares), shares
+
+
+def main():
+    rate = (len(sys.argv) > 1 and int(sys.argv[1]) or 2048) * 1024
+    streams = len(sys.argv) > 2 and int(sys.argv[2]) or 4
+
+    server = Server(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    url = 'http://127.0.0.1:%d/' % server.server_address[1]
+
+    print('%-10s %8s %12s %12s %8s' %
+          ('direction', 'streams', 'target KB/s', 'actual KB/s', 'error'))
+
+    for name, worker in (('upload', upload), ('download', download)):
+        for target in (rate, rate // 2):
+            bucket = TokenBucket(target)
+            total, shares = measure(url, bucket, worker, streams, 5)
+            print('%-10s %8d %12d %12d %7.1f%%' %
+                  (name, streams, target // 1024, total // 1024,
+                   (total - target) * 100.0 / target))
+            print('%-10s %8s per stream KB/s: %s' %
+                  ('', '', ', '.join('%d' % (s // 1024) for s in shares)))
+
+    # Change rate while transfers are running
+    bucket = TokenBucket(rate)
+    counter = [0]
+    stop = threading.Event()
+    worker = threading.Thread(target=download,
+                              args=(url, bucket, counter, stop))
+    worker.daemon = True
+    worker.start()
+    time.sleep(2)
+    before = counter[0]
+    bucket.set_rate(rate // 4)
+    time.sleep(1)
+    before = counter[0]
+    time.sleep(4)
+    stop.set()
+    print('rate change: target %d KB/s, actual %d KB/s' %
+          (rate // 4 // 1024, (counter[0] - before) / 4 // 1024))
+
+
+if __name__ == '__main__':
+    main()
@@ -11,6 +11,7 @@ import os
 import logging
 import json
 from functools import wraps
+from multiprocessing.pool import ThreadPool
 from netrc import netrc, NetrcParseError
 
 # Check for .netrc file
@@ -82,6 +83,58 @@ def login_required(f):
     return check_login
 
 
+def pool_map(func, items, workers=1):
+    """Apply `func` to every item using a pool of worker threads.
+    Results are returned in the same order as `items`. Exceptions raised by
+    `func` are re-raised in the calling thread.
+
+    :param func: function taking one item as argument
+    :param items: items to process
+    :param workers: number of threads to use
+    :type func: ``func``
+    :type items: ``list``
+    :type workers: ``int``
+    :rtype: ``list``
+    """
+
+    items = list(items)
+    workers = min(workers or 1, len(items))
+
+    if workers <= 1:
+        return [func(item) for item in items]
+
+    pool = ThreadPool(workers)
+    try:
+        # A timeout on get() keeps the main thread interruptible by Ctrl-C
+        return pool.map_async(func, items, chunksize=1).get(2 ** 31)
+
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def replace_file(source, target):
+    """Rename `source` to `target`, replacing `target` if it exists. Python
+    2 has no :func:`os.replace`, and Windows won't rename over an existing
+    file, so it's removed first there.
+
+    :param source: path of file to rename
+    :param target: new path
+    :type source: ``str`` or ``unicode``
+    :type target: ``str`` or ``unicode``
+    """
+
+    try:
+        os.rename(source, target)
+
+    except OSError:
+        if not os.path.exists(target):
+            raise
+
+        os.remove(target)
+        os.rename(source, target)
+
+
 def load_config():
     """Load configuration file containing API KEY and other settings.
 
@@ -143,4 +196,7 @@ def get_configfile():
 
 
 from users import User  # lint:ok
-from transfer import Transfer  # lint:ok
\ No newline at end of file
+from transfer import Transfer  # lint:ok
+from asynchronous import AsyncUser, AsyncTransfer  # lint:ok
+from sync import Sync  # lint:ok
+from cache import TransferCache  # lint:ok
\ No newline at end of file
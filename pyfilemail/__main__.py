@@ -27,6 +27,9 @@ from pyfilemail import (
 
 from users import User
 from transfer import Transfer
+from journal import Journal
+from errors import FMBaseError
+import ratelimit
 
 unicodize = lambda s: unicode(s, 'utf-8')
 
@@ -59,12 +62,84 @@ def parse_args():
                         default=True,
                         help="Skip calculating checksum on added files")
 
+    parser.add_argument('--hash-workers',
+                        dest='hash_workers',
+                        action='store',
+                        type=int,
+                        default=1,
+                        metavar=1,
+                        help='Number of threads calculating checksums')
+
+    parser.add_argument('--upload-workers',
+                        dest='upload_workers',
+                        action='store',
+                        type=int,
+                        default=1,
+                        metavar=1,
+                        help='Number of files to upload at the same time')
+
+    parser.add_argument('--chunk-size',
+                        dest='chunk_size',
+                        action='store',
+                        type=int,
+                        default=0,
+                        metavar=0,
+                        help='Upload files in parts of this many MB. \
+0=upload files in one piece')
+
+    parser.add_argument('--retries',
+                        dest='retries',
+                        action='store',
+                        type=int,
+                        default=3,
+                        metavar=3,
+                        help='Number of times to retry a failed part')
+
+    parser.add_argument('--max-upload-rate',
+                        dest='max_upload_rate',
+                        action='store',
+                        default=None,
+                        metavar='RATE',
+                        help='Limit upload speed in bytes per second. \
+Use K, M or G suffix, e.g. 500K')
+
+    parser.add_argument('--max-download-rate',
+                        dest='max_download_rate',
+                        action='store',
+                        default=None,
+                        metavar='RATE',
+                        help='Limit download speed in bytes per second. \
+Use K, M or G suffix, e.g. 10M')
+
     parser.add_argument('--compress',
                         dest='compress',
                         action='store_true',
                         default=False,
                         help='Compress (ZIP) data before sending?')
 
+    parser.add_argument('--compress-workers',
+                        dest='compress_workers',
+                        action='store',
+                        type=int,
+                        default=None,
+                        metavar='CPUS',
+                        help='Number of processes compressing files. \
+Defaults to number of cpus')
+
+    parser.add_argument('--stream-compress',
+                        dest='stream_compress',
+                        action='store_true',
+                        default=False,
+                        help='Build the zip file while sending instead of \
+writing it to disk first. Implies --compress')
+
+    parser.add_argument('--probe',
+                        dest='probe',
+                        action='store_true',
+                        default=False,
+                        help='Measure the fileserver while files are added \
+and switch to another one if it is clearly degraded')
+
     parser.add_argument('--confirm',
                         dest='confirm',
                         action='store_true',
@@ -151,6 +226,16 @@ https://github.com/apetrynet/pyfilemail',
                         default=False,
                         help='Delete password stored in keychain')
 
+    parser.add_argument('--resume',
+                        dest='resume',
+                        action='store',
+                        nargs='?',
+                        const=True,
+                        default=None,
+                        metavar='TRANSFERID',
+                        help='Resume an interrupted transfer. Resumes the \
+most recent one if no TRANSFERID is given')
+
     parser.add_argument('--payload',
                         action='store',
                         dest='payload',
@@ -190,6 +275,31 @@ https://github.com/apetrynet/pyfilemail',
         logger.error(msg)
         sys.exit(1)
 
+    # Set process wide bandwidth limits
+    try:
+        if args.max_upload_rate is not None:
+            ratelimit.upload_limit.set_rate(
+                ratelimit.parse_rate(args.max_upload_rate)
+                )
+
+        if args.max_download_rate is not None:
+            ratelimit.download_limit.set_rate(
+                ratelimit.parse_rate(args.max_download_rate)
+                )
+
+    except FMBaseError as e:
+        logger.error(e)
+        sys.exit(1)
+
+    # Set console logging to a minimal if user wants it
+    if args.quiet:
+        streamhandler.setLevel(logging.WARNING)
+        logger.info('Quiet console stream logging enabled.')
+
+    # Recipient(s) and payload are stored in the journal when resuming
+    if args.resume is not None:
+        return args
+
     # Check for recipient(s)
     if args.to is None:
         msg = 'Please provide recipient(s) to the --to argument'
@@ -202,11 +312,6 @@ https://github.com/apetrynet/pyfilemail',
         logger.error(msg)
         sys.exit(1)
 
-    # Set console logging to a minimal if user wants it
-    if args.quiet:
-        streamhandler.setLevel(logging.WARNING)
-        logger.info('Quiet console stream logging enabled.')
-
     return args
 
 
@@ -236,28 +341,50 @@ def main():
 
         fm_user = User(args.username, password=pwd)
 
-        transfer = Transfer(
-            fm_user,
-            to=args.to,
-            subject=args.subject,
-            message=args.message,
-            notify=args.notify,
-            confirmation=args.confirm,
-            days=args.days,
-            downloads=args.downloads,
-            password=args.password,
-            checksum=args.checksum,
-            zip_=args.compress
-            )
-
-        transfer.add_files(args.payload)
-
-        res = transfer.send()
+        if args.resume is not None:
+            transferid = args.resume is not True and args.resume or None
+            try:
+                journal = Journal.find(args.username, transferid)
+
+            except FMBaseError as e:
+                logger.error(e)
+                sys.exit(1)
+
+            msg = 'Resuming transfer: {transferid}'
+            logger.info(msg.format(transferid=journal.transferid))
+
+            transfer = Transfer.from_journal(fm_user, journal)
+
+        else:
+            transfer = Transfer(
+                fm_user,
+                to=args.to,
+                subject=args.subject,
+                message=args.message,
+                notify=args.notify,
+                confirmation=args.confirm,
+                days=args.days,
+                downloads=args.downloads,
+                password=args.password,
+                checksum=args.checksum,
+                zip_=args.compress or args.stream_compress,
+                stream_zip=args.stream_compress,
+                compress_workers=args.compress_workers,
+                hash_workers=args.hash_workers,
+                probe=args.probe,
+                journal=True
+                )
+
+            transfer.add_files(args.payload)
+
+        res = transfer.send(workers=args.upload_workers,
+                            chunk_size=args.chunk_size * 1024 * 1024,
+                            retries=args.retries)
 
         if res.status_code == 200:
             msg = '\nTransfer complete!'
             logger.info(msg)
 
     except KeyboardInterrupt:
-        msg = '\nAborted by user!'
+        msg = '\nAborted by user! Use --resume to finish the transfer.'
         logger.warning(msg)
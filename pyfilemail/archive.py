@@ -0,0 +1,965 @@
+import os
+import time
+import zlib
+import shutil
+import struct
+import tempfile
+from hashlib import md5
+from itertools import islice
+from collections import deque
+from mimetypes import guess_type
+from multiprocessing import Pool, cpu_count
+
+from errors import FMFileError
+
+# Size of blocks read from disk while streaming archives
+BLOCKSIZE = 64 * 1024
+
+# Files deflated ahead of the one written to the archive, per worker
+AHEAD = 2
+
+# Bytes from start of file used to judge how well it compresses
+SAMPLE_SIZE = 64 * 1024
+
+# Files whose sample doesn't shrink below this ratio are stored as is
+COMPRESS_THRESHOLD = 0.9
+
+# Mime types of formats that are compressed already
+COMPRESSED_TYPES = (
+    'image/jpeg',
+    'image/png',
+    'image/gif',
+    'image/webp',
+    'video/',
+    'audio/mpeg',
+    'audio/mp4',
+    'audio/ogg',
+    'audio/x-flac',
+    'application/zip',
+    'application/gzip',
+    'application/x-gzip',
+    'application/x-bzip2',
+    'application/x-xz',
+    'application/x-7z-compressed',
+    'application/x-rar-compressed',
+    'application/pdf'
+    )
+
+# Zip format constants
+LOCAL_HEADER = struct.Struct('<IHHHHHIIIHH')
+LOCAL_HEADER_SIGNATURE = 0x04034b50
+DATA_DESCRIPTOR = struct.Struct('<IIII')
+DATA_DESCRIPTOR_SIGNATURE = 0x08074b50
+CENTRAL_HEADER = struct.Struct('<IHHHHHHIIIHHHHHII')
+CENTRAL_HEADER_SIGNATURE = 0x02014b50
+END_RECORD = struct.Struct('<IHHHHIIH')
+END_RECORD_SIGNATURE = 0x06054b50
+
+ZIP_STORED = 0
+ZIP_DEFLATED = 8
+
+# Sizes and offsets are stored in data descriptor
+FLAG_ENCRYPTED = 0x01
+FLAG_DATA_DESCRIPTOR = 0x08
+FLAG_UTF8 = 0x800
+
+# Records that follow the last entry of an archive: central directory,
+# digital signature, zip64 end record and locator and end record
+TRAILING_SIGNATURES = (
+    CENTRAL_HEADER_SIGNATURE,
+    0x05054b50,
+    0x06064b50,
+    0x07064b50,
+    END_RECORD_SIGNATURE
+    )
+
+# Info-ZIP extra field with utf-8 name of entry
+UNICODE_PATH_EXTRA = 0x7075
+
+# Largest end record including a maximum length comment
+END_RECORD_MAX_SIZE = END_RECORD.size + 0xffff
+
+VERSION = 20
+VERSION_MADE_BY = (3 << 8) | VERSION
+ZIP_LIMIT = 0xffffffff
+ZIP_MAX_ENTRIES = 0xffff
+
+
+def get_arcname(filepath):
+    """Name of file inside archive. Same rules as
+    :func:`zipfile.ZipFile.write`.
+
+    :param filepath: path to file or folder
+    :type filepath: ``str``, ``unicode``
+    :rtype: ``str`` utf-8 encoded
+    """
+
+    arcname = os.path.normpath(os.path.splitdrive(filepath)[1])
+    while arcname[0] in (os.sep, os.altsep):
+        arcname = arcname[1:]
+
+    arcname = arcname.replace(os.sep, '/')
+
+    if os.path.isdir(filepath):
+        arcname += '/'
+
+    if isinstance(arcname, unicode):
+        arcname = arcname.encode('utf-8')
+
+    return arcname
+
+
+def dos_datetime(timestamp):
+    """Convert timestamp to the date and time format used in zip files.
+
+    :param timestamp: seconds since epoch
+    :type timestamp: ``float``
+    :rtype: ``tuple`` with (date, time)
+    """
+
+    t = time.localtime(timestamp)
+    if t.tm_year < 1980:
+        return (1 << 5) | 1, 0
+
+    dosdate = (t.tm_year - 1980) << 9 | t.tm_mon << 5 | t.tm_mday
+    dostime = t.tm_hour << 11 | t.tm_min << 5 | t.tm_sec // 2
+
+    return dosdate, dostime
+
+
+class ZipEntry(object):
+    """A single file or folder in a zip archive.
+
+    :param filepath: path to file or folder on disk
+    :param method: ``ZIP_STORED`` or ``ZIP_DEFLATED``
+    :type filepath: ``str``, ``unicode``
+    :type method: ``int``
+    """
+
+    def __init__(self, filepath, method=ZIP_STORED):
+        st = os.stat(filepath)
+
+        self.filepath = filepath
+        self.arcname = get_arcname(filepath)
+        self.is_dir = os.path.isdir(filepath)
+        self.method = method
+        self.size = not self.is_dir and st.st_size or 0
+        self.compress_size = self.size
+        self.crc = 0
+        self.offset = 0
+        self.date, self.time = dos_datetime(st.st_mtime)
+
+        if self.is_dir:
+            self.external_attr = (040775 << 16) | 0x10
+
+        else:
+            self.external_attr = (st.st_mode & 0xffff) << 16
+
+        self.flags = 0
+        try:
+            self.arcname.decode('ascii')
+
+        except UnicodeDecodeError:
+            self.flags |= FLAG_UTF8
+
+    def local_header(self):
+        """Local file header. crc and sizes must be set first, no data
+        descriptor is written as not all readers accept one after stored
+        data.
+
+        :rtype: ``str``
+        """
+
+        return LOCAL_HEADER.pack(LOCAL_HEADER_SIGNATURE,
+                                 VERSION,
+                                 self.flags,
+                                 self.method,
+                                 self.time,
+                                 self.date,
+                                 self.crc,
+                                 self.compress_size,
+                                 self.size,
+                                 len(self.arcname),
+                                 0) + self.arcname
+
+    def central_header(self):
+        """:rtype: ``str``"""
+
+        return CENTRAL_HEADER.pack(CENTRAL_HEADER_SIGNATURE,
+                                   VERSION_MADE_BY,
+                                   VERSION,
+                                   self.flags,
+                                   self.method,
+                                   self.time,
+                                   self.date,
+                                   self.crc,
+                                   self.compress_size,
+                                   self.size,
+                                   len(self.arcname),
+                                   0,
+                                   0,
+                                   0,
+                                   0,
+                                   self.external_attr,
+                                   self.offset) + self.arcname
+
+    @property
+    def archive_size(self):
+        """Number of bytes entry takes up in archive including headers.
+
+        :rtype: ``int``
+        """
+
+        return (LOCAL_HEADER.size +
+                len(self.arcname) +
+                self.compress_size +
+                CENTRAL_HEADER.size +
+                len(self.arcname))
+
+
+def file_crc(filepath, blocksize=BLOCKSIZE):
+    """crc32 and size of file at `filepath`.
+
+    :param filepath: path to file
+    :param blocksize: number of bytes read at a time
+    :type filepath: ``str``, ``unicode``
+    :type blocksize: ``int``
+    :rtype: ``tuple`` (crc, size)
+    """
+
+    crc = 0
+    size = 0
+    with open(filepath, 'rb') as f:
+        for block in iter(lambda: f.read(blocksize), ''):
+            size += len(block)
+            crc = zlib.crc32(block, crc)
+
+    return crc & 0xffffffff, size
+
+
+def end_record(entries, offset, size):
+    """End of central directory record.
+
+    :param entries: entries in archive
+    :param offset: offset of central directory
+    :param size: size of central directory
+    :type entries: ``list``
+    :type offset: ``int``
+    :type size: ``int``
+    :rtype: ``str``
+    """
+
+    return END_RECORD.pack(END_RECORD_SIGNATURE,
+                           0,
+                           0,
+                           len(entries),
+                           len(entries),
+                           size,
+                           offset,
+                           0)
+
+
+def check_limits(entries, total):
+    """Make sure archive can be written without zip64 extensions.
+
+    :raises: :class:`FMFileError` if archive is too large
+    """
+
+    if len(entries) >= ZIP_MAX_ENTRIES or total >= ZIP_LIMIT:
+        msg = 'Archive too large: {count} files, {size} bytes'
+        raise FMFileError(msg.format(count=len(entries), size=total))
+
+
+def choose_method(filepath,
+                  sample_size=SAMPLE_SIZE,
+                  threshold=COMPRESS_THRESHOLD):
+    """Decide whether a file is worth compressing. Files with a mime type
+    of an already compressed format are stored. Other files are judged by
+    how well a sample from the start of the file compresses.
+
+    :param filepath: path to file
+    :param sample_size: number of bytes to sample
+    :param threshold: compressed/uncompressed ratio of sample above which
+     the file is stored
+    :type filepath: ``str``, ``unicode``
+    :type sample_size: ``int``
+    :type threshold: ``float``
+    :rtype: ``int`` ``ZIP_STORED`` or ``ZIP_DEFLATED``
+    """
+
+    if os.path.isdir(filepath):
+        return ZIP_STORED
+
+    mimetype, encoding = guess_type(filepath)
+    if encoding is not None:
+        return ZIP_STORED
+
+    if mimetype is not None and mimetype.startswith(COMPRESSED_TYPES):
+        return ZIP_STORED
+
+    with open(filepath, 'rb') as f:
+        sample = f.read(sample_size)
+
+    if not sample:
+        return ZIP_STORED
+
+    ratio = len(zlib.compress(sample, 1)) / float(len(sample))
+    if ratio > threshold:
+        return ZIP_STORED
+
+    return ZIP_DEFLATED
+
+
+def deflate_file(args):
+    """Compress file to a temporary file. Runs in worker processes.
+
+    :param args: (path to file, folder for temporary file, compression level)
+    :type args: ``tuple``
+    :rtype: ``tuple`` with (temporary file, crc, size, compressed size)
+    """
+
+    filepath, tmpdir, level = args
+
+    fd, tmpfile = tempfile.mkstemp(dir=tmpdir)
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    crc = 0
+    size = 0
+
+    with open(filepath, 'rb') as src, os.fdopen(fd, 'wb') as dst:
+        for block in iter(lambda: src.read(BLOCKSIZE), ''):
+            size += len(block)
+            crc = zlib.crc32(block, crc)
+            dst.write(compressor.compress(block))
+
+        dst.write(compressor.flush())
+        compress_size = dst.tell()
+
+    return tmpfile, crc & 0xffffffff, size, compress_size
+
+
+def _imap_window(pool, func, items, window):
+    """Like :func:`multiprocessing.pool.Pool.imap`, but with at most
+    `window` items handed to the pool ahead of the result being used, so
+    finished results don't pile up faster than they're consumed.
+
+    :param pool: pool of workers
+    :param func: function taking one item as argument
+    :param items: items to process
+    :param window: number of items in progress at a time
+    :type pool: :class:`multiprocessing.pool.Pool`
+    :type func: ``func``
+    :type items: ``list``
+    :type window: ``int``
+    """
+
+    items = iter(items)
+    pending = deque(pool.apply_async(func, (item,))
+                    for item in islice(items, max(window, 1)))
+
+    while pending:
+        # A timeout on get() keeps the main thread interruptible by Ctrl-C
+        result = pending.popleft().get(2 ** 31)
+
+        for item in islice(items, 1):
+            pending.append(pool.apply_async(func, (item,)))
+
+        yield result
+
+
+def write_zip(filepaths, zip_filename, workers=None, level=6):
+    """Write a zip archive of `filepaths`. Every file is either deflated
+    or stored depending on :func:`choose_method`. Files are deflated in
+    parallel by a pool of worker processes to temporary files and the
+    archive is assembled in order as they finish. Only `AHEAD` files per
+    worker are deflated ahead of the archive, to bound the temporary files
+    on disk. Stored files are copied before their crc is known, so the
+    local header is written again once they're in place.
+
+    :param filepaths: files and folders to add in archive order
+    :param zip_filename: path of archive to write
+    :param workers: number of worker processes, defaults to number of cpus
+    :param level: zlib compression level
+    :type filepaths: ``list``
+    :type zip_filename: ``str``
+    :type workers: ``int``
+    :type level: ``int``
+    :raises: :class:`FMFileError` if archive would need zip64 extensions
+    """
+
+    workers = workers or cpu_count()
+
+    entries = [ZipEntry(filepath) for filepath in filepaths]
+    for entry in entries:
+        entry.method = choose_method(entry.filepath)
+
+    tmpdir = tempfile.mkdtemp(
+        dir=os.path.dirname(os.path.abspath(zip_filename))
+        )
+
+    deflated = [(entry.filepath, tmpdir, level)
+                for entry in entries if entry.method == ZIP_DEFLATED]
+
+    pool = None
+    if workers > 1 and len(deflated) > 1:
+        pool = Pool(min(workers, len(deflated)))
+        results = _imap_window(pool, deflate_file, deflated, workers * AHEAD)
+
+    else:
+        results = (deflate_file(args) for args in deflated)
+
+    complete = False
+    try:
+        with open(zip_filename, 'wb') as f:
+            for entry in entries:
+                entry.offset = f.tell()
+
+                if entry.method == ZIP_DEFLATED:
+                    tmpfile, entry.crc, size, entry.compress_size = \
+                        next(results)
+
+                    f.write(entry.local_header())
+                    with open(tmpfile, 'rb') as data:
+                        shutil.copyfileobj(data, f, BLOCKSIZE)
+
+                    os.remove(tmpfile)
+
+                elif not entry.is_dir:
+                    f.write(entry.local_header())
+
+                    crc = 0
+                    size = 0
+                    with open(entry.filepath, 'rb') as data:
+                        for block in iter(lambda: data.read(BLOCKSIZE), ''):
+                            size += len(block)
+                            crc = zlib.crc32(block, crc)
+                            f.write(block)
+
+                    entry.crc = crc & 0xffffffff
+                    entry.compress_size = size
+
+                    end = f.tell()
+                    f.seek(entry.offset)
+                    f.write(entry.local_header())
+                    f.seek(end)
+
+                else:
+                    size = 0
+                    f.write(entry.local_header())
+
+                if size != entry.size:
+                    msg = 'File changed while writing archive: "{path}"'
+                    raise FMFileError(msg.format(path=entry.filepath))
+
+                check_limits(entries, f.tell())
+
+            offset = f.tell()
+            central = ''.join(entry.central_header() for entry in entries)
+            f.write(central)
+            f.write(end_record(entries, offset, len(central)))
+            check_limits(entries, f.tell())
+
+        complete = True
+
+    finally:
+        # Don't leave a broken archive behind
+        if not complete and os.path.exists(zip_filename):
+            os.remove(zip_filename)
+
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+class ZipStream(object):
+    """Read only file like object producing an uncompressed zip archive of
+    the given files and folders while it's being read. Nothing is written
+    to disk. Size of the archive is known up front so it can be posted as
+    a regular multipart upload. The crc of every file is calculated just
+    before it's added, so its local header is complete and no data
+    descriptor is needed, and the file is checked against it as it's read.
+    The md5 checksum is calculated in the same pass as the data is read.
+
+    :param filepaths: files and folders to add in archive order
+    :param blocksize: number of bytes read from disk at a time
+    :type filepaths: ``list``
+    :type blocksize: ``int``
+    :raises: :class:`FMFileError` if archive would need zip64 extensions
+    """
+
+    def __init__(self, filepaths, blocksize=BLOCKSIZE):
+        self.entries = [ZipEntry(filepath) for filepath in filepaths]
+        self.blocksize = blocksize
+        self.size = (sum(entry.archive_size for entry in self.entries) +
+                     END_RECORD.size)
+
+        check_limits(self.entries, self.size)
+
+        self.rewind()
+
+    def rewind(self):
+        """Start the archive over from the first byte, e.g. to upload it
+        again after a failed attempt. Files are read again as it's read.
+        """
+
+        self.remaining = self.size
+        self.md5hash = md5()
+
+        self._data = self._generate()
+        self._buffer = ''
+        self._pos = 0
+
+    @property
+    def checksum(self):
+        """Base64 encoded md5 checksum of archive.
+
+        :rtype: ``str`` or ``None`` if archive is not completely read yet
+        """
+
+        if self.remaining:
+            return None
+
+        return self.md5hash.digest().encode('base64')[:-1]
+
+    def _generate(self):
+        """Yield archive data in blocks."""
+
+        offset = 0
+        for entry in self.entries:
+            if not entry.is_dir:
+                entry.crc = file_crc(entry.filepath, self.blocksize)[0]
+
+            entry.offset = offset
+            header = entry.local_header()
+            yield header
+
+            size = 0
+            crc = 0
+            if not entry.is_dir:
+                with open(entry.filepath, 'rb') as f:
+                    for block in iter(lambda: f.read(self.blocksize), ''):
+                        size += len(block)
+                        crc = zlib.crc32(block, crc)
+                        yield block
+
+            if size != entry.size or crc & 0xffffffff != entry.crc:
+                msg = 'File changed while streaming archive: "{path}"'
+                raise FMFileError(msg.format(path=entry.filepath))
+
+            offset += len(header) + entry.compress_size
+
+        central = ''.join(entry.central_header() for entry in self.entries)
+        yield central
+        yield end_record(self.entries, offset, len(central))
+
+    def __len__(self):
+        return self.remaining
+
+    def read(self, size=-1):
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+
+        pieces = []
+        wanted = size
+        while wanted > 0:
+            if self._pos >= len(self._buffer):
+                try:
+                    self._buffer = next(self._data)
+                    self._pos = 0
+
+                except StopIteration:
+                    break
+
+                continue
+
+            piece = self._buffer[self._pos:self._pos + wanted]
+            self._pos += len(piece)
+            wanted -= len(piece)
+            pieces.append(piece)
+
+        data = ''.join(pieces)
+        self.remaining -= len(data)
+        self.md5hash.update(data)
+
+        return data
+
+
+def find_central_directory(tail):
+    """Locate central directory from the end record in the last bytes of
+    an archive.
+
+    :param tail: last bytes of archive, see ``END_RECORD_MAX_SIZE``
+    :type tail: ``str``
+    :rtype: ``tuple`` with (offset, size) of central directory or ``None``
+    """
+
+    index = tail.rfind(struct.pack('<I', END_RECORD_SIGNATURE))
+    if index < 0 or len(tail) - index < END_RECORD.size:
+        return None
+
+    fields = END_RECORD.unpack(tail[index:index + END_RECORD.size])
+
+    return fields[6], fields[5]
+
+
+def read_central_directory(central):
+    """Uncompressed sizes of entries listed in a central directory.
+
+    :param central: central directory
+    :type central: ``str``
+    :rtype: ``dict`` with arcname: size
+    """
+
+    sizes = {}
+    pos = 0
+
+    while central[pos:pos + 4] == struct.pack('<I', CENTRAL_HEADER_SIGNATURE):
+        fields = CENTRAL_HEADER.unpack(central[pos:pos + CENTRAL_HEADER.size])
+        name_len, extra_len, comment_len = fields[10:13]
+
+        start = pos + CENTRAL_HEADER.size
+        sizes[central[start:start + name_len]] = fields[9]
+        pos = start + name_len + extra_len + comment_len
+
+    return sizes
+
+
+def entry_name(rawname, flags, extra=''):
+    """Decode name of an entry. Names are utf-8 when flagged as such or
+    when an Info-ZIP unicode path extra field matches them, cp437
+    otherwise.
+
+    :param rawname: name as stored in archive
+    :param flags: general purpose flags of entry
+    :param extra: extra field of entry
+    :type rawname: ``str``
+    :type flags: ``int``
+    :type extra: ``str``
+    :rtype: ``unicode``
+    """
+
+    if flags & FLAG_UTF8:
+        return rawname.decode('utf-8')
+
+    pos = 0
+    while pos + 4 <= len(extra):
+        header_id, size = struct.unpack('<HH', extra[pos:pos + 4])
+        data = extra[pos + 4:pos + 4 + size]
+        pos += 4 + size
+
+        if header_id != UNICODE_PATH_EXTRA or len(data) < 5:
+            continue
+
+        version, crc = struct.unpack('<BI', data[:5])
+        if version == 1 and crc == zlib.crc32(rawname) & 0xffffffff:
+            return data[5:].decode('utf-8')
+
+    return rawname.decode('cp437')
+
+
+def safe_path(destination, arcname):
+    """Path to extract `arcname` to inside `destination`.
+
+    :param destination: folder to extract to
+    :param arcname: name of entry in archive
+    :type destination: ``str``, ``unicode``
+    :type arcname: ``unicode``
+    :rtype: ``unicode``
+    :raises: :class:`FMFileError` if `arcname` points outside `destination`
+    """
+
+    parts = [part for part in arcname.replace('\\', '/').split('/')
+             if part not in ('', '.')]
+
+    if (not parts or '..' in parts or arcname.startswith('/') or
+            os.path.splitdrive(arcname)[0]):
+        msg = 'Refusing to extract "{arcname}" outside destination'
+        raise FMFileError(msg.format(arcname=arcname.encode('utf-8')))
+
+    return os.path.join(destination, *parts)
+
+
+class StreamReader(object):
+    """Reads exact amounts from a file like object that may return less
+    than asked for, and takes back bytes read too far.
+
+    :param file_obj: object with ``read()``
+    :param blocksize: bytes read at a time
+    :type file_obj: ``file``
+    :type blocksize: ``int``
+    """
+
+    def __init__(self, file_obj, blocksize=BLOCKSIZE):
+        self.file_obj = file_obj
+        self.blocksize = blocksize
+        self.position = 0
+
+        self._buffer = ''
+
+    def read_block(self, limit=None):
+        """Read up to `blocksize` bytes, or `limit` if smaller.
+
+        :rtype: ``str`` empty at end of stream
+        """
+
+        size = min(self.blocksize, limit or self.blocksize)
+
+        if self._buffer:
+            data = self._buffer[:size]
+            self._buffer = self._buffer[size:]
+
+        else:
+            data = self.file_obj.read(size)
+
+        self.position += len(data)
+
+        return data
+
+    def read(self, size):
+        """Read exactly `size` bytes.
+
+        :raises: :class:`FMFileError` if stream ends first
+        """
+
+        pieces = []
+        wanted = size
+
+        while wanted > 0:
+            data = self.read_block(wanted)
+            if not data:
+                msg = 'Archive ended at {position} bytes'
+                raise FMFileError(msg.format(position=self.position))
+
+            pieces.append(data)
+            wanted -= len(data)
+
+        return ''.join(pieces)
+
+    def unread(self, data):
+        """Put `data` back in front of stream."""
+
+        self._buffer = data + self._buffer
+        self.position -= len(data)
+
+
+def _copy_deflated(reader, compress_size, write):
+    """Inflate entry data. Without a known `compress_size` the end is
+    found by zlib, and bytes read past it are put back.
+    """
+
+    decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+    remaining = compress_size
+
+    while remaining is None or remaining > 0:
+        block = reader.read_block(remaining)
+        if not block:
+            raise FMFileError('Archive ended inside compressed data')
+
+        if remaining is not None:
+            remaining -= len(block)
+
+        write(decompressor.decompress(block))
+
+        if decompressor.unused_data:
+            reader.unread(decompressor.unused_data)
+            break
+
+    write(decompressor.flush())
+
+
+def _copy_stored(reader, compress_size, write):
+    """Copy entry data of known size."""
+
+    remaining = compress_size
+
+    while remaining > 0:
+        block = reader.read_block(remaining)
+        if not block:
+            raise FMFileError('Archive ended inside stored data')
+
+        remaining -= len(block)
+        write(block)
+
+
+def _scan_stored(reader, write):
+    """Copy stored entry data of unknown size. The end is found by
+    scanning for a data descriptor whose crc and sizes match the data
+    before it.
+    """
+
+    signature = struct.pack('<I', DATA_DESCRIPTOR_SIGNATURE)
+    crc = 0
+    count = 0
+    pending = ''
+
+    while True:
+        block = reader.read_block()
+        if not block:
+            raise FMFileError('Archive ended inside stored data')
+
+        pending += block
+        keep = max(len(pending) - len(signature) + 1, 0)
+
+        index = pending.find(signature)
+        while index >= 0:
+            if len(pending) - index < DATA_DESCRIPTOR.size:
+                # Descriptor may continue in next block
+                keep = min(keep, index)
+                break
+
+            fields = DATA_DESCRIPTOR.unpack(
+                pending[index:index + DATA_DESCRIPTOR.size]
+                )
+            candidate = zlib.crc32(pending[:index], crc) & 0xffffffff
+
+            if (fields[1] == candidate and
+                    fields[2] == fields[3] == count + index):
+                write(pending[:index])
+                reader.unread(pending[index:])
+                return
+
+            index = pending.find(signature, index + 1)
+
+        write(pending[:keep])
+        crc = zlib.crc32(pending[:keep], crc)
+        count += keep
+        pending = pending[keep:]
+
+
+def extract_zip(file_obj,
+                destination,
+                progress=None,
+                sizes=None,
+                blocksize=BLOCKSIZE):
+    """Extract a zip archive to `destination` while it's read from
+    `file_obj`, so the archive never has to be stored. Entries are read
+    from their local headers in order and the central directory at the end
+    is ignored. Entries whose sizes are only written in a data descriptor
+    after the data are supported: deflated data ends where the deflate
+    stream ends, stored data where a matching data descriptor is found.
+    Every entry is checked against its crc.
+
+    :param file_obj: archive, object with ``read()``
+    :param destination: folder to extract to
+    :param progress: receives bytes written per entry
+    :param sizes: uncompressed sizes by arcname, e.g. from
+     :func:`read_central_directory`, for entries that don't have them in
+     their local header
+    :param blocksize: bytes read at a time
+    :type file_obj: ``file``
+    :type destination: ``str``, ``unicode``
+    :type progress: :class:`pyfilemail.progress.Progress`
+    :type sizes: ``dict``
+    :type blocksize: ``int``
+    :rtype: ``list`` of extracted paths
+    :raises: :class:`FMFileError` on broken or unsupported archives
+    """
+
+    reader = StreamReader(file_obj, blocksize)
+    sizes = sizes or {}
+    extracted = []
+
+    while True:
+        head = reader.read_block(4)
+        if not head:
+            raise FMFileError('Archive ended before its central directory')
+
+        head += reader.read(4 - len(head))
+        signature, = struct.unpack('<I', head)
+
+        if signature in TRAILING_SIGNATURES:
+            return extracted
+
+        if signature != LOCAL_HEADER_SIGNATURE:
+            msg = 'Unexpected data at {position} bytes in archive'
+            raise FMFileError(msg.format(position=reader.position - 4))
+
+        fields = LOCAL_HEADER.unpack(head + reader.read(LOCAL_HEADER.size - 4))
+        (flags, method, crc, compress_size, size, name_len,
+         extra_len) = (fields[2], fields[3]) + fields[6:]
+
+        rawname = reader.read(name_len)
+        arcname = entry_name(rawname, flags, reader.read(extra_len))
+
+        if flags & FLAG_ENCRYPTED:
+            msg = 'Encrypted entry "{arcname}" is not supported'
+            raise FMFileError(msg.format(arcname=rawname))
+
+        if method not in (ZIP_STORED, ZIP_DEFLATED):
+            msg = 'Compression method {method} of "{arcname}" not supported'
+            raise FMFileError(msg.format(method=method, arcname=rawname))
+
+        if ZIP_LIMIT in (compress_size, size):
+            msg = 'Zip64 entry "{arcname}" not supported'
+            raise FMFileError(msg.format(arcname=rawname))
+
+        described = bool(flags & FLAG_DATA_DESCRIPTOR)
+        if described:
+            compress_size = None
+            size = sizes.get(rawname)
+
+        path = safe_path(destination, arcname)
+        is_dir = arcname.endswith('/')
+
+        if progress is not None:
+            progress.add_file(path, arcname, size)
+
+        folder = is_dir and path or os.path.dirname(path)
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+
+        state = {'crc': 0, 'size': 0}
+        out = not is_dir and open(path, 'wb') or None
+
+        def write(data):
+            if not data:
+                return
+
+            if out is None:
+                raise FMFileError('Folder "{0}" has data'.format(rawname))
+
+            out.write(data)
+            state['crc'] = zlib.crc32(data, state['crc'])
+            state['size'] += len(data)
+
+            if progress is not None:
+                progress.update(path, state['size'])
+
+        try:
+            if method == ZIP_DEFLATED:
+                _copy_deflated(reader, compress_size, write)
+
+            elif not described:
+                _copy_stored(reader, compress_size, write)
+
+            elif not is_dir:
+                _scan_stored(reader, write)
+
+            if described:
+                descriptor = reader.read(4)
+                if descriptor == struct.pack('<I', DATA_DESCRIPTOR_SIGNATURE):
+                    descriptor = reader.read(4)
+
+                crc, compress_size, size = struct.unpack(
+                    '<III', descriptor + reader.read(8)
+                    )
+
+            if (state['crc'] & 0xffffffff) != crc or state['size'] != size:
+                msg = 'Checksum of "{arcname}" in archive doesn\'t match'
+                raise FMFileError(msg.format(arcname=rawname))
+
+        except:
+            if out is not None:
+                out.close()
+                os.remove(path)
+
+            raise
+
+        if out is not None:
+            out.close()
+
+        if progress is not None:
+            progress.finish(path)
+
+        extracted.append(path)
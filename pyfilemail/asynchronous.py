@@ -0,0 +1,259 @@
+import threading
+from multiprocessing.pool import ThreadPool
+
+import transport
+from urls import base_url
+from users import User
+from transfer import Transfer
+
+# Number of API calls that may run at the same time
+POOL_SIZE = 16
+
+# Number of uploads and downloads that may run at the same time. They get
+# their own pool so long transfers don't hold up short API calls
+TRANSFER_POOL_SIZE = 4
+
+_pools = {}
+_pool_lock = threading.Lock()
+
+
+def _pool_size(transfers):
+    return transfers and TRANSFER_POOL_SIZE or POOL_SIZE
+
+
+def get_pool(transfers=False):
+    """Shared pool of threads running asynchronous calls.
+
+    :param transfers: get pool running uploads and downloads instead of
+     API calls
+    :type transfers: ``bool``
+    :rtype: :class:`multiprocessing.pool.ThreadPool`
+    """
+
+    with _pool_lock:
+        if transfers not in _pools:
+            _pools[transfers] = ThreadPool(_pool_size(transfers))
+
+        return _pools[transfers]
+
+
+def set_pool_size(size=None, transfers=None):
+    """Change number of API calls and/or transfers that may run at the
+    same time. Calls already submitted finish in the old pool.
+
+    :param size: number of threads for API calls
+    :param transfers: number of threads for uploads and downloads
+    :type size: ``int``
+    :type transfers: ``int``
+    """
+
+    global POOL_SIZE, TRANSFER_POOL_SIZE
+
+    with _pool_lock:
+        if size is not None:
+            POOL_SIZE = size
+
+        if transfers is not None:
+            TRANSFER_POOL_SIZE = transfers
+
+        for key, changed in ((False, size), (True, transfers)):
+            if changed is not None and key in _pools:
+                _pools.pop(key).close()
+
+
+def submit(func, *args, **kwargs):
+    """Run `func` in the shared pool for API calls.
+    Pass `callback` as keyword argument to have it called with the result.
+
+    :rtype: :class:`multiprocessing.pool.AsyncResult`. Call ``get()`` on
+     it to wait for the result. Errors raised by `func` are raised
+     from ``get()``
+    """
+
+    callback = kwargs.pop('callback', None)
+
+    return get_pool().apply_async(func, args, kwargs, callback)
+
+
+def submit_transfer(func, *args, **kwargs):
+    """Run `func` in the shared pool for uploads and downloads. Same as
+    :func:`submit` otherwise.
+
+    :rtype: :class:`multiprocessing.pool.AsyncResult`
+    """
+
+    callback = kwargs.pop('callback', None)
+
+    return get_pool(transfers=True).apply_async(func, args, kwargs, callback)
+
+
+class AsyncWrapper(object):
+    """Runs methods of the wrapped object in the shared pool. Properties,
+    which may call Filemail too, are read in the pool as well. Attributes
+    set on the wrapped object are read from it directly.
+
+    Python 2 has no event loop to build on, so every call in flight holds
+    a thread of a pool. Methods named in `transfer_methods` run in a pool
+    of :data:`TRANSFER_POOL_SIZE` threads, everything else in a pool of
+    :data:`POOL_SIZE` threads. Calls beyond that wait for a free thread,
+    see :func:`set_pool_size`.
+    """
+
+    # Class of wrapped object, telling methods and properties apart
+    wrapped_class = object
+
+    # Methods uploading or downloading files, run in the transfer pool
+    transfer_methods = ()
+
+    def __init__(self, wrapped):
+        self._wrapped = wrapped
+
+    @property
+    def wrapped(self):
+        """:rtype: wrapped object"""
+
+        return self._wrapped
+
+    def _call(self, name, *args, **kwargs):
+        return getattr(self.wrapped, name)(*args, **kwargs)
+
+    def _get(self, name):
+        return getattr(self.wrapped, name)
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+
+        member = getattr(self.wrapped_class, name, None)
+        if isinstance(member, property):
+            return submit(self._get, name)
+
+        if callable(member):
+            if name in self.transfer_methods:
+                run = submit_transfer
+
+            else:
+                run = submit
+
+            def call(*args, **kwargs):
+                return run(self._call, name, *args, **kwargs)
+
+            return call
+
+        return getattr(self.wrapped, name)
+
+
+class AsyncUser(AsyncWrapper):
+    """Asynchronous version of :class:`pyfilemail.User`.
+    Every method and property of :class:`pyfilemail.User` is available and
+    returns a :class:`multiprocessing.pool.AsyncResult` right away, so many
+    calls can run at the same time from a single thread.
+
+    The user is created, and logged in if a password is passed or found in
+    .netrc, in the pool as well. Calls wait for that to finish and errors
+    from logging in are raised from their ``get()``.
+
+    :param username: your email/username
+    :param password: filemail password if registered username is used
+    :type username: str
+    :type password: str
+
+    ::
+
+        user = AsyncUser('me@example.com', 'password')
+
+        sent = user.get_sent()
+        received = user.get_received(age=7)
+
+        for transfer in sent.get() + received.get():
+            transfer.download(destination='/tmp')
+    """
+
+    wrapped_class = User
+
+    transfer_methods = ('download_received', 'prefetch_files')
+
+    def __init__(self, username, password=None):
+        super(AsyncUser, self).__init__(submit(User, username, password))
+
+        # Allow as many connections to Filemail as there are threads
+        transport.ensure_pool_size(base_url,
+                                   POOL_SIZE + TRANSFER_POOL_SIZE)
+
+    @property
+    def wrapped(self):
+        """:rtype: :class:`pyfilemail.User`, once created"""
+
+        return self._wrapped.get()
+
+    @property
+    def user(self):
+        """Wrapped user. Waits for it to be created.
+
+        :rtype: :class:`pyfilemail.User`
+        """
+
+        return self.wrapped
+
+    def _restore(self, method, *args, **kwargs):
+        transfers = getattr(self.wrapped, method)(*args, **kwargs)
+
+        return [AsyncTransfer(transfer) for transfer in transfers]
+
+    def get_sent(self, *args, **kwargs):
+        """See :func:`pyfilemail.User.get_sent`
+
+        :rtype: :class:`multiprocessing.pool.AsyncResult` with ``list`` of
+         :class:`AsyncTransfer`
+        """
+
+        return submit(self._restore, 'get_sent', *args, **kwargs)
+
+    def get_received(self, *args, **kwargs):
+        """See :func:`pyfilemail.User.get_received`
+
+        :rtype: :class:`multiprocessing.pool.AsyncResult` with ``list`` of
+         :class:`AsyncTransfer`
+        """
+
+        return submit(self._restore, 'get_received', *args, **kwargs)
+
+    def transfer(self, *args, **kwargs):
+        """Create and initialize a new transfer. Takes the same arguments as
+        :class:`pyfilemail.Transfer` except for `fm_user`.
+
+        :rtype: :class:`multiprocessing.pool.AsyncResult` with
+         :class:`AsyncTransfer`
+        """
+
+        def initialize():
+            return AsyncTransfer(Transfer(self.wrapped, *args, **kwargs))
+
+        return submit(initialize)
+
+
+class AsyncTransfer(AsyncWrapper):
+    """Asynchronous version of :class:`pyfilemail.Transfer`.
+    Every method and property of :class:`pyfilemail.Transfer` is available
+    and returns a :class:`multiprocessing.pool.AsyncResult` right away.
+    Create new transfers with :func:`AsyncUser.transfer`.
+
+    :param transfer: transfer to wrap
+    :type transfer: :class:`pyfilemail.Transfer`
+    """
+
+    wrapped_class = Transfer
+
+    transfer_methods = ('add_files', 'send', 'download', 'extract')
+
+    @property
+    def transfer(self):
+        """:rtype: :class:`pyfilemail.Transfer` that is wrapped"""
+
+        return self.wrapped
+
+    def __getitem__(self, key):
+        return self.wrapped[key]
+
+    def __repr__(self):
+        return repr(self.wrapped)
@@ -0,0 +1,510 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import threading
+from hashlib import md5
+
+import pyfilemail as pm
+from pyfilemail import logger
+from transfer import Transfer
+from errors import FMBaseError
+
+# Caches are kept in the users data location, one database per user
+cachedir = os.path.join(pm.datadir, 'cache')
+
+# Bump when the tables change. Older caches are dropped and rebuilt
+SCHEMA_VERSION = 1
+
+# Seconds subtracted from time of last refresh when asking Filemail for new
+# transfers. Covers clock differences and transfers sent during a refresh
+OVERLAP = 15 * 60
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS transfers (
+    kind TEXT NOT NULL,
+    transferid TEXT NOT NULL,
+    sender TEXT,
+    subject TEXT,
+    status TEXT,
+    sentdate REAL,
+    data TEXT NOT NULL,
+    files_loaded INTEGER NOT NULL DEFAULT 0,
+    updated REAL NOT NULL,
+    PRIMARY KEY (kind, transferid)
+);
+CREATE INDEX IF NOT EXISTS transfers_sentdate ON transfers (kind, sentdate);
+CREATE INDEX IF NOT EXISTS transfers_status ON transfers (kind, status);
+
+CREATE TABLE IF NOT EXISTS recipients (
+    kind TEXT NOT NULL,
+    transferid TEXT NOT NULL,
+    email TEXT NOT NULL,
+    PRIMARY KEY (kind, transferid, email)
+);
+CREATE INDEX IF NOT EXISTS recipients_email ON recipients (email);
+
+CREATE TABLE IF NOT EXISTS files (
+    kind TEXT NOT NULL,
+    transferid TEXT NOT NULL,
+    fileid TEXT NOT NULL,
+    filename TEXT,
+    filesize INTEGER,
+    md5 TEXT,
+    data TEXT NOT NULL,
+    PRIMARY KEY (kind, transferid, fileid)
+);
+CREATE INDEX IF NOT EXISTS files_filename ON files (filename);
+
+CREATE TABLE IF NOT EXISTS refreshed (
+    kind TEXT NOT NULL,
+    for_all INTEGER NOT NULL,
+    time REAL NOT NULL,
+    PRIMARY KEY (kind, for_all)
+);
+"""
+
+TABLES = ('transfers', 'recipients', 'files', 'refreshed')
+
+KINDS = ('sent', 'received')
+
+
+def _timestamp(value):
+    """Convert a date from Filemail to a unix timestamp. Accepts seconds or
+    milliseconds as numbers or strings and .NET style "/Date(ms)/" strings.
+
+    :rtype: ``float`` or ``None`` if `value` isn't understood
+    """
+
+    if isinstance(value, basestring):
+        match = re.search(r'-?\d+(\.\d+)?', value)
+        if match is None:
+            return None
+
+        value = match.group()
+
+    try:
+        value = float(value)
+
+    except (TypeError, ValueError):
+        return None
+
+    # Anything later than year 5138 in seconds is milliseconds
+    if value > 10 ** 11:
+        value /= 1000.0
+
+    return value
+
+
+def _recipients(transfer_info):
+    """:rtype: ``set`` of lower case recipient emails of a transfer"""
+
+    emails = set()
+
+    for key in ('to', 'recipients'):
+        value = transfer_info.get(key)
+        if not value:
+            continue
+
+        if isinstance(value, basestring):
+            value = value.split(',')
+
+        for recipient in value:
+            if isinstance(recipient, dict):
+                recipient = recipient.get('email')
+
+            if recipient and recipient.strip():
+                emails.add(recipient.strip().lower())
+
+    return emails
+
+
+class TransferCache(object):
+    """Local SQLite copy of the metadata of sent and received transfers
+    and their files. Listings are fetched from Filemail by
+    :func:`TransferCache.refresh`, after which :func:`TransferCache.query`
+    answers from the indexed database without any API calls.
+
+    Received transfers are refreshed incrementally, asking only for
+    transfers received since the last refresh. Changes to transfers
+    already in the cache, e.g. their status, are picked up with
+    ``full=True`` or after :func:`TransferCache.invalidate`. Sent transfers
+    can't be listed by date, so they're always refreshed in full.
+
+    :param user: logged in user
+    :param path: database file, defaults to one per user in the users data
+     location
+    :type user: :class:`pyfilemail.User`
+    :type path: ``str`` or ``unicode``
+
+    ::
+
+        cache = TransferCache(user)
+        cache.refresh('received', files=True)
+        transfers = cache.query('received', filename='*.mov')
+    """
+
+    def __init__(self, user, path=None):
+        self.user = user
+
+        if path is None:
+            name = md5(user.username.encode('utf-8')).hexdigest()
+            path = os.path.join(cachedir, name + '.sqlite')
+
+        self.path = path
+
+        folder = os.path.dirname(os.path.abspath(path))
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+
+        self._setup()
+
+    def _setup(self):
+        """Create tables, dropping those of an older schema."""
+
+        with self._lock, self._db:
+            version = self._db.execute('PRAGMA user_version').fetchone()[0]
+
+            if version != SCHEMA_VERSION:
+                for table in TABLES:
+                    self._db.execute('DROP TABLE IF EXISTS ' + table)
+
+            self._db.executescript(SCHEMA)
+            self._db.execute('PRAGMA user_version = %d' % SCHEMA_VERSION)
+
+    def close(self):
+        """Close database."""
+
+        self._db.close()
+
+    def refresh(self, kind='received', for_all=True, full=False,
+                files=False, workers=8):
+        """Fetch new transfers from Filemail into the cache.
+
+        :param kind: "sent" or "received"
+        :param for_all: include transfers of all users in the same business
+        :param full: list all transfers instead of those since the last
+         refresh
+        :param files: also fetch files of transfers that aren't cached with
+         their files, see :func:`pyfilemail.User.prefetch_files`
+        :param workers: number of requests at the same time when fetching
+         files
+        :type kind: ``str``
+        :type for_all: ``bool``
+        :type full: ``bool``
+        :type files: ``bool``
+        :type workers: ``int``
+        :rtype: ``list`` of :class:`pyfilemail.Transfer` fetched
+        """
+
+        self._check_kind(kind)
+
+        started = time.time()
+
+        if kind == 'sent':
+            # Expired transfers too so transfers missing are deleted ones
+            transfers = self.user.get_sent(expired=True, for_all=for_all)
+            full = True
+
+        else:
+            since = None if full else self._refreshed(kind, for_all)
+            if since is not None:
+                since -= OVERLAP
+
+            transfers = self.user.get_received(since=since, for_all=for_all)
+
+        if files:
+            loaded = self._files_loaded(kind)
+            missing = [transfer for transfer in transfers
+                       if transfer.transfer_id not in loaded]
+            self.user.prefetch_files(missing, workers)
+
+        with self._lock, self._db:
+            if full:
+                self._prune(kind, [t.transfer_id for t in transfers])
+
+                # Transfers of others may have been pruned with for_all off
+                self._db.execute('DELETE FROM refreshed WHERE kind = ?',
+                                 (kind,))
+
+            for transfer in transfers:
+                self._store(kind, transfer)
+
+            self._db.execute(
+                'INSERT OR REPLACE INTO refreshed VALUES (?, ?, ?)',
+                (kind, int(for_all), started)
+                )
+
+        msg = 'Cached {count} {kind} transfers'
+        logger.debug(msg.format(count=len(transfers), kind=kind))
+
+        return transfers
+
+    def store(self, kind, transfers):
+        """Add or replace transfers in the cache, e.g. after changing them.
+
+        :param kind: "sent" or "received"
+        :param transfers: transfers to store
+        :type kind: ``str``
+        :type transfers: ``list`` of :class:`pyfilemail.Transfer`
+        """
+
+        self._check_kind(kind)
+
+        with self._lock, self._db:
+            for transfer in transfers:
+                self._store(kind, transfer)
+
+    def _store(self, kind, transfer):
+        """Write one transfer. Call with lock held inside a transaction."""
+
+        transferid = transfer.transfer_id
+        info = dict(transfer.transfer_info)
+
+        files = info.pop('files', None)
+        if transfer._files_loaded:
+            files = transfer._files
+
+        self._db.execute(
+            'DELETE FROM recipients WHERE kind = ? AND transferid = ?',
+            (kind, transferid)
+            )
+
+        loaded = self._db.execute(
+            'SELECT files_loaded FROM transfers '
+            'WHERE kind = ? AND transferid = ?',
+            (kind, transferid)
+            ).fetchone()
+
+        self._db.execute(
+            'INSERT OR REPLACE INTO transfers VALUES '
+            '(?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (kind,
+             transferid,
+             (info.get('from') or '').lower() or None,
+             info.get('subject'),
+             info.get('status'),
+             _timestamp(info.get('sentdate')),
+             json.dumps(info),
+             int(files is not None or bool(loaded and loaded[0])),
+             time.time())
+            )
+
+        self._db.executemany(
+            'INSERT INTO recipients VALUES (?, ?, ?)',
+            [(kind, transferid, email) for email in _recipients(info)]
+            )
+
+        # Keep files cached earlier when the listing has none
+        if files is None:
+            return
+
+        self._db.execute(
+            'DELETE FROM files WHERE kind = ? AND transferid = ?',
+            (kind, transferid)
+            )
+
+        self._db.executemany(
+            'INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?)',
+            [(kind,
+              transferid,
+              fmfile.get('fileid'),
+              fmfile.get('filename'),
+              fmfile.get('filesize'),
+              fmfile.get('md5'),
+              json.dumps(fmfile))
+             for fmfile in files]
+            )
+
+    def query(self,
+              kind=None,
+              recipient=None,
+              sender=None,
+              status=None,
+              since=None,
+              until=None,
+              filename=None,
+              limit=None):
+        """Find cached transfers, newest first. Works offline.
+
+        :param kind: "sent", "received" or ``None`` for both
+        :param recipient: email of a recipient, ignoring case
+        :param sender: email of sender, ignoring case
+        :param status: e.g. "STATUS_COMPLETE"
+        :param since: only transfers sent at or after this unix timestamp
+        :param until: only transfers sent before this unix timestamp
+        :param filename: transfers with a file matching this name. May
+         contain the wildcards ``*`` and ``?``
+        :param limit: maximum number of transfers
+        :type kind: ``str``
+        :type recipient: ``str``
+        :type sender: ``str``
+        :type status: ``str``
+        :type since: ``int`` or ``float``
+        :type until: ``int`` or ``float``
+        :type filename: ``str`` or ``unicode``
+        :type limit: ``int``
+        :rtype: ``list`` of :class:`pyfilemail.Transfer`. Files are set on
+         transfers cached with their files
+        """
+
+        where = []
+        params = []
+
+        if kind is not None:
+            self._check_kind(kind)
+            where.append('t.kind = ?')
+            params.append(kind)
+
+        if recipient is not None:
+            where.append('EXISTS (SELECT 1 FROM recipients r '
+                         'WHERE r.kind = t.kind '
+                         'AND r.transferid = t.transferid AND r.email = ?)')
+            params.append(recipient.lower())
+
+        if sender is not None:
+            where.append('t.sender = ?')
+            params.append(sender.lower())
+
+        if status is not None:
+            where.append('t.status = ?')
+            params.append(status)
+
+        if since is not None:
+            where.append('t.sentdate >= ?')
+            params.append(since)
+
+        if until is not None:
+            where.append('t.sentdate < ?')
+            params.append(until)
+
+        if filename is not None:
+            where.append('EXISTS (SELECT 1 FROM files f '
+                         'WHERE f.kind = t.kind '
+                         'AND f.transferid = t.transferid '
+                         'AND f.filename GLOB ?)')
+            params.append(filename)
+
+        sql = 'SELECT t.kind, t.transferid, t.data, t.files_loaded ' \
+              'FROM transfers t'
+
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+
+        sql += ' ORDER BY t.sentdate DESC'
+
+        if limit is not None:
+            sql += ' LIMIT %d' % limit
+
+        with self._lock:
+            rows = self._db.execute(sql, params).fetchall()
+
+            files = {}
+            for kind_, transferid, data, files_loaded in rows:
+                if files_loaded:
+                    files[kind_, transferid] = [
+                        json.loads(fmfile) for fmfile, in self._db.execute(
+                            'SELECT data FROM files '
+                            'WHERE kind = ? AND transferid = ? ORDER BY rowid',
+                            (kind_, transferid)
+                            )
+                        ]
+
+        transfers = []
+        for kind_, transferid, data, files_loaded in rows:
+            transfer = Transfer(self.user, _restore=True, _register=False)
+            transfer.transfer_info.update(json.loads(data))
+
+            if files_loaded:
+                transfer._files = files[kind_, transferid]
+                transfer._files_loaded = True
+
+            transfers.append(transfer)
+
+        return transfers
+
+    def invalidate(self, kind=None, transferid=None):
+        """Drop cached transfers. The next :func:`TransferCache.refresh`
+        of an invalidated kind lists all transfers again.
+
+        :param kind: "sent", "received" or ``None`` for both
+        :param transferid: drop only this transfer
+        :type kind: ``str``
+        :type transferid: ``str``
+        """
+
+        if kind is not None:
+            self._check_kind(kind)
+
+        with self._lock, self._db:
+            self._delete(kind, transferid=transferid)
+
+    def _prune(self, kind, transferids):
+        """Delete transfers of `kind` not in `transferids`, i.e. deleted
+        on Filemail. Call with lock held inside a transaction.
+        """
+
+        keep = set(transferids)
+        cached = self._db.execute(
+            'SELECT transferid FROM transfers WHERE kind = ?', (kind,)
+            ).fetchall()
+
+        for transferid, in cached:
+            if transferid not in keep:
+                self._delete(kind, transferid)
+
+    def _delete(self, kind=None, transferid=None):
+        """Delete transfers and, unless a single transfer is deleted, when
+        they were refreshed. Call with lock held inside a transaction.
+        """
+
+        where = []
+        params = []
+
+        if kind is not None:
+            where.append('kind = ?')
+            params.append(kind)
+
+        if transferid is not None:
+            where.append('transferid = ?')
+            params.append(transferid)
+
+        clause = where and ' WHERE ' + ' AND '.join(where) or ''
+
+        for table in ('transfers', 'recipients', 'files'):
+            self._db.execute('DELETE FROM ' + table + clause, params)
+
+        # A single transfer dropped is listed again on a full refresh
+        if transferid is None:
+            self._db.execute('DELETE FROM refreshed' + clause, params)
+
+    def _refreshed(self, kind, for_all):
+        """:rtype: ``float`` time of last refresh or ``None``"""
+
+        with self._lock:
+            row = self._db.execute(
+                'SELECT time FROM refreshed WHERE kind = ? AND for_all = ?',
+                (kind, int(for_all))
+                ).fetchone()
+
+        return row and row[0] or None
+
+    def _files_loaded(self, kind):
+        """:rtype: ``set`` of transferids cached with their files"""
+
+        with self._lock:
+            rows = self._db.execute(
+                'SELECT transferid FROM transfers '
+                'WHERE kind = ? AND files_loaded = 1',
+                (kind,)
+                ).fetchall()
+
+        return set(row[0] for row in rows)
+
+    def _check_kind(self, kind):
+        if kind not in KINDS:
+            raise FMBaseError('kind must be one of: ' + ', '.join(KINDS))
@@ -0,0 +1,183 @@
+import time
+import threading
+from collections import OrderedDict
+
+from errors import FMBaseError
+
+# Seconds contacts and groups are kept before they're fetched again
+TTL = 300
+
+
+class Directory(object):
+    """Contacts by email and contact groups by name of a user, fetched from
+    Filemail once and kept for `ttl` seconds. Changes made through
+    :class:`pyfilemail.User` are written through to the cache, so it only
+    goes stale when contacts or groups are changed elsewhere. Call
+    :func:`Directory.refresh` to fetch them again right away.
+
+    Lookups return copies, so changing a returned ``dict`` doesn't change
+    the cache until it's saved with e.g. :func:`User.update_contact`.
+
+    :param user: user owning contacts and groups
+    :param ttl: seconds to keep contacts and groups. ``None`` keeps them
+     until refreshed
+    :type user: :class:`pyfilemail.User`
+    :type ttl: ``int``
+    """
+
+    def __init__(self, user, ttl=TTL):
+        self.user = user
+        self.ttl = ttl
+
+        self._contacts = None
+        self._groups = None
+        self._fetched = {'contacts': 0, 'groups': 0}
+
+        self._lock = threading.RLock()
+
+    def refresh(self):
+        """Drop cached contacts and groups. They're fetched again on next
+        use.
+        """
+
+        with self._lock:
+            self._contacts = None
+            self._groups = None
+
+    def _expired(self, kind):
+        if self.ttl is None:
+            return False
+
+        return time.time() - self._fetched[kind] > self.ttl
+
+    def _load_contacts(self):
+        """Call with lock held.
+
+        :rtype: ``OrderedDict`` with contacts by lower case email
+        """
+
+        if self._contacts is None or self._expired('contacts'):
+            self._contacts = OrderedDict(
+                (contact['email'].lower(), contact)
+                for contact in self.user._fetch_contacts()
+                )
+            self._fetched['contacts'] = time.time()
+
+        return self._contacts
+
+    def _load_groups(self):
+        """Call with lock held.
+
+        :rtype: ``OrderedDict`` with groups by name
+        """
+
+        if self._groups is None or self._expired('groups'):
+            self._groups = OrderedDict(
+                (group['contactgroupname'], group)
+                for group in self.user._fetch_groups()
+                )
+            self._fetched['groups'] = time.time()
+
+        return self._groups
+
+    def contacts(self):
+        """:rtype: ``list`` of ``dict`` with contact information"""
+
+        with self._lock:
+            contacts = self._load_contacts().values()
+
+        return [dict(contact) for contact in contacts]
+
+    def contact(self, email):
+        """Look up contact by email, ignoring case.
+
+        :param email: address of contact
+        :type email: ``str``, ``unicode``
+        :rtype: ``dict`` with contact information
+        :raises: :class:`FMBaseError` if there's no such contact
+        """
+
+        with self._lock:
+            contact = self._load_contacts().get(email.lower())
+
+        if contact is None:
+            msg = 'No contact with email: "{email}" found.'
+            raise FMBaseError(msg.format(email=email))
+
+        return dict(contact)
+
+    def groups(self):
+        """:rtype: ``list`` of ``dict`` with group data"""
+
+        with self._lock:
+            groups = self._load_groups().values()
+
+        return [dict(group) for group in groups]
+
+    def group(self, name):
+        """Look up group by name.
+
+        :param name: name of group
+        :type name: ``str``, ``unicode``
+        :rtype: ``dict`` with group data
+        :raises: :class:`FMBaseError` if there's no such group
+        """
+
+        with self._lock:
+            group = self._load_groups().get(name)
+
+        if group is None:
+            msg = 'No group named: "{name}" found.'
+            raise FMBaseError(msg.format(name=name))
+
+        return dict(group)
+
+    def put_contact(self, contact):
+        """Add or replace contact, matched by contactid."""
+
+        with self._lock:
+            if self._contacts is None:
+                return
+
+            self.remove_contact(contact)
+            self._contacts[contact['email'].lower()] = dict(contact)
+
+    def remove_contact(self, contact):
+        """Remove contact, matched by contactid."""
+
+        with self._lock:
+            if self._contacts is None:
+                return
+
+            for email, cached in self._contacts.items():
+                if cached.get('contactid') == contact.get('contactid'):
+                    del self._contacts[email]
+
+    def put_groups(self, groups):
+        """Add or replace groups, matched by contactgroupid.
+
+        :param groups: group data
+        :type groups: ``dict`` or ``list`` of ``dict``
+        """
+
+        if isinstance(groups, dict):
+            groups = [groups]
+
+        with self._lock:
+            if self._groups is None:
+                return
+
+            for group in groups:
+                self.remove_group(group)
+                self._groups[group['contactgroupname']] = dict(group)
+
+    def remove_group(self, group):
+        """Remove group, matched by contactgroupid."""
+
+        with self._lock:
+            if self._groups is None:
+                return
+
+            for name, cached in self._groups.items():
+                if cached.get('contactgroupid') == group.get('contactgroupid'):
+                    del self._groups[name]
@@ -2,6 +2,28 @@ import requests
 
 
 class FileMailBaseError(Exception):
+    """Error reported by Filemail. Every error code has a subclass named
+    after it, e.g. :class:`AllFileserversBusy`, raised by
+    :func:`hellraiser`.
+
+    :param message: error message from Filemail
+    :param http_status: status code of response carrying the error
+    :type message: ``str`` or ``unicode``
+    :type http_status: ``int``
+    """
+
+    # Filemail error code
+    status = None
+
+    # Whether the same call may succeed if tried again later
+    transient = False
+
+    def __init__(self, message=None, http_status=None):
+        super(FileMailBaseError, self).__init__(message)
+
+        self.message = message
+        self.http_status = http_status
+
     def __str__(self):
         return self.message
 
@@ -18,63 +40,116 @@ class FMFileError(FMBaseError):
     pass
 
 
+class ChecksumMismatch(FMFileError):
+    pass
+
+
+class UnexpectedResponse(FMBaseError):
+    """Response that isn't a Filemail error, e.g. from a proxy or an
+    overloaded server.
+
+    :param message: description of response
+    :param http_status: status code of response
+    :type message: ``str``
+    :type http_status: ``int``
+    """
+
+    def __init__(self, message, http_status=None):
+        super(UnexpectedResponse, self).__init__(message)
+
+        self.http_status = http_status
+
+
+# Names of Filemail error codes
+error_codes = {
+    # General Errors
+    1001: 'UnknownError',
+    1002: 'InvalidParameter',
+    1003: 'InputParameterMissing',
+    1004: 'InvalidEmail',
+    1005: 'NotFound',
+
+    # Authentication Errors
+    2001: 'WrongUsernamePassword',
+    2002: 'PasswordTooWeak',
+    2003: 'InvalidOrExpiredLoginToken',
+    2004: 'AccountExpired',
+    2005: 'CaptchaRequiredForNextLogin',
+    2006: 'LDAPUnableToCreateUser',
+    2007: 'LDAPWrongUsernamePassword',
+    2008: 'AccessDenied',
+
+    # Transfer Initialization Errors
+    3001: 'BusinessAccountExistsRegistrationRequired',
+    3002: 'UserAccountExistsLoginRequired',
+    3003: 'Blocked',
+    3004: 'AllFileserversBusy',
+    3005: 'FreeLimitReached',
+
+    # Transfer File Errors
+    4001: 'TransferExpired',
+    4002: 'PasswordRequired',
+    4003: 'UploadNotComplete',
+    4004: 'FileIsDeleted',
+
+    # Subscription / Registration Errors
+    5001: 'SubscriptionNotFound',
+    5002: 'EmailAlreadyRegistered',
+    5003: 'SignupFormNotAccepted',
+    5004: 'SessionPasswordNotFound',
+    5005: 'SessionCustRefNotFound',
+    5006: 'AllUserLicencesesInUse'
+    }
+
+# Error codes worth trying the same call again for
+TRANSIENT_CODES = (1001, 3004)
+
+# Error classes by error code
+error_classes = {}
+
+for _code, _name in error_codes.items():
+    error_classes[_code] = type(_name, (FileMailBaseError,), {
+        'status': _code,
+        'transient': _code in TRANSIENT_CODES,
+        '__module__': __name__
+        })
+    globals()[_name] = error_classes[_code]
+
+
 def hellraiser(response):
-    _errors = {
-        # General Errors
-        1001: 'UnknownError',
-        1002: 'InvalidParameter',
-        1003: 'InputParameterMissing',
-        1004: 'InvalidEmail',
-        1005: 'NotFound',
-
-        # Authentication Errors
-        2001: 'WrongUsernamePassword',
-        2002: 'PasswordTooWeak',
-        2003: 'InvalidOrExpiredLoginToken',
-        2004: 'AccountExpired',
-        2005: 'CaptchaRequiredForNextLogin',
-        2006: 'LDAPUnableToCreateUser',
-        2007: 'LDAPWrongUsernamePassword',
-        2008: 'AccessDenied',
-
-        # Transfer Initialization Errors
-        3001: 'BusinessAccountExistsRegistrationRequired',
-        3002: 'UserAccountExistsLoginRequired',
-        3003: 'Blocked',
-        3004: 'AllFileserversBusy',
-        3005: 'FreeLimitReached',
-
-        # Transfer File Errors
-        4001: 'TransferExpired',
-        4002: 'PasswordRequired',
-        4003: 'UploadNotComplete',
-        4004: 'FileIsDeleted',
-
-        # Subscription / Registration Errors
-        5001: 'SubscriptionNotFound',
-        5002: 'EmailAlreadyRegistered',
-        5003: 'SignupFormNotAccepted',
-        5004: 'SessionPasswordNotFound',
-        5005: 'SessionCustRefNotFound',
-        5006: 'AllUserLicencesesInUse'
-        }
-
-    if not isinstance(response, requests.Response):
-        if hasattr(response, 'json'):
+    """Raise the error in a response from Filemail as the
+    :class:`FileMailBaseError` subclass of its error code.
+
+    :param response: response or its json data
+    :type response: :class:`requests.Response` or ``dict``
+    :raises: :class:`FileMailBaseError` subclass or
+     :class:`UnexpectedResponse` if `response` holds no error code
+    """
+
+    http_status = None
+
+    if isinstance(response, requests.Response):
+        http_status = response.status_code
+
+        try:
             response_dict = response.json()
 
-        else:
-            raise Exception(response.text())
+        except ValueError:
+            msg = 'Unexpected response ({status}): {text}'
+            raise UnexpectedResponse(msg.format(status=response.status_code,
+                                                text=response.text),
+                                     http_status)
 
     else:
         response_dict = response
 
-    errorcode = response_dict['errorcode']
-    errormessage = response_dict['errormessage']
+    errorcode = response_dict.get('errorcode')
+    errormessage = response_dict.get('errormessage')
 
-    error = type(_errors[errorcode],
-                 (FileMailBaseError,),
-                 dict(status=errorcode, message=errormessage)
-                 )
+    if errorcode not in error_classes:
+        msg = 'Unexpected response ({status}): {data}'
+        raise UnexpectedResponse(msg.format(status=http_status,
+                                            data=response_dict),
+                                 http_status)
 
-    raise error
+    raise error_classes[errorcode](errormessage, http_status)
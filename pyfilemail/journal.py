@@ -0,0 +1,174 @@
+import os
+import json
+import time
+import threading
+
+import pyfilemail as pm
+from pyfilemail import logger, replace_file
+from errors import FMBaseError
+
+# Journals are kept next to the log file in the users data location
+journaldir = os.path.join(pm.datadir, 'journal')
+
+
+def _encode(value):
+    """Turn unicode strings read from json back into utf-8 encoded ``str``,
+    as json decoded them when the journal was saved.
+    """
+
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+
+    if isinstance(value, dict):
+        return dict((_encode(k), _encode(v)) for k, v in value.items())
+
+    if isinstance(value, list):
+        return [_encode(item) for item in value]
+
+    return value
+
+
+class Journal(object):
+    """Record of an initialized transfer and which of its files are fully
+    uploaded. It's saved to disk after every uploaded file so an
+    interrupted transfer may be resumed with :func:`Transfer.from_journal`.
+
+    :param username: user that owns the transfer
+    :param transfer_info: transfer info including transferid, transferkey
+     and transferurl
+    :param files: file specs from :func:`Transfer.get_file_specs`
+    :param uploaded: fileids of files already uploaded
+    :type username: ``str``
+    :type transfer_info: ``dict``
+    :type files: ``list``
+    :type uploaded: ``list``
+    """
+
+    def __init__(self, username, transfer_info, files, uploaded=None):
+        self.username = username
+        self.transfer_info = transfer_info
+        self.files = files
+        self.uploaded = set(uploaded or [])
+
+        self._lock = threading.Lock()
+
+    @property
+    def transferid(self):
+        """:rtype: ``str`` transferid of journaled transfer"""
+
+        return self.transfer_info['transferid']
+
+    @property
+    def path(self):
+        """:rtype: ``str`` full path to journal file"""
+
+        return os.path.join(journaldir, self.transferid + '.json')
+
+    def is_uploaded(self, fmfile):
+        """:rtype: ``bool`` ``True`` if file is already uploaded"""
+
+        return fmfile['fileid'] in self.uploaded
+
+    def mark_uploaded(self, fmfile):
+        """Record file as fully uploaded and save journal.
+
+        :param fmfile: file specs of uploaded file
+        :type fmfile: ``dict``
+        """
+
+        with self._lock:
+            self.uploaded.add(fmfile['fileid'])
+            self.save()
+
+    def save(self):
+        """Write journal to disk. The journal holds the transferkey, so the
+        file is only readable by the current user.
+        """
+
+        if not os.path.exists(journaldir):
+            os.makedirs(journaldir)
+
+        data = {
+            'username': self.username,
+            'transfer_info': self.transfer_info,
+            'files': self.files,
+            'uploaded': sorted(self.uploaded),
+            'updated': time.time()
+            }
+
+        # Write to a temporary file first so a crash never leaves a
+        # half written journal behind
+        tmpfile = self.path + '.tmp'
+        fd = os.open(tmpfile, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0600)
+        with os.fdopen(fd, 'wb') as f:
+            json.dump(data, f, indent=2)
+
+        replace_file(tmpfile, self.path)
+
+    def remove(self):
+        """Delete journal from disk."""
+
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    @classmethod
+    def load(cls, path):
+        """Load journal from file.
+
+        :param path: full path to journal file
+        :type path: ``str``
+        :rtype: :class:`Journal`
+        """
+
+        with open(path, 'rb') as f:
+            data = json.load(f)
+
+        return cls(data['username'],
+                   data['transfer_info'],
+                   _encode(data['files']),
+                   data['uploaded'])
+
+    @classmethod
+    def find(cls, username, transferid=None):
+        """Find journal of an unfinished transfer. If no `transferid` is
+        given the most recently updated journal for `username` is returned.
+
+        :param username: user that owns the transfer
+        :param transferid: id of transfer to resume
+        :type username: ``str``
+        :type transferid: ``str``
+        :rtype: :class:`Journal`
+        :raises: :class:`FMBaseError` if no journal is found
+        """
+
+        journals = []
+        if os.path.exists(journaldir):
+            for filename in os.listdir(journaldir):
+                if not filename.endswith('.json'):
+                    continue
+
+                path = os.path.join(journaldir, filename)
+
+                # A damaged journal only stops its own transfer from
+                # being resumed
+                try:
+                    journal = cls.load(path)
+
+                except (EnvironmentError, ValueError, KeyError) as e:
+                    msg = 'Skipping unreadable journal {path}: {error}'
+                    logger.warning(msg.format(path=path, error=e))
+                    continue
+
+                if journal.username != username:
+                    continue
+
+                if transferid is not None and journal.transferid != transferid:
+                    continue
+
+                journals.append((os.path.getmtime(path), journal))
+
+        if not journals:
+            msg = 'No unfinished transfer found for: "{user}"'
+            raise FMBaseError(msg.format(user=username))
+
+        return max(journals, key=lambda item: item[0])[1]
@@ -0,0 +1,85 @@
+import time
+
+from requests.exceptions import RequestException
+
+# Round trips timed to the fileserver, the best one counts
+SAMPLES = 3
+
+# Seconds before giving up on a probe request
+TIMEOUT = 10
+
+# A fileserver slower than this is clearly degraded
+MAX_RTT = 1.0
+
+
+def probe(session, url, samples=SAMPLES, timeout=TIMEOUT):
+    """Measure latency to the fileserver at `url` with HEAD requests,
+    which send no data to it. The first request opens the connection,
+    including the TLS handshake, which then stays open for the upload to
+    use.
+
+    :param session: session to send requests with
+    :param url: transferurl of an initialized transfer
+    :param samples: number of round trips to time
+    :param timeout: seconds to wait for each request
+    :type session: :class:`requests.Session`
+    :type url: ``str``
+    :type samples: ``int``
+    :type timeout: ``float``
+    :rtype: ``dict`` with ``url``, seconds to ``connect`` and of shortest
+     round trip ``rtt`` and the ``error`` if it couldn't be reached
+    """
+
+    result = {
+        'url': url,
+        'connect': None,
+        'rtt': None,
+        'error': None
+        }
+
+    try:
+        rtts = []
+        for sample in xrange(max(samples, 1) + 1):
+            began = time.time()
+            session.head(url, timeout=timeout)
+            elapsed = time.time() - began
+
+            if sample == 0:
+                result['connect'] = elapsed
+
+            else:
+                rtts.append(elapsed)
+
+        result['rtt'] = min(rtts)
+
+    except RequestException as e:
+        result['error'] = e
+
+    return result
+
+
+def is_degraded(result, max_rtt=MAX_RTT):
+    """Whether a fileserver is clearly worse than it should be.
+
+    :param result: result of :func:`probe`
+    :param max_rtt: longest acceptable round trip in seconds
+    :type result: ``dict``
+    :type max_rtt: ``float``
+    :rtype: ``bool``
+    """
+
+    if result['error'] is not None:
+        return True
+
+    return result['rtt'] > max_rtt
+
+
+def score(result):
+    """Sort key of probe results, higher is better.
+
+    :rtype: ``tuple``
+    """
+
+    return (result['error'] is None,
+            -(result['rtt'] or 0),
+            -(result['connect'] or 0))
@@ -0,0 +1,347 @@
+import sys
+import math
+import time
+import threading
+from collections import OrderedDict
+
+# Seconds between progress events sent to callbacks
+MIN_INTERVAL = 0.2
+
+# Seconds of history weighted into the moving average throughput
+AVERAGE_WINDOW = 5.0
+
+# Frames per second drawn by the console renderer
+FPS = 8
+
+
+class FileProgress(object):
+    """Bytes transferred of a single file.
+
+    :param name: name shown in progress
+    :param size: total size of file
+    :type name: ``str``, ``unicode``
+    :type size: ``int``
+    """
+
+    def __init__(self, name, size):
+        self.name = name
+        self.size = size or 0
+        self.bytes = 0
+
+    @property
+    def done(self):
+        """:rtype: ``bool`` ``True`` when all bytes are transferred"""
+
+        return self.bytes >= self.size
+
+
+class Progress(object):
+    """Collects progress of all files in a transfer from any number of
+    threads and sends coalesced events to `callback`. An event is sent at
+    most every `min_interval` seconds or when `min_bytes` more bytes are
+    transferred, whichever comes first, and always when a file is done.
+
+    Events are ``dict`` objects with:
+
+     - ``name``, ``bytes``, ``size``: the file that was updated
+     - ``total_bytes``, ``total_size``: the whole transfer
+     - ``rate``: bytes per second since last measurement
+     - ``average_rate``: moving average of bytes per second
+     - ``eta``: estimated seconds left or ``None``
+
+    :param callback: function receiving event ``dict`` objects
+    :param min_interval: minimum seconds between events
+    :param min_bytes: send event after this many bytes regardless of
+     `min_interval`. ``None`` disables it
+    :param window: seconds of history in ``average_rate``
+    :type callback: ``func``
+    :type min_interval: ``float``
+    :type min_bytes: ``int``
+    :type window: ``float``
+    """
+
+    def __init__(self,
+                 callback=None,
+                 min_interval=MIN_INTERVAL,
+                 min_bytes=None,
+                 window=AVERAGE_WINDOW):
+
+        self.callback = callback
+        self.min_interval = min_interval
+        self.min_bytes = min_bytes
+        self.window = window
+
+        self.files = OrderedDict()
+        self.total_size = 0
+        self.total_bytes = 0
+
+        self.rate = 0.0
+        self.average_rate = 0.0
+        self._sample_time = time.time()
+        self._sample_bytes = 0
+        self._event_time = self._sample_time
+        self._event_bytes = 0
+
+        self._lock = threading.Lock()
+
+    def add_file(self, key, name, size):
+        """Register a file before transferring it.
+
+        :param key: unique id of file, e.g. fileid
+        :param name: name shown in progress
+        :param size: total size of file
+        :type key: ``str``
+        :type name: ``str``, ``unicode``
+        :type size: ``int``
+        """
+
+        with self._lock:
+            self.files[key] = FileProgress(name, size)
+            self.total_size += size or 0
+
+    def update(self, key, nbytes):
+        """Set number of bytes transferred of a file so far.
+        May go down if part of a file is sent again.
+
+        :param key: id of file given to :func:`Progress.add_file`
+        :param nbytes: bytes transferred of file
+        :type key: ``str``
+        :type nbytes: ``int``
+        """
+
+        with self._lock:
+            fileprogress = self.files[key]
+            nbytes = min(nbytes, fileprogress.size)
+            was_done = fileprogress.done
+
+            self.total_bytes += nbytes - fileprogress.bytes
+            fileprogress.bytes = nbytes
+
+            now = time.time()
+            elapsed = now - self._event_time
+            pending = self.total_bytes - self._event_bytes
+            finished = fileprogress.done and not was_done
+
+            if not (finished or
+                    elapsed >= self.min_interval or
+                    (self.min_bytes and pending >= self.min_bytes)):
+                return
+
+            self._event_time = now
+            self._event_bytes = self.total_bytes
+
+            self._sample(now)
+            event = self._event(fileprogress)
+
+        if self.callback is not None:
+            self.callback(event)
+
+    def finish(self, key):
+        """Mark file as done, e.g. when it is skipped.
+
+        :param key: id of file given to :func:`Progress.add_file`
+        :type key: ``str``
+        """
+
+        self.update(key, self.files[key].size)
+
+    def _sample(self, now):
+        """Update throughput measurements. Call with lock held."""
+
+        elapsed = now - self._sample_time
+        if elapsed <= 0:
+            return
+
+        self.rate = (self.total_bytes - self._sample_bytes) / elapsed
+
+        # Exponential moving average adjusted for uneven intervals
+        weight = 1 - math.exp(-elapsed / self.window)
+        self.average_rate += weight * (self.rate - self.average_rate)
+
+        self._sample_time = now
+        self._sample_bytes = self.total_bytes
+
+    @property
+    def eta(self):
+        """:rtype: ``float`` estimated seconds left or ``None``"""
+
+        if self.average_rate <= 0:
+            return None
+
+        return (self.total_size - self.total_bytes) / self.average_rate
+
+    def _event(self, fileprogress):
+        """Build event for `fileprogress`. Call with lock held."""
+
+        return {
+            'name': fileprogress.name,
+            'bytes': fileprogress.bytes,
+            'size': fileprogress.size,
+            'total_bytes': self.total_bytes,
+            'total_size': self.total_size,
+            'rate': self.rate,
+            'average_rate': self.average_rate,
+            'eta': self.eta
+            }
+
+    def snapshot(self):
+        """Current state of all files and the whole transfer.
+
+        :rtype: ``dict`` like events with a ``files`` ``list`` of
+         (name, bytes, size) tuples
+        """
+
+        with self._lock:
+            self._sample(time.time())
+
+            event = {
+                'files': [(f.name, f.bytes, f.size)
+                          for f in self.files.values()],
+                'total_bytes': self.total_bytes,
+                'total_size': self.total_size,
+                'rate': self.rate,
+                'average_rate': self.average_rate,
+                'eta': self.eta
+                }
+
+        return event
+
+
+def legacy_callback(callback):
+    """Wrap callbacks taking (total file size, bytes transferred) as
+    arguments so they receive :class:`Progress` events.
+
+    :param callback: function taking size and bytes transferred of a file
+    :type callback: ``func``
+    :rtype: ``func``
+    """
+
+    if callback is None:
+        return None
+
+    def call(event):
+        callback(event['size'], event['bytes'])
+
+    return call
+
+
+def format_size(nbytes):
+    """:rtype: ``str`` human readable size"""
+
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if abs(nbytes) < 1024:
+            return '{0:.1f} {1}'.format(nbytes, unit)
+
+        nbytes /= 1024.0
+
+    return '{0:.1f} TB'.format(nbytes)
+
+
+def format_eta(seconds):
+    """:rtype: ``str`` h:mm:ss or --:--"""
+
+    if seconds is None:
+        return '--:--'
+
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+
+    return '{0}:{1:02d}:{2:02d}'.format(hours, minutes, seconds)
+
+
+class ConsoleRenderer(object):
+    """Draws progress bars for active files and the whole transfer at a
+    fixed frame rate in a background thread. Nothing is drawn unless
+    `stream` is a terminal.
+
+    :param progress: progress to draw
+    :param fps: frames per second
+    :param stream: where to draw
+    :param width: width of bars in characters
+    :type progress: :class:`Progress`
+    :type fps: ``int``
+    :type stream: ``file``
+    :type width: ``int``
+    """
+
+    def __init__(self, progress, fps=FPS, stream=None, width=32):
+        self.progress = progress
+        self.fps = fps
+        self.stream = stream or sys.stderr
+        self.width = width
+
+        self._lines = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start drawing.
+
+        :rtype: :class:`ConsoleRenderer`
+        """
+
+        if hasattr(self.stream, 'isatty') and self.stream.isatty():
+            self._thread = threading.Thread(target=self._run)
+            self._thread.daemon = True
+            self._thread.start()
+
+        return self
+
+    def stop(self):
+        """Draw final frame and stop."""
+
+        if self._thread is None:
+            return
+
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+        self.draw(final=True)
+
+    def _run(self):
+        while not self._stop.wait(1.0 / self.fps):
+            self.draw()
+
+    def bar(self, label, nbytes, size):
+        """:rtype: ``str`` a single progress bar line"""
+
+        fraction = size and float(nbytes) / size or 1.0
+        filled = int(self.width * fraction)
+
+        return '{label:<30.30} [{bar}] {percent:3d}%'.format(
+            label=label,
+            bar='#' * filled + ' ' * (self.width - filled),
+            percent=int(fraction * 100)
+            )
+
+    def draw(self, final=False):
+        """Draw one frame replacing the previous one."""
+
+        state = self.progress.snapshot()
+
+        lines = [self.bar(name, nbytes, size)
+                 for name, nbytes, size in state['files']
+                 if 0 < nbytes < size]
+
+        total = self.bar('Total', state['total_bytes'], state['total_size'])
+        total += '  {rate}/s  ETA {eta}'.format(
+            rate=format_size(state['average_rate']),
+            eta=format_eta(state['eta'])
+            )
+        lines.append(total)
+
+        # Move up to first line of previous frame and clear to end
+        output = '\r'
+        if self._lines > 1:
+            output += '\x1b[{n}A'.format(n=self._lines - 1)
+
+        output += '\x1b[J' + '\n'.join(lines)
+
+        if final:
+            output += '\n'
+            lines = []
+
+        self._lines = len(lines)
+        self.stream.write(output)
+        self.stream.flush()
@@ -0,0 +1,140 @@
+import time
+import threading
+
+from errors import FMBaseError
+
+# Multipliers for rates given as strings like "500K" or "10M"
+UNITS = {
+    '': 1,
+    'K': 1024,
+    'M': 1024 ** 2,
+    'G': 1024 ** 3
+    }
+
+
+def parse_rate(rate):
+    """Convert a rate like "500K" or "10M" to bytes per second.
+
+    :param rate: bytes per second with optional K, M or G suffix
+    :type rate: ``str``
+    :rtype: ``int``
+    :raises: :class:`FMBaseError` on invalid rate
+    """
+
+    rate = rate.strip().upper()
+    unit = rate[-1:] if rate[-1:] in UNITS else ''
+    number = rate[:len(rate) - len(unit)]
+
+    try:
+        return int(float(number) * UNITS[unit])
+
+    except ValueError:
+        msg = 'Invalid rate: "{rate}". Use e.g. 500K or 10M'
+        raise FMBaseError(msg.format(rate=rate))
+
+
+class TokenBucket(object):
+    """Token bucket limiting throughput to `rate` bytes per second.
+    Threads sharing a bucket share the rate. Callers reserve bytes in the
+    order they ask for them, so concurrent transfers reading in equal sized
+    blocks get an equal share. The rate may be changed at any time.
+
+    :param rate: bytes per second. ``None`` or ``0`` means unlimited
+    :param burst: bytes that may be sent at once after being idle.
+     Defaults to a quarter of a second worth of data
+    :type rate: ``int``
+    :type burst: ``int``
+    """
+
+    def __init__(self, rate=None, burst=None):
+        self._lock = threading.Lock()
+        self.set_rate(rate, burst)
+
+    def set_rate(self, rate, burst=None):
+        """Change rate limit. Takes effect for transfers already running.
+
+        :param rate: bytes per second. ``None`` or ``0`` means unlimited
+        :param burst: bytes that may be sent at once after being idle
+        :type rate: ``int``
+        :type burst: ``int``
+        """
+
+        with self._lock:
+            self.rate = rate or None
+            self.burst = burst or (rate and max(rate // 4, 1)) or None
+            self.tokens = self.burst or 0
+            self.timestamp = time.time()
+
+    @property
+    def limited(self):
+        """:rtype: ``bool`` ``True`` if a rate is set"""
+
+        return self.rate is not None
+
+    def consume(self, amount):
+        """Take `amount` bytes from bucket, sleeping until the rate allows
+        them to be sent.
+
+        :param amount: number of bytes
+        :type amount: ``int``
+        """
+
+        with self._lock:
+            if self.rate is None:
+                return
+
+            now = time.time()
+            self.tokens = min(self.burst,
+                              self.tokens + (now - self.timestamp) * self.rate)
+            self.timestamp = now
+
+            # Tokens may go negative. Later callers then queue up behind
+            # the debt which keeps the order fair
+            self.tokens -= amount
+            wait = -self.tokens / float(self.rate)
+
+        if wait > 0:
+            time.sleep(wait)
+
+
+# Process wide limits shared by all users and transfers
+upload_limit = TokenBucket()
+download_limit = TokenBucket()
+
+
+def consume(buckets, amount):
+    """Take `amount` bytes from every bucket in `buckets`.
+
+    :param buckets: :class:`TokenBucket` objects or ``None``
+    :param amount: number of bytes
+    :type buckets: ``list``
+    :type amount: ``int``
+    """
+
+    for bucket in buckets:
+        if bucket is not None:
+            bucket.consume(amount)
+
+
+class ThrottledReader(object):
+    """File like object limiting how fast `file_obj` is read.
+
+    :param file_obj: object with ``read()`` and ``len``
+    :param buckets: :class:`TokenBucket` objects to take bytes from
+    :type file_obj: ``file``
+    :type buckets: ``list``
+    """
+
+    def __init__(self, file_obj, buckets):
+        self.file_obj = file_obj
+        self.buckets = buckets
+
+    @property
+    def len(self):
+        return self.file_obj.len
+
+    def read(self, size=-1):
+        data = self.file_obj.read(size)
+        consume(self.buckets, len(data))
+
+        return data
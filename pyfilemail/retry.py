@@ -0,0 +1,212 @@
+import time
+import random
+import threading
+
+from requests import exceptions
+
+from pyfilemail import logger
+
+# Attempts per call of actions without a budget of their own
+ATTEMPTS = 3
+
+# Seconds of backoff before the first retry, doubled for every retry
+BACKOFF = 0.5
+
+# Longest backoff in seconds
+MAX_BACKOFF = 30
+
+# Attempts per call by action in :data:`pyfilemail.urls.api_urls`, plus
+# "upload" for each file or part sent to a fileserver. Calls creating
+# something, or sending emails, aren't repeated since a lost response
+# doesn't mean Filemail didn't act on them
+BUDGETS = {
+    'init': 5,
+    'upload': 4,
+    'complete': 1,
+    'forward': 1,
+    'share': 1,
+    'contacts_add': 1,
+    'group_add': 1,
+    'company_add_user': 1
+    }
+
+# HTTP status codes of responses worth trying again
+TRANSIENT_STATUS = (429, 500, 502, 503, 504)
+
+# Network errors worth trying again
+TRANSIENT_ERRORS = (exceptions.ConnectionError,
+                    exceptions.Timeout,
+                    exceptions.ChunkedEncodingError)
+
+# Actions creating something on Filemail, retried only when it's clear
+# the call was refused. After a lost response, e.g. a read timeout, a
+# retry of "init" would leave the first transfer orphaned
+REFUSED_ONLY = ('init',)
+
+# Network errors raised before the request was sent
+UNSENT_ERRORS = (exceptions.ConnectTimeout,)
+
+
+class RetryPolicy(object):
+    """Decides which failed calls are tried again and when. Errors are
+    transient if Filemail marks them so, e.g.
+    :class:`pyfilemail.errors.AllFileserversBusy`, if the response had a
+    status in `TRANSIENT_STATUS` or if the connection failed. Actions in
+    `REFUSED_ONLY` are only retried after network errors if the request
+    was never sent. Retries wait an exponential backoff with full jitter,
+    so many clients failing at once don't come back at once.
+
+    The number of retries and the seconds spent on failed attempts and
+    waiting are counted by action, see :func:`RetryPolicy.stats`.
+
+    :param attempts: attempts per call of actions without a budget
+    :param backoff: seconds of backoff before the first retry
+    :param max_backoff: longest backoff in seconds
+    :param budgets: attempts per call by action, merged with `BUDGETS`
+    :type attempts: ``int``
+    :type backoff: ``float``
+    :type max_backoff: ``float``
+    :type budgets: ``dict``
+    """
+
+    def __init__(self,
+                 attempts=ATTEMPTS,
+                 backoff=BACKOFF,
+                 max_backoff=MAX_BACKOFF,
+                 budgets=None):
+
+        self.attempts = attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+        self.budgets = dict(BUDGETS)
+        if budgets:
+            self.budgets.update(budgets)
+
+        self.refused_only = set(REFUSED_ONLY)
+
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def budget(self, action):
+        """:rtype: ``int`` attempts per call of `action`"""
+
+        return self.budgets.get(action, self.attempts)
+
+    def is_transient(self, error, action=None):
+        """Whether the call that raised `error` may succeed later, and may
+        safely be tried again.
+
+        :param error: error raised by call
+        :param action: name of action called
+        :type error: ``Exception``
+        :type action: ``str``
+        :rtype: ``bool``
+        """
+
+        if getattr(error, 'transient', False):
+            return True
+
+        if getattr(error, 'http_status', None) in TRANSIENT_STATUS:
+            return True
+
+        if action in self.refused_only:
+            return isinstance(error, UNSENT_ERRORS)
+
+        return isinstance(error, TRANSIENT_ERRORS)
+
+    def delay(self, retry, backoff=None):
+        """Seconds to wait before retry number `retry`, counting from 0.
+
+        :rtype: ``float``
+        """
+
+        if backoff is None:
+            backoff = self.backoff
+
+        return random.uniform(0, min(self.max_backoff, backoff * 2 ** retry))
+
+    def call(self, action, func, attempts=None, backoff=None):
+        """Call `func` until it succeeds, fails with an error that isn't
+        transient or has been tried the number of attempts in the budget of
+        `action`.
+
+        :param action: name of action, used for budget and stats
+        :param func: function taking no arguments
+        :param attempts: override budget of `action`
+        :param backoff: override seconds of backoff before first retry
+        :type action: ``str``
+        :type func: ``func``
+        :type attempts: ``int``
+        :type backoff: ``float``
+        :returns: return value of `func`
+        :raises: last error raised by `func`
+        """
+
+        if attempts is None:
+            attempts = self.budget(action)
+
+        spent = 0.0
+
+        for attempt in xrange(max(attempts, 1)):
+            started = time.time()
+
+            try:
+                result = func()
+
+            except Exception as e:
+                if attempt + 1 >= attempts or not self.is_transient(e, action):
+                    spent += time.time() - started
+                    self._record(action, attempt, spent, failed=True)
+                    raise
+
+                delay = self.delay(attempt, backoff)
+
+                msg = '{action} failed ({error}). Retrying in {delay:.1f}s'
+                logger.warning(msg.format(action=action,
+                                          error=e.__class__.__name__,
+                                          delay=delay))
+
+                time.sleep(delay)
+                spent += time.time() - started
+                continue
+
+            self._record(action, attempt, spent, failed=False)
+
+            return result
+
+    def _record(self, action, retries, seconds, failed):
+        with self._lock:
+            stats = self._stats.setdefault(action, {
+                'calls': 0,
+                'retries': 0,
+                'failed': 0,
+                'seconds': 0.0
+                })
+
+            stats['calls'] += 1
+            stats['retries'] += retries
+            stats['failed'] += int(failed)
+            stats['seconds'] += seconds
+
+    def stats(self):
+        """Retries by action.
+
+        :rtype: ``dict`` of ``dict`` with number of ``calls``, ``retries``,
+         ``failed`` calls and ``seconds`` spent on failed attempts and
+         waiting, by action
+        """
+
+        with self._lock:
+            return dict((action, dict(stats))
+                        for action, stats in self._stats.items())
+
+    def reset_stats(self):
+        """Start counting from zero."""
+
+        with self._lock:
+            self._stats.clear()
+
+
+# Policy of all users unless set on User.retry_policy
+policy = RetryPolicy()
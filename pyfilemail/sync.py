@@ -0,0 +1,261 @@
+import os
+import json
+import time
+from hashlib import md5
+
+import pyfilemail as pm
+from pyfilemail import logger, replace_file
+
+# Manifests of synced folders are kept in the users data location
+manifestdir = os.path.join(pm.datadir, 'sync')
+
+# Seconds subtracted from time of last sync when asking Filemail for new
+# transfers. Covers clock differences and transfers completed during a sync
+OVERLAP = 15 * 60
+
+
+class Manifest(object):
+    """Record of files synced to a folder: size, md5 and local path of every
+    downloaded file by transferid and fileid, and when the last complete
+    sync started.
+
+    :param username: user whose received transfers are synced
+    :param destination: folder files are synced to
+    :param since: unix timestamp of last complete sync
+    :param transfers: synced transfers
+    :type username: ``str``
+    :type destination: ``str`` or ``unicode``
+    :type since: ``float``
+    :type transfers: ``dict``
+    """
+
+    def __init__(self, username, destination, since=None, transfers=None):
+        self.username = username
+        self.destination = os.path.abspath(destination)
+        self.since = since
+        self.transfers = transfers or {}
+
+    @property
+    def path(self):
+        """:rtype: ``str`` full path to manifest file"""
+
+        key = u'{0}\n{1}'.format(self.username, self.destination)
+        name = md5(key.encode('utf-8')).hexdigest() + '.json'
+
+        return os.path.join(manifestdir, name)
+
+    def is_complete(self, transferid):
+        """:rtype: ``bool`` ``True`` if all files of transfer are synced"""
+
+        return self.transfers.get(transferid, {}).get('complete', False)
+
+    def is_current(self, transferid, fmfile, check=False):
+        """Whether the synced copy of a file matches the file on Filemail.
+
+        :param transferid: id of transfer file belongs to
+        :param fmfile: file data from Filemail
+        :param check: also make sure the local copy still exists with the
+         right size
+        :type transferid: ``str``
+        :type fmfile: ``dict``
+        :type check: ``bool``
+        :rtype: ``bool``
+        """
+
+        files = self.transfers.get(transferid, {}).get('files', {})
+        entry = files.get(fmfile.get('fileid'))
+
+        if entry is None:
+            return False
+
+        if entry['size'] != fmfile.get('filesize'):
+            return False
+
+        if entry['md5'] != fmfile.get('md5'):
+            return False
+
+        if check:
+            path = entry['path']
+            if not os.path.isfile(path):
+                return False
+
+            if os.path.getsize(path) != entry['size']:
+                return False
+
+        return True
+
+    def record(self, transferid, fmfile, path):
+        """Record a downloaded file.
+
+        :param transferid: id of transfer file belongs to
+        :param fmfile: file data from Filemail
+        :param path: local path of file
+        :type transferid: ``str``
+        :type fmfile: ``dict``
+        :type path: ``str`` or ``unicode``
+        """
+
+        transfer = self.transfers.setdefault(transferid,
+                                             {'complete': False, 'files': {}})
+        transfer['files'][fmfile.get('fileid')] = {
+            'size': fmfile.get('filesize'),
+            'md5': fmfile.get('md5'),
+            'path': path
+            }
+
+    def set_complete(self, transferid, complete=True):
+        """Mark whether all files of a transfer are synced."""
+
+        transfer = self.transfers.setdefault(transferid,
+                                             {'complete': False, 'files': {}})
+        transfer['complete'] = complete
+
+    def save(self):
+        """Write manifest to disk."""
+
+        if not os.path.exists(manifestdir):
+            os.makedirs(manifestdir)
+
+        data = {
+            'username': self.username,
+            'destination': self.destination,
+            'since': self.since,
+            'transfers': self.transfers
+            }
+
+        # Write to a temporary file first so a crash never leaves a
+        # half written manifest behind
+        tmpfile = self.path + '.tmp'
+        with open(tmpfile, 'wb') as f:
+            json.dump(data, f)
+
+        replace_file(tmpfile, self.path)
+
+    @classmethod
+    def load(cls, username, destination):
+        """Load manifest of `destination` or start an empty one.
+
+        :param username: user whose received transfers are synced
+        :param destination: folder files are synced to
+        :type username: ``str``
+        :type destination: ``str`` or ``unicode``
+        :rtype: :class:`Manifest`
+        """
+
+        manifest = cls(username, destination)
+
+        if os.path.exists(manifest.path):
+            with open(manifest.path, 'rb') as f:
+                data = json.load(f)
+
+            manifest.since = data['since']
+            manifest.transfers = data['transfers']
+
+        return manifest
+
+
+class Sync(object):
+    """Keeps a local folder up to date with transfers received by a user.
+    Only transfers received since the last complete sync are listed, and
+    only files that are new or changed according to the manifest are
+    downloaded. A sync without anything new costs a single API call.
+    Files of each transfer go in a sub folder named after its transferid.
+
+    :param user: logged in user
+    :param destination: folder to sync to
+    :param for_all: see :func:`pyfilemail.User.get_received`
+    :type user: :class:`pyfilemail.User`
+    :type destination: ``str`` or ``unicode``
+    :type for_all: ``bool``
+
+    ::
+
+        sync = Sync(user, '/home/myname/Received')
+        report = sync.run(workers=4)
+    """
+
+    def __init__(self, user, destination, for_all=True):
+        self.user = user
+        self.destination = os.path.abspath(destination)
+        self.for_all = for_all
+        self.manifest = Manifest.load(user.username, self.destination)
+
+    def run(self, workers=1, check=False, **kwargs):
+        """Download new and changed files.
+
+        :param workers: number of files to download at the same time
+        :param check: list all received transfers and download files
+         missing from the local folder too. Costs an ``os.stat`` per file
+        :param kwargs: passed on to :func:`pyfilemail.Transfer.download`
+        :type workers: ``int``
+        :type check: ``bool``
+        :rtype: ``dict`` with number of ``transfers`` that had new files and
+         number of files ``downloaded`` and ``failed``, and the ``files``
+         reports from :func:`pyfilemail.Transfer.download`
+        """
+
+        started = time.time()
+
+        since = self.manifest.since
+        if since is not None and not check:
+            since -= OVERLAP
+
+        else:
+            since = None
+
+        transfers = self.user.get_received(since=since, for_all=self.for_all)
+
+        report = {'transfers': 0, 'downloaded': 0, 'failed': 0, 'files': []}
+
+        if not check:
+            transfers = [transfer for transfer in transfers if not
+                         self.manifest.is_complete(transfer.transfer_id)]
+
+        self.user.prefetch_files(transfers, workers)
+
+        for transfer in transfers:
+            transferid = transfer.transfer_id
+
+            pending = [fmfile for fmfile in transfer.files
+                       if not self.manifest.is_current(transferid,
+                                                       fmfile,
+                                                       check)]
+
+            if pending:
+                result = transfer.download(
+                    pending,
+                    destination=os.path.join(self.destination, transferid),
+                    replace=True,
+                    workers=workers,
+                    **kwargs
+                    )
+
+                for fmfile, file_result in zip(pending, result['files']):
+                    if file_result['status'] == 'downloaded':
+                        self.manifest.record(transferid,
+                                             fmfile,
+                                             file_result['path'])
+
+                report['transfers'] += 1
+                report['downloaded'] += result['downloaded']
+                report['failed'] += result['failed']
+                report['files'].extend(result['files'])
+
+                complete = not result['failed']
+
+            else:
+                complete = True
+
+            self.manifest.set_complete(transferid, complete)
+            self.manifest.save()
+
+        # Failed files are retried by listing the same period again
+        if not report['failed']:
+            self.manifest.since = started
+
+        self.manifest.save()
+
+        msg = 'Synced {downloaded} files, {failed} failed'
+        logger.info(msg.format(**report))
+
+        return report
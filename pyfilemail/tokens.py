@@ -0,0 +1,153 @@
+import os
+import json
+import time
+from hashlib import md5
+
+try:
+    import keyring
+    from keyring.backends import fail
+
+except ImportError:
+    keyring = None
+
+import pyfilemail as pm
+from pyfilemail import logger, replace_file
+
+# Login tokens are kept in the keyring, or here if there's no keyring
+tokendir = os.path.join(pm.datadir, 'tokens')
+
+# Keyring service holding login tokens, apart from stored passwords
+SERVICE = 'pyfilemail-logintoken'
+
+# Seconds a login token is reused before logging in again
+LIFETIME = 24 * 60 * 60
+
+
+def _use_keyring():
+    """:rtype: ``bool`` ``True`` if a keyring backend is available"""
+
+    if keyring is None:
+        return False
+
+    return not isinstance(keyring.get_keyring(), fail.Keyring)
+
+
+def _path(username):
+    """:rtype: ``str`` full path to token file of `username`"""
+
+    name = md5(username.encode('utf-8')).hexdigest() + '.json'
+
+    return os.path.join(tokendir, name)
+
+
+def _read(username):
+    """:rtype: ``str`` stored json or ``None``"""
+
+    if _use_keyring():
+        try:
+            data = keyring.get_password(SERVICE, username)
+            if data is not None:
+                return data
+
+        except Exception as e:
+            # Locked or broken keyrings raise all sorts of errors
+            msg = 'Could not read login token from keyring: {error}'
+            logger.debug(msg.format(error=e))
+
+    path = _path(username)
+    if os.path.exists(path):
+        with open(path, 'rb') as f:
+            return f.read()
+
+    return None
+
+
+def _write(username, data):
+    if _use_keyring():
+        try:
+            keyring.set_password(SERVICE, username, data)
+            return
+
+        except Exception as e:
+            msg = 'Could not store login token in keyring: {error}'
+            logger.debug(msg.format(error=e))
+
+    if not os.path.exists(tokendir):
+        os.makedirs(tokendir, 0700)
+
+    # The token is as good as a password, so only the user may read it
+    path = _path(username)
+    tmpfile = path + '.tmp'
+    fd = os.open(tmpfile, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0600)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+
+    replace_file(tmpfile, path)
+
+
+def load(username):
+    """Login token of `username` stored by an earlier login, in this or
+    another process.
+
+    :param username: user that logged in
+    :type username: ``str``
+    :rtype: ``str`` login token or ``None`` if there's no token or it
+     has expired
+    """
+
+    data = _read(username)
+    if data is None:
+        return None
+
+    try:
+        stored = json.loads(data)
+
+    except ValueError:
+        delete(username)
+        return None
+
+    if stored.get('expires', 0) <= time.time():
+        delete(username)
+        return None
+
+    return stored.get('logintoken')
+
+
+def save(username, logintoken, lifetime=LIFETIME):
+    """Store login token for later processes to use.
+
+    :param username: user that logged in
+    :param logintoken: token from Filemail
+    :param lifetime: seconds to use token for
+    :type username: ``str``
+    :type logintoken: ``str``
+    :type lifetime: ``int``
+    """
+
+    data = json.dumps({
+        'logintoken': logintoken,
+        'expires': time.time() + lifetime
+        })
+
+    _write(username, data)
+
+
+def delete(username):
+    """Forget login token of `username`, e.g. when it's expired or the
+    user logged out.
+
+    :param username: user that logged in
+    :type username: ``str``
+    """
+
+    if _use_keyring():
+        try:
+            keyring.delete_password(SERVICE, username)
+
+        except Exception:
+            # Not stored in keyring
+            pass
+
+    path = _path(username)
+    if os.path.exists(path):
+        os.remove(path)
@@ -1,19 +1,159 @@
 import os
+import mmap
+import time
+import threading
 import datetime
 from hashlib import md5
 from uuid import uuid4
 from mimetypes import guess_type
-from zipfile import ZipFile
 
-from clint.textui.progress import Bar as ProgressBar
+from requests.exceptions import RequestException
 from requests_toolbelt.multipart import encoder
 
 import users
+import writer
+import ratelimit
+import probe
+import transport
 import pyfilemail as pm
-from urls import get_URL
 from functools import wraps
-from pyfilemail import logger, login_required
-from errors import hellraiser, FMBaseError, FMFileError
+from pyfilemail import logger, login_required, pool_map, replace_file
+from journal import Journal
+from archive import (ZipStream, write_zip, extract_zip, find_central_directory,
+                     read_central_directory, END_RECORD_MAX_SIZE)
+from progress import Progress, ConsoleRenderer, legacy_callback
+from errors import (hellraiser, FileMailBaseError, FMBaseError, FMFileError,
+                    ChecksumMismatch)
+
+# Size of blocks read from disk when calculating checksums
+CHECKSUM_BLOCKSIZE = 1024 * 1024
+
+# Seconds to wait before retrying a failed upload part
+RETRY_DELAY = 2
+
+# Keys of transfer info set by initializing a transfer
+INIT_KEYS = ('transferid', 'transferkey', 'transferurl')
+
+# Times a transfer is initialized again to get a better fileserver
+PROBE_ATTEMPTS = 2
+
+# Size of chunks read from downloads, smaller when throttled
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+THROTTLED_CHUNK_SIZE = 64 * 1024
+
+# Files are only split in byte ranges of at least this size when downloaded
+# in segments
+SEGMENT_MIN_SIZE = 8 * 1024 * 1024
+
+# Downloads are written to <filename>.part and renamed when complete. A
+# .part file with a <filename>.part.segmented marker was allocated up front
+# by a segmented download and can't be resumed from its size
+PART_SUFFIX = '.part'
+SEGMENTED_SUFFIX = '.segmented'
+
+# Downloads failing checksum verification are kept as <filename>.corrupt
+CORRUPT_SUFFIX = '.corrupt'
+
+
+def normalize_md5(checksum):
+    """Convert a hex or base64 encoded md5 checksum to base64 as returned
+    by :func:`get_md5`.
+
+    :param checksum: hex or base64 encoded md5
+    :type checksum: ``str``
+    :rtype: ``str`` or ``None`` if `checksum` isn't an md5
+    """
+
+    checksum = (checksum or '').strip()
+
+    try:
+        if len(checksum) == 32:
+            digest = checksum.decode('hex')
+
+        else:
+            digest = checksum.decode('base64')
+
+    except (TypeError, ValueError):
+        return None
+
+    if len(digest) != 16:
+        return None
+
+    return digest.encode('base64')[:-1]
+
+
+def get_md5(filepath, blocksize=CHECKSUM_BLOCKSIZE, use_mmap=False):
+    """Calculate base64 encoded md5 checksum of a file.
+    The file is read in blocks of `blocksize` bytes so memory usage stays
+    the same regardless of file size.
+
+    :param filepath: Path to file
+    :param blocksize: Number of bytes to feed the hash at a time
+    :param use_mmap: Memory map the file instead of reading it
+    :type filepath: str, unicode
+    :type blocksize: int
+    :type use_mmap: bool
+    :rtype: ``str``
+    """
+
+    md5hash = md5()
+
+    with open(filepath, 'rb') as f:
+        if use_mmap:
+            # Map one window at a time so mapped pages don't pile up
+            # in resident memory for big files
+            size = os.fstat(f.fileno()).st_size
+            window = max(blocksize, mmap.ALLOCATIONGRANULARITY)
+            window -= window % mmap.ALLOCATIONGRANULARITY
+
+            for offset in xrange(0, size, window):
+                length = min(window, size - offset)
+                mapped = mmap.mmap(f.fileno(),
+                                   length,
+                                   access=mmap.ACCESS_READ,
+                                   offset=offset)
+                try:
+                    md5hash.update(mapped[:])
+
+                finally:
+                    mapped.close()
+
+        else:
+            for block in iter(lambda: f.read(blocksize), ''):
+                md5hash.update(block)
+
+    return md5hash.digest().encode('base64')[:-1]
+
+
+class FileChunk(object):
+    """Read only file like object exposing `length` bytes of `file_obj`
+    starting at `offset`. Used to upload large files in parts.
+
+    :param file_obj: open file to read from
+    :param offset: position of first byte in part
+    :param length: number of bytes in part
+    :type file_obj: ``file``
+    :type offset: ``int``
+    :type length: ``int``
+    """
+
+    def __init__(self, file_obj, offset, length):
+        self.file_obj = file_obj
+        self.remaining = length
+
+        self.file_obj.seek(offset)
+
+    def __len__(self):
+        return self.remaining
+
+    def read(self, size=-1):
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+
+        data = self.file_obj.read(size)
+        self.remaining -= len(data)
+
+        return data
 
 
 # Decorator to make sure we don't transfer complete packages twice
@@ -47,6 +187,23 @@ class Transfer(object):
     :param password: Protect download with given password
     :param checksum: Create checksum of added files (a bit slower process)
     :param zip_: Compress files in a zip file before sending
+    :param mmap_: Memory map files when calculating checksum
+    :param hash_workers: Number of threads calculating checksums
+    :param journal: Keep a journal of uploaded files so an interrupted
+     transfer can be resumed with :func:`Transfer.from_journal`
+    :param stream_zip: Build zip file while uploading instead of writing it
+     to disk first. Only used together with `zip_`
+    :param compress_workers: Number of processes compressing files for
+     `zip_`. Defaults to number of cpus
+    :param probe: Measure the fileserver while files are added and switch
+     to another one if it's clearly degraded. See
+     :func:`Transfer.probe_fileserver`
+    :type probe: bool
+    :type compress_workers: int
+    :type stream_zip: bool
+    :type journal: bool
+    :type hash_workers: int
+    :type mmap_: bool
     :type zip_: bool
     :type checksum: bool
     :type password: str, unicode
@@ -71,7 +228,14 @@ class Transfer(object):
                  password=None,
                  checksum=True,
                  zip_=False,
-                 _restore=False):
+                 mmap_=False,
+                 hash_workers=1,
+                 journal=False,
+                 stream_zip=False,
+                 compress_workers=None,
+                 probe=False,
+                 _restore=False,
+                 _register=True):
 
         if isinstance(fm_user, basestring):
             self.fm_user = users.User(fm_user)
@@ -82,17 +246,36 @@ class Transfer(object):
         else:
             raise FMBaseError('fm_user must be of type "string or User"')
 
-        # Add transfer to user's transfer list
-        self.fm_user.transfers.append(self)
+        # Add transfer to user's transfer list, unless it's only a copy of
+        # one kept elsewhere, e.g. in a TransferCache
+        if _register:
+            self.fm_user.transfers.append(self)
 
         self._files = []
+        # Files of existing transfers are fetched when first needed
+        self._files_loaded = not _restore
+        # Zip archives built during upload keyed by fileid
+        self._streams = {}
 
         self._complete = False
         self.checksum = checksum
         self.zip_ = zip_
+        self.mmap_ = mmap_
+        self.hash_workers = hash_workers
+        self.journal = journal
+        # Journal of uploaded files, created when sending if journal is set
+        self._journal = None
+        self.stream_zip = stream_zip
+        self.compress_workers = compress_workers
         self.config = self.fm_user.config
         self.session = self.fm_user.session
 
+        # Result of probing the fileserver, see probe_fileserver
+        self.probe_result = None
+        self._probe_thread = None
+        # Held while the keys of a new initialization are swapped in
+        self._info_lock = threading.Lock()
+
         self.transfer_info = {
             'from': self.fm_user.username,
             'to': self._parse_recipients(to),
@@ -106,10 +289,23 @@ class Transfer(object):
             }
 
         if not _restore:
-            self._initialize()
+            self._use_initialization(self._initialize())
+
+            # Probe in the background while files are added and hashed
+            if probe:
+                self._probe_thread = threading.Thread(
+                    target=self._probe_in_background
+                    )
+                self._probe_thread.daemon = True
+                self._probe_thread.start()
 
     def _initialize(self):
-        """Initialize transfer."""
+        """Initialize transfer. The transfer info isn't changed, see
+        :func:`Transfer._use_initialization`.
+
+        :rtype: ``dict`` with transferid, transferkey and transferurl of
+         new initialization
+        """
 
         payload = {
             'apikey': self.session.cookies.get('apikey'),
@@ -119,18 +315,154 @@ class Transfer(object):
         if self.fm_user.logged_in:
             payload['logintoken'] = self.session.cookies.get('logintoken')
 
-        payload.update(self.transfer_info)
+        # Leave out keys of a previous initialization
+        payload.update((key, value)
+                       for key, value in self.transfer_info.items()
+                       if key not in INIT_KEYS)
 
-        method, url = get_URL('init')
+        res = self.fm_user._api_call('init', payload)
 
-        res = getattr(self.session, method)(url, params=payload)
+        return dict((key, res.json().get(key)) for key in INIT_KEYS)
 
-        if res.status_code == 200:
-            for key in ['transferid', 'transferkey', 'transferurl']:
-                self.transfer_info[key] = res.json().get(key)
+    def _use_initialization(self, initialization):
+        """Swap in keys of `initialization` as a whole, so threads adding
+        files never see keys of two different initializations. See
+        :func:`Transfer._file_keys`.
 
-        else:
-            hellraiser(res)
+        :param initialization: result of :func:`Transfer._initialize`
+        :type initialization: ``dict``
+        """
+
+        with self._info_lock:
+            transfer_info = dict(self.transfer_info)
+            transfer_info.update(initialization)
+            self.transfer_info = transfer_info
+
+    def _file_keys(self):
+        """:rtype: ``tuple`` (transferid, transferkey) of the same
+         initialization
+        """
+
+        with self._info_lock:
+            return self.transfer_id, self.transfer_info['transferkey']
+
+    def probe_fileserver(self,
+                         max_rtt=probe.MAX_RTT,
+                         attempts=PROBE_ATTEMPTS):
+        """Measure connection and round trip time to the fileserver
+        assigned to the transfer, leaving a connection open for the upload.
+        If the fileserver is clearly degraded or unreachable the transfer
+        is initialized again, up to `attempts` times, to get another one.
+        The best fileserver is kept and the other transfers are cancelled.
+
+        Must be called before :func:`Transfer.send`. Pass ``probe=True``
+        when creating the transfer to probe while files are being added.
+
+        :param max_rtt: longest acceptable round trip in seconds
+        :param attempts: number of times to initialize again
+        :type max_rtt: ``float``
+        :type attempts: ``int``
+        :rtype: ``dict`` with result of :func:`pyfilemail.probe.probe` for
+         the fileserver in use
+        """
+
+        self._probe(max_rtt, attempts)
+        self._retarget_files()
+
+        return self.probe_result
+
+    def _probe(self, max_rtt=probe.MAX_RTT, attempts=PROBE_ATTEMPTS):
+        """Probe fileservers until a good one is found. The transfer info
+        is only changed once the best one is known. Files added meanwhile
+        are moved to the transfer kept by :func:`Transfer._retarget_files`.
+        """
+
+        kept = dict((key, self.transfer_info[key]) for key in INIT_KEYS)
+        best = probe.probe(self.session, kept['transferurl'])
+
+        for attempt in xrange(attempts):
+            if not probe.is_degraded(best, max_rtt):
+                break
+
+            msg = 'Fileserver is degraded: {result}. Initializing again'
+            logger.warning(msg.format(result=best))
+
+            try:
+                initialization = self._initialize()
+
+            except (FileMailBaseError, FMBaseError, RequestException) as e:
+                msg = 'Could not initialize transfer again: {error}'
+                logger.warning(msg.format(error=e))
+                break
+
+            result = probe.probe(self.session,
+                                 initialization['transferurl'])
+
+            if probe.score(result) > probe.score(best):
+                self._abandon(kept)
+                kept = initialization
+                best = result
+
+            else:
+                self._abandon(initialization)
+
+        self._use_initialization(kept)
+
+        msg = 'Using fileserver {url}: {result}'
+        logger.debug(msg.format(url=kept['transferurl'], result=best))
+
+        self.probe_result = best
+
+    def _probe_in_background(self):
+        try:
+            self._probe()
+
+        except Exception as e:
+            msg = 'Probing fileserver failed: {error}'
+            logger.warning(msg.format(error=e))
+
+    def _wait_for_probe(self):
+        """Wait for probing started with the transfer to finish."""
+
+        if self._probe_thread is None:
+            return
+
+        self._probe_thread.join()
+        self._probe_thread = None
+
+        self._retarget_files()
+
+    def _retarget_files(self):
+        """Point file specs at the current initialization of the transfer.
+        """
+
+        transferid, transferkey = self._file_keys()
+
+        for fmfile in self._files:
+            if 'transferkey' in fmfile:
+                fmfile['transferid'] = transferid
+                fmfile['transferkey'] = transferkey
+
+    def _abandon(self, transfer_info):
+        """Cancel an initialization of the transfer that won't be used.
+
+        :param transfer_info: transfer info with transferid and transferkey
+        :type transfer_info: ``dict``
+        """
+
+        payload = {
+            'apikey': self.config.get('apikey'),
+            'transferid': transfer_info['transferid'],
+            'transferkey': transfer_info['transferkey']
+            }
+
+        try:
+            self.fm_user._api_call('cancel', payload)
+
+        except (FileMailBaseError, FMBaseError, RequestException) as e:
+            msg = 'Could not cancel unused transfer {transferid}: {error}'
+            logger.debug(msg.format(transferid=transfer_info['transferid'],
+                                    error=e))
 
     @property
     def logged_in(self):
@@ -181,7 +513,9 @@ class Transfer(object):
     def add_files(self, files):
         """Add files and/or folders to transfer.
         If :class:`Transfer.compress` attribute is set to ``True``, files
-        will get packed into a zip file before sending.
+        will get packed into a zip file before sending. Files that compress
+        well are deflated, others are stored. With `stream_zip` the zip file
+        is built uncompressed while it's uploaded.
 
         :param files: Files or folders to send
         :type files: str, list
@@ -190,50 +524,123 @@ class Transfer(object):
         if isinstance(files, basestring):
             files = [files]
 
-        zip_file = None
-        if self.zip_:
-            zip_filename = self._get_zip_filename()
-            zip_file = ZipFile(zip_filename, 'w')
-
+        # Collect files first so checksums may be calculated in parallel
+        pending = []
+        zip_paths = []
         for filename in files:
             if os.path.isdir(filename):
                 for dirname, subdirs, filelist in os.walk(filename):
                     if dirname:
-                        if self.zip_:
-                            zip_file.write(dirname)
+                        zip_paths.append(dirname)
 
                     for fname in filelist:
                         filepath = os.path.join(dirname, fname)
-                        if self.zip_:
-                            zip_file.write(filepath)
-
-                        else:
-                            fmfile = self.get_file_specs(filepath,
-                                                         keep_folders=True)
-                            if fmfile['totalsize'] > 0:
-                                self._files.append(fmfile)
+                        zip_paths.append(filepath)
+                        pending.append((filepath, True))
 
             else:
-                if self.zip_:
-                    zip_file.write(filename)
+                zip_paths.append(filename)
+                pending.append((filename, False))
 
-                else:
-                    fmfile = self.get_file_specs(filename)
-                    self._files.append(fmfile)
+        if self.zip_ and self.stream_zip:
+            self._add_zip_stream(zip_paths)
+            return
 
         if self.zip_:
-            zip_file.close()
-            filename = zip_filename
-            fmfile = self.get_file_specs(filename)
+            zip_filename = self._get_zip_filename()
+            write_zip(zip_paths, zip_filename, self.compress_workers)
+            pending = [(zip_filename, False)]
+
+        def specs(args):
+            return self.get_file_specs(*args)
+
+        fmfiles = pool_map(specs, pending, self.hash_workers)
+
+        for fmfile, (filepath, keep_folders) in zip(fmfiles, pending):
+            # Skip empty files found in folders
+            if keep_folders and fmfile['totalsize'] == 0:
+                continue
+
             self._files.append(fmfile)
 
+    def _add_zip_stream(self, filepaths):
+        """Add a zip archive of `filepaths` that is built while it's
+        uploaded. Its checksum is calculated in the same pass as it's
+        uploaded, so it can't go with the upload. It's stored in the file
+        specs afterwards and compared with the checksum Filemail has of
+        the archive, see :func:`Transfer._verify_stream`.
+
+        :param filepaths: files and folders to put in archive
+        :type filepaths: ``list``
+        """
+
+        stream = ZipStream(filepaths)
+        fileid = str(uuid4()).replace('-', '')
+        transferid, transferkey = self._file_keys()
+
+        specs = {
+            'transferid': transferid,
+            'transferkey': transferkey,
+            'fileid': fileid,
+            'filepath': None,
+            'thefilename': self._get_zip_filename(),
+            'totalsize': stream.size,
+            'md5': None,
+            'content-type': 'application/zip'
+            }
+
+        self._streams[fileid] = stream
+        self._files.append(specs)
+
+    @classmethod
+    def from_journal(cls, fm_user, journal):
+        """Restore an interrupted transfer from its journal. Calling
+        :func:`Transfer.send` on the restored transfer uploads the files
+        missing from the journal.
+
+        :param fm_user: user that owns the transfer
+        :param journal: journal of transfer
+        :type fm_user: :class:`pyfilemail.User`
+        :type journal: :class:`pyfilemail.journal.Journal`
+        :rtype: :class:`Transfer`
+        :raises: :class:`FMFileError` if a file changed since it was added
+        """
+
+        for fmfile in journal.files:
+            if journal.is_uploaded(fmfile):
+                continue
+
+            filepath = fmfile['filepath']
+            if filepath is None:
+                raise FMFileError('Streamed zip files can not be resumed')
+
+            if (not os.path.exists(filepath) or
+                    os.path.getsize(filepath) != fmfile['totalsize']):
+                msg = 'File changed since transfer was started: "{path}"'
+                raise FMFileError(msg.format(path=filepath))
+
+        transfer = cls(fm_user, _restore=True)
+        transfer.transfer_info.update(journal.transfer_info)
+        transfer._files = journal.files
+        transfer._files_loaded = True
+        transfer.journal = True
+        transfer._journal = journal
+
+        return transfer
+
     @property
     def files(self):
-        """:returns: List of files/folders added to transfer
+        """:returns: List of files/folders added to transfer. Files of
+         existing transfers are fetched from Filemail the first time.
+         See :func:`pyfilemail.User.prefetch_files` to fetch files of many
+         transfers at once.
 
         :rtype: ``list``
         """
 
+        if not self._files_loaded:
+            self.get_files()
+
         return self._files
 
     def get_file_specs(self, filepath, keep_folders=False):
@@ -251,14 +658,16 @@ class Transfer(object):
         fileid = str(uuid4()).replace('-', '')
 
         if self.checksum:
-            with open(filepath, 'rb') as f:
-                md5hash = md5(f.read()).digest().encode('base64')[:-1]
+            md5hash = get_md5(filepath, use_mmap=self.mmap_)
+
         else:
             md5hash = None
 
+        transferid, transferkey = self._file_keys()
+
         specs = {
-            'transferid': self.transfer_id,
-            'transferkey': self.transfer_info['transferkey'],
+            'transferid': transferid,
+            'transferkey': transferkey,
             'fileid': fileid,
             'filepath': filepath,
             'thefilename': keep_folders and filepath or filename,
@@ -275,25 +684,20 @@ class Transfer(object):
         :rtype: ``list`` of ``dict`` objects with info on files
         """
 
-        method, url = get_URL('get')
         payload = {
             'apikey': self.session.cookies.get('apikey'),
             'logintoken': self.session.cookies.get('logintoken'),
             'transferid': self.transfer_id,
             }
 
-        res = getattr(self.session, method)(url, params=payload)
-
-        if res.status_code == 200:
-            transfer_data = res.json()['transfer']
-            files = transfer_data['files']
+        res = self.fm_user._api_call('get', payload)
 
-            for file_data in files:
-                self._files.append(file_data)
+        transfer_data = res.json()['transfer']
 
-            return self.files
+        self._files = list(transfer_data['files'])
+        self._files_loaded = True
 
-        hellraiser(res)
+        return self.files
 
     def _get_zip_filename(self):
         """Create a filename for zip file when :class:Transfer.compress is
@@ -308,23 +712,65 @@ class Transfer(object):
         return zip_file
 
     @not_completed
-    def send(self, auto_complete=True, callback=None):
+    def send(self,
+             auto_complete=True,
+             callback=None,
+             workers=1,
+             chunk_size=None,
+             retries=3,
+             retry_delay=RETRY_DELAY,
+             progress=None):
         """Begin uploading file(s) and sending email(s).
         If `auto_complete` is set to ``False`` you will have to call the
         :func:`Transfer.complete` function at a later stage.
+        Files larger than `chunk_size` are uploaded in parts of `chunk_size`
+        bytes. A file or part that fails with a transient error is retried
+        up to `retries` times, waiting a random part of `retry_delay`
+        seconds doubled for every attempt. See :mod:`pyfilemail.retry`.
 
         :param auto_complete: Whether or not to mark transfer as complete
          and send emails to recipient(s)
         :param callback: Callback function which will receive total file size
          and bytes read as arguments
+        :param workers: Number of files to upload at the same time
+        :param chunk_size: Size in bytes of each part. ``None`` uploads
+         files in one piece
+        :param retries: Number of times to retry a failed part
+        :param retry_delay: Seconds to wait before first retry
+        :param progress: Receives progress of all files. Overrides
+         `callback`
         :type auto_complete: ``bool``
         :type callback: ``func``
+        :type workers: ``int``
+        :type chunk_size: ``int``
+        :type retries: ``int``
+        :type retry_delay: ``float``
+        :type progress: :class:`pyfilemail.progress.Progress`
         """
 
+        self._wait_for_probe()
+
+        if self.journal and self._journal is None:
+            self._journal = Journal(self.fm_user.username,
+                                    self.transfer_info,
+                                    self.files)
+            self._journal.save()
+
         tot = len(self.files)
         url = self.transfer_info['transferurl']
 
-        for index, fmfile in enumerate(self.files):
+        transport.ensure_pool_size(url, workers)
+
+        if progress is None:
+            progress = Progress(legacy_callback(callback))
+
+        for fmfile in self.files:
+            progress.add_file(fmfile['fileid'],
+                              fmfile['thefilename'],
+                              fmfile['totalsize'])
+
+        def upload(item):
+            index, fmfile = item
 
             msg = 'Uploading: "{filename}" ({cur}/{tot})'
             logger.debug(
@@ -334,66 +780,242 @@ class Transfer(object):
                     tot=tot)
                 )
 
-            with open(fmfile['filepath'], 'rb') as file_obj:
-                fields = {
-                    fmfile['thefilename']: (
-                        'filename',
-                        file_obj,
-                        fmfile['content-type']
-                        )
-                    }
+            if self._journal and self._journal.is_uploaded(fmfile):
+                msg = 'Skipping uploaded file: "{filename}"'
+                logger.info(msg.format(filename=fmfile['thefilename']))
+                progress.finish(fmfile['fileid'])
+                return
 
-                def pg_callback(monitor):
-                    if pm.COMMANDLINE:
-                        bar.show(monitor.bytes_read)
+            res = self._upload(url,
+                               fmfile,
+                               progress,
+                               chunk_size,
+                               retries,
+                               retry_delay)
 
-                    elif callback is not None:
-                        callback(fmfile['totalsize'], monitor.bytes_read)
+            if self._journal:
+                self._journal.mark_uploaded(fmfile)
 
-                m_encoder = encoder.MultipartEncoder(fields=fields)
-                monitor = encoder.MultipartEncoderMonitor(m_encoder,
-                                                          pg_callback
-                                                          )
-                label = fmfile['thefilename'] + ': '
+            return res
 
-                if pm.COMMANDLINE:
-                    bar = ProgressBar(label=label,
-                                      expected_size=fmfile['totalsize'])
+        renderer = None
+        if pm.COMMANDLINE:
+            renderer = ConsoleRenderer(progress).start()
 
-                headers = {'Content-Type': m_encoder.content_type}
+        # Any failed upload raises here, before the transfer is completed
+        try:
+            responses = pool_map(upload, enumerate(self.files), workers)
 
-                res = self.session.post(url,
-                                        params=fmfile,
-                                        data=monitor,
-                                        headers=headers)
+        finally:
+            if renderer is not None:
+                renderer.stop()
 
-                if res.status_code != 200:
-                    hellraiser(res)
+        responses = [r for r in responses if r is not None]
+        res = responses and responses[-1] or None
 
-        #logger.info('\r')
         if auto_complete:
             return self.complete()
 
         return res
 
+    def _upload(self,
+                url,
+                fmfile,
+                progress,
+                chunk_size=None,
+                retries=0,
+                retry_delay=RETRY_DELAY):
+        """Upload a single file to the fileserver, in parts if it's larger
+        than `chunk_size`. Streamed zip archives are always sent in one piece.
+
+        :param url: transferurl to upload to
+        :param fmfile: file specs from :func:`Transfer.get_file_specs`
+        :param progress: Receives bytes read of file
+        :param chunk_size: Size in bytes of each part
+        :param retries: Number of times to retry a failed file or part
+        :param retry_delay: Seconds of backoff before first retry
+        :type url: ``str``
+        :type fmfile: ``dict``
+        :type progress: :class:`pyfilemail.progress.Progress`
+        :type chunk_size: ``int``
+        :type retries: ``int``
+        :type retry_delay: ``float``
+        :rtype: ``requests.Response``
+        """
+
+        totalsize = fmfile['totalsize']
+        policy = self.fm_user.retry_policy
+
+        def pg_callback(bytes_read):
+            progress.update(fmfile['fileid'], bytes_read)
+
+        def post(params, file_obj, callback):
+            res = self._post_file(url, params, file_obj, callback)
+
+            if res.status_code != 200:
+                hellraiser(res)
+
+            return res
+
+        # Streamed archives go in one piece, started over on every retry
+        stream = self._streams.get(fmfile['fileid'])
+        if stream is not None:
+            def post_stream():
+                stream.rewind()
+                return post(fmfile, stream, pg_callback)
+
+            res = policy.call('upload',
+                              post_stream,
+                              attempts=retries + 1,
+                              backoff=retry_delay)
+
+            fmfile['md5'] = stream.checksum
+            if self.checksum:
+                self._verify_stream(fmfile)
+
+            return res
+
+        with open(fmfile['filepath'], 'rb') as file_obj:
+            if not chunk_size or totalsize <= chunk_size:
+                chunk_size = totalsize or 1
+
+            chunks = (totalsize + chunk_size - 1) // chunk_size
+
+            for chunk in xrange(max(chunks, 1)):
+                offset = chunk * chunk_size
+                length = min(chunk_size, totalsize - offset)
+
+                params = fmfile
+                if chunks > 1:
+                    params = dict(fmfile, chunk=chunk, chunks=chunks)
+
+                def part_callback(bytes_read, offset=offset):
+                    pg_callback(offset + bytes_read)
+
+                def post_part(offset=offset, length=length, params=params):
+                    part = FileChunk(file_obj, offset, length)
+                    return post(params, part, part_callback)
+
+                res = policy.call('upload',
+                                  post_part,
+                                  attempts=retries + 1,
+                                  backoff=retry_delay)
+
+        return res
+
+    def _verify_stream(self, fmfile):
+        """Compare the md5 of a streamed archive, calculated while it was
+        uploaded, with the md5 Filemail has of the stored file.
+
+        :param fmfile: file specs of uploaded archive
+        :type fmfile: ``dict``
+        :rtype: ``bool`` ``True`` if verified, ``None`` if Filemail has no
+         checksum of it
+        :raises: :class:`ChecksumMismatch` if the checksums differ
+        """
+
+        payload = {
+            'apikey': self.session.cookies.get('apikey'),
+            'logintoken': self.session.cookies.get('logintoken'),
+            'transferid': self.transfer_id,
+            }
+
+        try:
+            res = self.fm_user._api_call('get', payload)
+            stored = res.json()['transfer'].get('files') or []
+
+        except (FileMailBaseError, RequestException, ValueError,
+                KeyError) as e:
+            msg = 'Could not verify "{filename}": {error}'
+            logger.warning(msg.format(filename=fmfile['thefilename'],
+                                      error=e))
+            return None
+
+        checksum = None
+        for remote in stored:
+            if (remote.get('fileid') == fmfile['fileid'] or
+                    remote.get('filename') == fmfile['thefilename']):
+                checksum = normalize_md5(remote.get('md5'))
+                break
+
+        if checksum is None:
+            msg = 'Filemail has no checksum of "{filename}", not verified'
+            logger.warning(msg.format(filename=fmfile['thefilename']))
+            return None
+
+        if checksum != fmfile['md5']:
+            msg = 'Checksum of uploaded "{filename}" doesn\'t match'
+            raise ChecksumMismatch(msg.format(filename=fmfile['thefilename']))
+
+        return True
+
+    def _post_file(self, url, params, file_obj, pg_callback):
+        """POST file content as multipart form data to the fileserver.
+
+        :param url: transferurl to upload to
+        :param params: file specs sent as query parameters
+        :param file_obj: file like object to read content from
+        :param pg_callback: function receiving bytes read so far
+        :type url: ``str``
+        :type params: ``dict``
+        :type file_obj: ``file``
+        :type pg_callback: ``func``
+        :rtype: ``requests.Response``
+        """
+
+        fields = {
+            params['thefilename']: (
+                'filename',
+                file_obj,
+                params['content-type']
+                )
+            }
+
+        m_encoder = encoder.MultipartEncoder(fields=fields)
+        monitor = encoder.MultipartEncoderMonitor(
+            m_encoder,
+            lambda monitor: pg_callback(monitor.bytes_read)
+            )
+
+        headers = {'Content-Type': m_encoder.content_type}
+
+        # Always throttle so limits set during upload take effect
+        data = ratelimit.ThrottledReader(monitor, self._rate_limits('upload'))
+
+        return self.session.post(url,
+                                 params=params,
+                                 data=data,
+                                 headers=headers)
+
+    def _rate_limits(self, direction):
+        """Rate limits applying to transfers in `direction`.
+
+        :param direction: "upload" or "download"
+        :type direction: ``str``
+        :rtype: ``list`` of :class:`pyfilemail.ratelimit.TokenBucket`
+        """
+
+        attr = direction + '_limit'
+        buckets = [getattr(self.fm_user, attr), getattr(ratelimit, attr)]
+
+        return [bucket for bucket in buckets if bucket is not None]
+
     def complete(self):
         """Completes the transfer and shoots off email(s) to recipient(s)."""
 
-        method, url = get_URL('complete')
-
         payload = {
             'apikey': self.session.cookies.get('apikey'),
             'transferid': self.transfer_id,
             'transferkey': self.transfer_info['transferkey']
             }
 
-        res = getattr(self.session, method)(url, params=payload)
-
-        if res.status_code != 200:
-            hellraiser(res)
+        res = self.fm_user._api_call('complete', payload)
 
         self._complete = True
 
+        if self._journal:
+            self._journal.remove()
+
         return res
 
     @property
@@ -428,8 +1050,6 @@ class Transfer(object):
 
         """
 
-        method, url = get_URL('forward')
-
         payload = {
             'apikey': self.session.cookies.get('apikey'),
             'transferid': self.transfer_id,
@@ -437,12 +1057,9 @@ class Transfer(object):
             'to': self._parse_recipients(to)
             }
 
-        res = getattr(self.session, method)(url, params=payload)
-
-        if res.status_code == 200:
-            return True
+        self.fm_user._api_call('forward', payload)
 
-        hellraiser(res)
+        return True
 
     @login_required
     def share(self, to, sender=None, message=None):
@@ -457,8 +1074,6 @@ class Transfer(object):
         :rtyep: ``bool``
         """
 
-        method, url = get_URL('share')
-
         payload = {
             'apikey': self.session.cookies.get('apikey'),
             'logintoken': self.session.cookies.get('logintoken'),
@@ -468,12 +1083,9 @@ class Transfer(object):
             'message': message or ''
             }
 
-        res = getattr(self.session, method)(url, params=payload)
+        self.fm_user._api_call('share', payload)
 
-        if res.status_code == 200:
-            return True
-
-        hellraiser(res)
+        return True
 
     def cancel(self):
         """Cancel the current transfer.
@@ -481,21 +1093,16 @@ class Transfer(object):
         :rtype: ``bool``
         """
 
-        method, url = get_URL('cancel')
-
         payload = {
             'apikey': self.config.get('apikey'),
             'transferid': self.transfer_id,
             'transferkey': self.transfer_info.get('transferkey')
             }
 
-        res = getattr(self.session, method)(url, params=payload)
-
-        if res.status_code == 200:
-            self._complete = True
-            return True
+        self.fm_user._api_call('cancel', payload)
 
-        hellraiser(res)
+        self._complete = True
+        return True
 
     @login_required
     def delete(self):
@@ -504,20 +1111,15 @@ class Transfer(object):
         :rtype: ``bool``
         """
 
-        method, url = get_URL('delete')
-
         payload = {
             'apikey': self.config.get('apikey'),
             'logintoken': self.session.cookies.get('logintoken'),
             'transferid': self.transfer_id
             }
 
-        res = getattr(self.session, method)(url, params=payload)
-
-        if res.status_code == 200:
-            return True
+        self.fm_user._api_call('delete', payload)
 
-        hellraiser(res)
+        return True
 
     @login_required
     def rename_file(self, fmfile, newname):
@@ -533,8 +1135,6 @@ class Transfer(object):
         if not isinstance(fmfile, dict):
             raise FMBaseError('fmfile must be a <dict>')
 
-        method, url = get_URL('file_rename')
-
         payload = {
             'apikey': self.config.get('apikey'),
             'logintoken': self.session.cookies.get('logintoken'),
@@ -542,12 +1142,10 @@ class Transfer(object):
             'filename': newname
             }
 
-        res = getattr(self.session, method)(url, params=payload)
-        if res.status_code == 200:
-            self._complete = True
-            return True
+        self.fm_user._api_call('file_rename', payload)
 
-        hellraiser(res)
+        self._complete = True
+        return True
 
     @login_required
     def delete_file(self, fmfile):
@@ -561,21 +1159,16 @@ class Transfer(object):
         if not isinstance(fmfile, dict):
             raise FMFileError('fmfile must be a <dict>')
 
-        method, url = get_URL('file_delete')
-
         payload = {
             'apikey': self.config.get('apikey'),
             'logintoken': self.session.cookies.get('logintoken'),
             'fileid': fmfile.get('fileid')
             }
 
-        res = getattr(self.session, method)(url, params=payload)
-
-        if res.status_code == 200:
-            self._complete = True
-            return True
+        self.fm_user._api_call('file_delete', payload)
 
-        hellraiser(res)
+        self._complete = True
+        return True
 
     @login_required
     def update(self,
@@ -599,8 +1192,6 @@ class Transfer(object):
         :rtype: ``bool``
         """
 
-        method, url = get_URL('update')
-
         payload = {
             'apikey': self.config.get('apikey'),
             'logintoken': self.session.cookies.get('logintoken'),
@@ -617,31 +1208,61 @@ class Transfer(object):
 
         payload.update(data)
 
-        res = getattr(self.session, method)(url, params=payload)
-
-        if res.status_code:
-            self.transfer_info.update(data)
-            return True
+        self.fm_user._api_call('update', payload)
 
-        hellraiser(res)
+        self.transfer_info.update(data)
+        return True
 
     def download(self,
                  files=None,
                  destination=None,
                  overwrite=False,
-                 callback=None):
+                 callback=None,
+                 progress=None,
+                 workers=1,
+                 segments=1,
+                 min_segment_size=SEGMENT_MIN_SIZE,
+                 verify=True,
+                 retries=1,
+                 replace=False):
 
         """Download file or files.
+        A file that fails to download doesn't stop the others. Check the
+        returned report for failures. Existing files are skipped unless
+        `replace` is set, or their size differs from the file on Filemail.
 
         :param files: file or files to download
         :param destination: destination path (defaults to users home directory)
-        :param overwrite: replace existing files?
+        :param overwrite: ignored, kept for compatibility. Use `replace`
         :param callback: callback function that will receive total file size
          and written bytes as arguments
+        :param progress: Receives progress of all files. Overrides
+         `callback`
+        :param workers: Number of files to download at the same time
+        :param segments: Split large files in this many byte ranges
+         downloaded over separate connections
+        :param min_segment_size: Smallest byte range worth a connection
+        :param verify: Compare md5 of downloaded files with the md5 from
+         Filemail
+        :param retries: Times to download a file again when the checksum
+         doesn't match
+        :param replace: Download existing files again and replace them
         :type files: ``list`` of ``dict`` with file data from filemail
         :type destination: ``str`` or ``unicode``
         :type overwrite: ``bool``
         :type callback: ``func``
+        :type progress: :class:`pyfilemail.progress.Progress`
+        :type workers: ``int``
+        :type segments: ``int``
+        :type min_segment_size: ``int``
+        :type verify: ``bool``
+        :type retries: ``int``
+        :type replace: ``bool``
+        :rtype: ``dict`` with number of files ``downloaded``, ``skipped`` and
+         ``failed``, a ``verification`` ``dict`` counting files ``verified``,
+         ``mismatched`` and ``unverified``, and a ``files`` ``list`` with
+         ``filename``, ``path``, ``status``, ``verified`` and ``error`` of
+         every file
         """
 
         if files is None:
@@ -653,64 +1274,600 @@ class Transfer(object):
         if destination is None:
             destination = os.path.expanduser('~')
 
+        if progress is None:
+            progress = Progress(legacy_callback(callback))
+
         for f in files:
             if not isinstance(f, dict):
                 raise FMBaseError('File must be a <dict> with file data')
 
-            self._download(f, destination, overwrite, callback)
+            progress.add_file(self._file_key(f),
+                              f.get('filename'),
+                              f.get('filesize'))
+
+        for url in set(f.get('downloadurl') for f in files):
+            if url:
+                transport.ensure_pool_size(url, workers * max(segments, 1))
+
+        def download(fmfile):
+            return self._download_result(fmfile,
+                                         destination,
+                                         replace,
+                                         progress,
+                                         segments,
+                                         min_segment_size,
+                                         verify,
+                                         retries)
+
+        renderer = None
+        if pm.COMMANDLINE:
+            renderer = ConsoleRenderer(progress).start()
+
+        try:
+            results = pool_map(download, files, workers)
+
+        finally:
+            if renderer is not None:
+                renderer.stop()
+
+        report = {'files': results}
+        for status in ('downloaded', 'skipped', 'failed'):
+            report[status] = len([r for r in results
+                                  if r['status'] == status])
+
+        report['verification'] = {
+            'verified': len([r for r in results if r['verified'] is True]),
+            'mismatched': len([r for r in results if r['verified'] is False]),
+            'unverified': len([r for r in results if r['verified'] is None])
+            }
+
+        return report
+
+    def _download_result(self, fmfile, destination, *args):
+        """Download a single file and report how it went instead of raising.
+        Takes the same arguments as :func:`Transfer._download`.
+
+        :rtype: ``dict`` with ``filename``, ``path``, ``status``,
+         ``verified`` and ``error``
+        """
+
+        result = {
+            'filename': fmfile.get('filename'),
+            'path': os.path.join(destination, fmfile.get('filename')),
+            'status': None,
+            'verified': None,
+            'error': None
+            }
+
+        try:
+            result['status'], result['verified'] = self._download(fmfile,
+                                                                  destination,
+                                                                  *args)
+
+        except ChecksumMismatch as e:
+            logger.error(str(e))
+
+            result['status'] = 'failed'
+            result['verified'] = False
+            result['error'] = str(e)
 
-    def _download(self, fmfile, destination, overwrite, callback):
+        except (FileMailBaseError, FMBaseError, RequestException,
+                EnvironmentError) as e:
+            msg = 'Failed to download "{filename}": {error}'
+            logger.error(msg.format(filename=result['filename'], error=e))
+
+            result['status'] = 'failed'
+            result['error'] = str(e)
+
+        return result
+
+    def _file_key(self, fmfile):
+        """Key identifying file data from Filemail in progress reports.
+
+        :rtype: ``str``
+        """
+
+        return fmfile.get('fileid') or fmfile.get('filename')
+
+    def _download(self,
+                  fmfile,
+                  destination,
+                  replace,
+                  progress,
+                  segments=1,
+                  min_segment_size=SEGMENT_MIN_SIZE,
+                  verify=False,
+                  retries=0):
         """The actual downloader streaming content from Filemail.
 
         :param fmfile: to download
         :param destination: destination path
-        :param overwrite: replace existing files?
-        :param callback: callback function that will receive total file size
-         and written bytes as arguments
+        :param replace: replace existing files?
+        :param progress: Receives written bytes of file
+        :param segments: Split file in this many byte ranges
+        :param min_segment_size: Smallest byte range
+        :param verify: Compare md5 with the one from Filemail
+        :param retries: Times to download again on checksum mismatch
         :type fmfile: ``dict``
         :type destination: ``str`` or ``unicode``
-        :type overwrite: ``bool``
-        :type callback: ``func``
+        :type replace: ``bool``
+        :type progress: :class:`pyfilemail.progress.Progress`
+        :type segments: ``int``
+        :type min_segment_size: ``int``
+        :type verify: ``bool``
+        :type retries: ``int``
+        :rtype: (``str`` "downloaded" or "skipped", ``bool`` verified or
+         ``None`` if not checked)
+        :raises: :class:`ChecksumMismatch` when retries are used up
         """
 
         fullpath = os.path.join(destination, fmfile.get('filename'))
         path, filename = os.path.split(fullpath)
+        key = self._file_key(fmfile)
 
-        if os.path.exists(fullpath):
-            msg = 'Skipping existing file: {filename}'
-            logger.info(msg.format(filename=filename))
-            return
+        partpath = fullpath + PART_SUFFIX
+
+        if os.path.exists(fullpath) and not replace:
+            size = int(fmfile.get('filesize') or 0)
+            existing = os.path.getsize(fullpath)
+
+            if not size or existing == size:
+                msg = 'Skipping existing file: {filename}'
+                logger.info(msg.format(filename=filename))
+                progress.finish(key)
+                return 'skipped', None
 
-        filesize = fmfile.get('filesize')
+            msg = ('Existing file "{filename}" is {existing} bytes, expected '
+                   '{size}. Downloading it again')
+            logger.warning(msg.format(filename=filename,
+                                      existing=existing,
+                                      size=size))
+
+            # A file cut short, e.g. by an older version, is resumed if
+            # the checksum tells whether what's there was any good
+            resume = verify and existing < size
+            if resume and not os.path.exists(partpath):
+                replace_file(fullpath, partpath)
 
         if not os.path.exists(path):
-            os.makedirs(path)
+            try:
+                os.makedirs(path)
+
+            except OSError:
+                # Another download may have created it meanwhile
+                if not os.path.isdir(path):
+                    raise
+
+        expected = verify and normalize_md5(fmfile.get('md5')) or None
+
+        for attempt in xrange(retries + 1):
+            checksum = self._fetch(fmfile,
+                                   partpath,
+                                   progress,
+                                   segments,
+                                   min_segment_size,
+                                   expected is not None)
+
+            if checksum == expected:
+                break
+
+            corruptpath = fullpath + CORRUPT_SUFFIX
+            replace_file(partpath, corruptpath)
+
+            msg = ('Checksum of "{filename}" doesn\'t match, kept as '
+                   '{corruptpath}')
+            logger.warning(msg.format(filename=filename,
+                                      corruptpath=corruptpath))
 
+        else:
+            msg = 'Checksum of "{filename}" doesn\'t match after {n} tries'
+            raise ChecksumMismatch(msg.format(filename=filename,
+                                              n=retries + 1))
+
+        replace_file(partpath, fullpath)
+
+        marker = partpath + SEGMENTED_SUFFIX
+        if os.path.exists(marker):
+            os.remove(marker)
+
+        return 'downloaded', True if expected else None
+
+    def _fetch(self,
+               fmfile,
+               partpath,
+               progress,
+               segments,
+               min_segment_size,
+               checksum):
+        """Download `fmfile` to `partpath`, resuming from bytes already in
+        it. The md5 is calculated while the data is written, except for
+        segmented downloads which are read back once complete.
+
+        :param fmfile: to download
+        :param partpath: path of .part file
+        :param progress: Receives written bytes of file
+        :param segments: Split file in this many byte ranges
+        :param min_segment_size: Smallest byte range
+        :param checksum: Calculate md5?
+        :type fmfile: ``dict``
+        :type partpath: ``str`` or ``unicode``
+        :type progress: :class:`pyfilemail.progress.Progress`
+        :type segments: ``int``
+        :type min_segment_size: ``int``
+        :type checksum: ``bool``
+        :rtype: ``str`` base64 encoded md5 or ``None``
+        :raises: :class:`FMBaseError` if the download is incomplete
+        """
+
+        filename = fmfile.get('filename')
+        key = self._file_key(fmfile)
         url = fmfile.get('downloadurl')
-        stream = self.session.get(url, stream=True)
+        size = int(fmfile.get('filesize') or 0)
+        offset = self._part_offset(partpath, size)
 
-        def pg_callback(bytes_written):
-            if pm.COMMANDLINE:
-                bar.show(bytes_written)
+        written = [offset]
+        lock = threading.Lock()
 
-            elif callback is not None:
-                callback(filesize, bytes_written)
+        def advance(nbytes):
+            with lock:
+                written[0] += nbytes
+                progress.update(key, written[0])
 
-        if pm.COMMANDLINE:
-            label = fmfile['filename'] + ': '
-            bar = ProgressBar(label=label, expected_size=filesize)
+        if offset:
+            msg = 'Resuming {filename} at {offset} bytes'
+            logger.info(msg.format(filename=filename, offset=offset))
+
+        progress.update(key, offset)
+
+        ranges = self._segment_ranges(size,
+                                      segments,
+                                      min_segment_size,
+                                      offset)
+
+        # Hashed along the way unless the file is written out of order
+        md5hash = None
+
+        if size and offset == size:
+            stream = None
+
+        elif len(ranges) > 1:
+            first, last = ranges[0]
+            header = {'Range': 'bytes={0}-{1}'.format(first, last)}
+            stream = self.session.get(url, headers=header, stream=True)
+
+            if stream.status_code == 206:
+                self._download_segments(url,
+                                        partpath,
+                                        size,
+                                        ranges,
+                                        stream,
+                                        advance)
+                stream = None
+
+            else:
+                msg = ('Server ignored Range, downloading {filename} in one '
+                       'piece')
+                logger.debug(msg.format(filename=filename))
+
+        elif offset:
+            header = {'Range': 'bytes={0}-'.format(offset)}
+            stream = self.session.get(url, headers=header, stream=True)
+
+        else:
+            stream = self.session.get(url, stream=True)
+
+        if stream is not None:
+            if stream.status_code == 206:
+                self._check_content_range(stream, offset)
+                mode = 'ab'
+
+            elif stream.status_code == 200:
+                mode = 'wb'
+                if offset:
+                    written[0] = 0
+                    progress.update(key, 0)
+
+            else:
+                hellraiser(stream)
+
+            if checksum:
+                md5hash = md5()
+                if mode == 'ab':
+                    with open(partpath, 'rb') as f:
+                        self._hash_file(md5hash, f, offset)
+
+            with open(partpath, mode) as f:
+                self._write_stream(stream, f, advance, md5hash)
+
+        received = os.path.getsize(partpath)
+        if size and received != size:
+            msg = ('Download of "{filename}" stopped at {received} of {size} '
+                   'bytes. Run again to resume')
+            raise FMBaseError(msg.format(filename=filename,
+                                         received=received,
+                                         size=size))
+
+        if not checksum:
+            return None
+
+        if md5hash is None:
+            return get_md5(partpath)
+
+        return md5hash.digest().encode('base64')[:-1]
+
+    @staticmethod
+    def _part_offset(partpath, size):
+        """Number of bytes to resume a download from. Parts that can't be
+        resumed are removed.
+
+        :param partpath: path of .part file
+        :param size: expected size of file
+        :type partpath: ``str`` or ``unicode``
+        :type size: ``int``
+        :rtype: ``int``
+        """
+
+        if not os.path.exists(partpath):
+            return 0
+
+        offset = os.path.getsize(partpath)
+        marker = partpath + SEGMENTED_SUFFIX
+
+        if os.path.exists(marker) or not size or offset > size:
+            os.remove(partpath)
+            if os.path.exists(marker):
+                os.remove(marker)
+
+            return 0
+
+        return offset
+
+    @staticmethod
+    def _check_content_range(stream, offset):
+        """Make sure a partial response starts at `offset`.
+
+        :raises: :class:`FMBaseError` if it doesn't
+        """
+
+        content_range = stream.headers.get('Content-Range', '')
+
+        try:
+            first = int(content_range.split()[1].split('-')[0])
+
+        except (IndexError, ValueError):
+            first = None
+
+        if first != offset:
+            msg = 'Expected content from byte {offset}, got "{header}"'
+            raise FMBaseError(msg.format(offset=offset, header=content_range))
+
+    @staticmethod
+    def _segment_ranges(size, segments, min_segment_size, start=0):
+        """Split bytes `start` to `size` in inclusive byte ranges of at least
+        `min_segment_size` bytes.
+
+        :rtype: ``list`` of (first, last) byte tuples
+        """
+
+        count = min(segments, (size - start) // max(min_segment_size, 1))
+        if count < 2:
+            return [(start, size - 1)]
+
+        length = size - start
+        bounds = [start + length * i // count for i in xrange(count + 1)]
+
+        return [(bounds[i], bounds[i + 1] - 1) for i in xrange(count)]
+
+    @staticmethod
+    def _hash_file(md5hash, file_obj, length):
+        """Feed first `length` bytes of `file_obj` to `md5hash`."""
+
+        while length > 0:
+            block = file_obj.read(min(CHECKSUM_BLOCKSIZE, length))
+            if not block:
+                break
+
+            md5hash.update(block)
+            length -= len(block)
+
+    def _write_stream(self, stream, file_obj, advance, md5hash=None):
+        """Write content of `stream` to `file_obj` at its current position.
+
+        :param stream: response opened with ``stream=True``
+        :param file_obj: file to write to
+        :param advance: called with number of bytes after each write
+        :param md5hash: updated with every chunk written
+        :type stream: :class:`requests.Response`
+        :type file_obj: ``file``
+        :type advance: ``func``
+        :type md5hash: :func:`hashlib.md5` object
+        :rtype: ``int`` bytes written
+        """
+
+        # Smaller chunks keep throttled downloads smooth
+        buckets = self._rate_limits('download')
+        if any(bucket.limited for bucket in buckets):
+            chunk_size = THROTTLED_CHUNK_SIZE
+
+        else:
+            chunk_size = DOWNLOAD_CHUNK_SIZE
 
         bytes_written = 0
-        with open(fullpath, 'wb') as f:
-            for chunk in stream.iter_content(chunk_size=1024 * 1024):
-                if not chunk:
-                    break
+        for chunk in stream.iter_content(chunk_size=chunk_size):
+            if not chunk:
+                break
+
+            ratelimit.consume(buckets, len(chunk))
+
+            file_obj.write(chunk)
+            bytes_written += len(chunk)
+
+            if md5hash is not None:
+                md5hash.update(chunk)
+
+            advance(len(chunk))
+
+        return bytes_written
+
+    def _download_segments(self, url, partpath, size, ranges, first, advance):
+        """Download byte `ranges` of `url` over separate connections.
+        The file is allocated up front and every segment is written at its
+        offset through its own file handle. Bytes before the first range
+        are kept.
+
+        :param url: download url
+        :param partpath: file to write
+        :param size: total size of file
+        :param ranges: (first, last) byte tuples from
+         :func:`Transfer._segment_ranges`
+        :param first: already opened response for the first range
+        :param advance: called with number of bytes after each write
+        :type url: ``str``
+        :type partpath: ``str`` or ``unicode``
+        :type size: ``int``
+        :type ranges: ``list``
+        :type first: :class:`requests.Response`
+        :type advance: ``func``
+        """
+
+        # Size of file no longer tells how much is downloaded
+        open(partpath + SEGMENTED_SUFFIX, 'wb').close()
+
+        with open(partpath, 'ab') as f:
+            writer.preallocate(f, size)
+
+        def fetch(segment):
+            (start, end), stream = segment
 
-                f.write(chunk)
-                bytes_written += len(chunk)
+            if stream is None:
+                header = {'Range': 'bytes={0}-{1}'.format(start, end)}
+                stream = self.session.get(url, headers=header, stream=True)
 
-                # Callback
-                pg_callback(bytes_written)
+            if stream.status_code != 206:
+                if stream.status_code == 200:
+                    msg = 'Server stopped honouring Range requests'
+                    raise FMBaseError(msg)
+
+                hellraiser(stream)
+
+            # Including the first response, opened before the others
+            self._check_content_range(stream, start)
+
+            with open(partpath, 'r+b') as f:
+                f.seek(start)
+                received = self._write_stream(stream, f, advance)
+
+            if received != end - start + 1:
+                msg = 'Got {received} of {expected} bytes at offset {start}'
+                raise FMBaseError(msg.format(received=received,
+                                             expected=end - start + 1,
+                                             start=start))
+
+        segments = zip(ranges, [first] + [None] * (len(ranges) - 1))
+        pool_map(fetch, segments, len(segments))
+
+    def extract(self,
+                destination=None,
+                url=None,
+                callback=None,
+                progress=None):
+        """Download the zip archive made by :func:`Transfer.compress` and
+        extract it to `destination` while it's downloading. The archive
+        itself is never stored.
+
+        :param destination: destination path (defaults to users home directory)
+        :param url: url of archive, defaults to ``compressedfileurl`` of
+         transfer
+        :param callback: callback function that will receive total file size
+         and written bytes of each extracted file as arguments
+        :param progress: Receives progress of each extracted file. Overrides
+         `callback`
+        :type destination: ``str`` or ``unicode``
+        :type url: ``str``
+        :type callback: ``func``
+        :type progress: :class:`pyfilemail.progress.Progress`
+        :rtype: ``list`` of extracted paths
+        :raises: :class:`FMFileError` on broken or unsupported archives
+        """
+
+        url = url or self.transfer_info.get('compressedfileurl')
+        if not url:
+            msg = 'No compressed archive of transfer. Call compress() first'
+            raise FMBaseError(msg)
+
+        if destination is None:
+            destination = os.path.expanduser('~')
+
+        if progress is None:
+            progress = Progress(legacy_callback(callback))
+
+        sizes = self._zip_sizes(url)
+
+        stream = self.session.get(url, stream=True)
+        if stream.status_code != 200:
+            hellraiser(stream)
+
+        stream.raw.decode_content = True
+        reader = ratelimit.ThrottledReader(stream.raw,
+                                           self._rate_limits('download'))
+
+        renderer = None
+        if pm.COMMANDLINE:
+            renderer = ConsoleRenderer(progress).start()
+
+        try:
+            return extract_zip(reader, destination, progress, sizes)
+
+        finally:
+            stream.close()
+
+            if renderer is not None:
+                renderer.stop()
+
+    def _zip_sizes(self, url):
+        """Sizes of entries in zip archive at `url` from its central
+        directory, fetched with Range requests. Used for progress of
+        entries that only have their size after their data.
+
+        :param url: url of archive
+        :type url: ``str``
+        :rtype: ``dict`` with arcname: size. Empty if the server ignores
+         Range
+        """
+
+        header = {'Range': 'bytes=-{0}'.format(END_RECORD_MAX_SIZE)}
+        res = self.session.get(url, headers=header)
+        if res.status_code != 206:
+            return {}
+
+        tail = res.content
+
+        try:
+            total = int(res.headers['Content-Range'].rsplit('/', 1)[1])
+
+        except (KeyError, IndexError, ValueError):
+            return {}
+
+        location = find_central_directory(tail)
+        if location is None:
+            return {}
+
+        offset, size = location
+        start = offset - (total - len(tail))
+
+        if start >= 0:
+            central = tail[start:start + size]
+
+        else:
+            last = offset + size - 1
+            header = {'Range': 'bytes={0}-{1}'.format(offset, last)}
+            res = self.session.get(url, headers=header)
+            if res.status_code != 206:
+                return {}
+
+            central = res.content
+
+        return read_central_directory(central)
 
     @login_required
     def compress(self):
@@ -720,20 +1877,15 @@ class Transfer(object):
         :rtype: ``bool``
         """
 
-        method, url = get_URL('compress')
-
         payload = {
             'apikey': self.config.get('apikey'),
             'logintoken': self.session.cookies.get('logintoken'),
             'transferid': self.transfer_id
             }
 
-        res = getattr(self.session, method)(url, params=payload)
-
-        if res.status_code == 200:
-            return True
+        self.fm_user._api_call('compress', payload)
 
-        hellraiser(res)
+        return True
 
     def __getitem__(self, key):
         return self.transfer_info[key]
@@ -0,0 +1,298 @@
+import inspect
+import threading
+from urlparse import urlparse
+
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.poolmanager import PoolManager
+
+try:
+    from requests.packages.urllib3.poolmanager import PoolKey
+
+except ImportError:
+    PoolKey = None
+
+from pyfilemail import logger
+
+# Seconds to wait for a connection to be established
+CONNECT_TIMEOUT = 10
+
+# Seconds to wait for the server between bytes received
+READ_TIMEOUT = 120
+
+# Connections kept alive per host unless set with set_pool_size
+POOL_SIZE = 10
+
+# Number of hosts, i.e. Filemail and its fileservers, kept connections to
+NUM_POOLS = 32
+
+_adapter = None
+_lock = threading.Lock()
+
+
+def _has_pool_internals():
+    """Whether urllib3 has the internals :class:`HostPoolManager` relies
+    on, i.e. the pool factory, pool keys and dispose callback of the
+    urllib3 versions pinned in setup.py.
+
+    :rtype: ``bool``
+    """
+
+    try:
+        args = inspect.getargspec(PoolManager._new_pool).args
+
+    except (AttributeError, TypeError):
+        return False
+
+    return ('request_context' in args and
+            'key_host' in getattr(PoolKey, '_fields', ()) and
+            hasattr(PoolManager(num_pools=1).pools, 'dispose_func'))
+
+
+# Pools are sized per host if urllib3 allows it. Otherwise every pool gets
+# the largest size asked for and pools already made keep their size
+PER_HOST_POOLS = _has_pool_internals()
+if not PER_HOST_POOLS:
+    logger.debug('Unsupported urllib3 version. Pools are not sized per host')
+
+# Pool sizes by host name
+_pool_sizes = {}
+
+# Requests and connections of pools no longer in use by host name
+_retired = {}
+
+
+def _grow(pool, size):
+    """Let an existing connection pool hold `size` connections without
+    dropping the connections it keeps alive.
+
+    :param pool: connection pool of a host
+    :param size: number of connections
+    :type pool: :class:`urllib3.connectionpool.HTTPConnectionPool`
+    :type size: ``int``
+    """
+
+    queue = pool.pool
+    if queue is None:
+        # Pool is closed
+        return
+
+    if not all(hasattr(queue, attr)
+               for attr in ('mutex', 'maxsize', 'not_empty', 'queue')):
+        # Not a standard library queue, leave it be
+        return
+
+    with queue.mutex:
+        extra = size - queue.maxsize
+        if extra <= 0:
+            return
+
+        # Empty slots go at the bottom so idle connections are used first.
+        # urllib3 keeps them in a deque, the standard library in a list
+        queue.maxsize = size
+        if hasattr(queue.queue, 'extendleft'):
+            queue.queue.extendleft([None] * extra)
+
+        else:
+            queue.queue[:0] = [None] * extra
+
+        queue.not_empty.notify(extra)
+
+
+class HostPoolManager(PoolManager):
+    """Pool manager sizing the connection pool of each host by
+    :func:`set_pool_size` and keeping count of requests made through
+    pools it has let go.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(HostPoolManager, self).__init__(*args, **kwargs)
+
+        self.pools.dispose_func = self._retire
+
+    def _new_pool(self, scheme, host, port, request_context=None):
+        if request_context is None:
+            request_context = self.connection_pool_kw.copy()
+
+        request_context['maxsize'] = _pool_sizes.get(host, POOL_SIZE)
+
+        return super(HostPoolManager, self)._new_pool(scheme,
+                                                      host,
+                                                      port,
+                                                      request_context)
+
+    def _retire(self, pool):
+        with _lock:
+            counts = _retired.setdefault(pool.host, [0, 0])
+            counts[0] += pool.num_requests
+            counts[1] += pool.num_connections
+
+    def grow(self, host, size):
+        """Grow pools of `host` already made to `size` connections."""
+
+        for key in self.pools.keys():
+            if key.key_host == host:
+                pool = self.pools.get(key)
+                if pool is not None:
+                    _grow(pool, size)
+
+
+class TransportAdapter(HTTPAdapter):
+    """Adapter shared by the sessions of all users in the process, so
+    connections to Filemail and its fileservers are kept alive and reused
+    across :class:`pyfilemail.User` and :class:`pyfilemail.Transfer`
+    objects. Requests without a timeout get ``(CONNECT_TIMEOUT,
+    READ_TIMEOUT)``.
+    """
+
+    def init_poolmanager(self, connections, *args, **kwargs):
+        super(TransportAdapter, self).init_poolmanager(connections,
+                                                       *args,
+                                                       **kwargs)
+
+        if not PER_HOST_POOLS:
+            return
+
+        # Same settings as requests uses, sized per host
+        pool_kw = self.poolmanager.connection_pool_kw
+        self.poolmanager = HostPoolManager(num_pools=connections, **pool_kw)
+
+    def send(self, request, **kwargs):
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = (CONNECT_TIMEOUT, READ_TIMEOUT)
+
+        return super(TransportAdapter, self).send(request, **kwargs)
+
+
+def get_adapter():
+    """Adapter shared by all sessions.
+
+    :rtype: :class:`TransportAdapter`
+    """
+
+    global _adapter
+
+    with _lock:
+        if _adapter is None:
+            _adapter = TransportAdapter(pool_connections=NUM_POOLS,
+                                        pool_maxsize=POOL_SIZE)
+
+        return _adapter
+
+
+def mount(session):
+    """Make `session` use the shared connections.
+
+    :param session: session of a user
+    :type session: :class:`requests.Session`
+    :rtype: :class:`requests.Session`
+    """
+
+    adapter = get_adapter()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+
+    return session
+
+
+def set_timeouts(connect=None, read=None):
+    """Change default timeouts of all requests. Requests already running
+    keep their timeouts.
+
+    :param connect: seconds to wait for a connection
+    :param read: seconds to wait for the server between bytes received
+    :type connect: ``int`` or ``float``
+    :type read: ``int`` or ``float``
+    """
+
+    global CONNECT_TIMEOUT, READ_TIMEOUT
+
+    if connect is not None:
+        CONNECT_TIMEOUT = connect
+
+    if read is not None:
+        READ_TIMEOUT = read
+
+
+def set_pool_size(size, host=None):
+    """Set number of connections kept alive to `host`, or to hosts
+    without a size of their own when no `host` is given. Pools of hosts
+    already connected to grow right away and shrink once recreated. See
+    :data:`PER_HOST_POOLS` for urllib3 versions without per host pools.
+
+    :param size: number of connections
+    :param host: host name, e.g. "www.filemail.com"
+    :type size: ``int``
+    :type host: ``str``
+    """
+
+    global POOL_SIZE
+
+    with _lock:
+        if host is None:
+            POOL_SIZE = size
+
+        else:
+            _pool_sizes[host] = size
+
+    if PER_HOST_POOLS:
+        if host is not None:
+            get_adapter().poolmanager.grow(host, size)
+
+        return
+
+    # Pools made from now on fit the largest size of any host
+    pool_kw = get_adapter().poolmanager.connection_pool_kw
+    pool_kw['maxsize'] = max([POOL_SIZE] + _pool_sizes.values())
+
+
+def ensure_pool_size(url, size):
+    """Make sure at least `size` connections to the host of `url` are kept
+    alive, e.g. before `size` simultaneous requests.
+
+    :param url: any url on the host in question
+    :param size: number of connections
+    :type url: ``str``
+    :type size: ``int``
+    """
+
+    host = urlparse(url).hostname
+
+    if _pool_sizes.get(host, POOL_SIZE) < size:
+        set_pool_size(size, host)
+
+
+def stats():
+    """Connection reuse by host. ``requests`` made over ``connections``
+    opened, so ``reused`` requests didn't have to connect first.
+
+    :rtype: ``dict`` of ``dict`` with ``requests``, ``connections``,
+     ``reused`` and ``pool_size`` by host name
+    """
+
+    with _lock:
+        counts = dict((host, list(values))
+                      for host, values in _retired.items())
+
+    pools = []
+    if _adapter is not None:
+        manager = _adapter.poolmanager
+        for key in manager.pools.keys():
+            pool = manager.pools.get(key)
+            if pool is not None:
+                pools.append(pool)
+
+    for pool in pools:
+        values = counts.setdefault(pool.host, [0, 0])
+        values[0] += pool.num_requests
+        values[1] += pool.num_connections
+
+    result = {}
+    for host, (requests, connections) in counts.items():
+        result[host] = {
+            'requests': requests,
+            'connections': connections,
+            'reused': max(requests - connections, 0),
+            'pool_size': _pool_sizes.get(host, POOL_SIZE)
+            }
+
+    return result
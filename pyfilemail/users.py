@@ -1,12 +1,25 @@
+import os
+import threading
 from calendar import timegm
 from datetime import datetime, timedelta
 from requests import Session
+from requests.cookies import remove_cookie_by_name
 
+import retry
+import tokens
+import transport
 import pyfilemail as pm
-from pyfilemail import logger, login_required, load_config, get_configfile
+from pyfilemail import (logger, login_required, load_config, get_configfile,
+                        pool_map, replace_file)
 from urls import get_URL
-from transfer import Transfer
-from errors import hellraiser, FMBaseError
+from transfer import (Transfer, normalize_md5, get_md5, PART_SUFFIX,
+                      SEGMENT_MIN_SIZE)
+from ratelimit import TokenBucket
+from progress import Progress, ConsoleRenderer, legacy_callback
+from writer import link_file, LINK_METHODS
+from directory import Directory
+from errors import (hellraiser, FMBaseError, FMFileError,
+                    InvalidOrExpiredLoginToken)
 
 
 class User(object):
@@ -35,10 +48,25 @@ class User(object):
         self.username = username
         self.transfers = []
 
-        self.session = Session()
+        # Kept to login again when the login token expires
+        self._password = None
+        self._login_lock = threading.Lock()
+
+        # Per user rate limits applied on top of the process wide ones
+        self.upload_limit = None
+        self.download_limit = None
+
+        # Which failed calls are tried again, see pyfilemail.retry
+        self.retry_policy = retry.policy
+
+        # Connections are shared by all users in the process
+        self.session = transport.mount(Session())
         self.session.cookies['source'] = 'Desktop'
         self.config = load_config()
 
+        # Contacts and groups are looked up in a cache
+        self.directory = Directory(self)
+
         apikey = self.config.get('apikey')
         self.session.cookies['apikey'] = apikey
         if apikey.startswith('GET KEY AT:'):
@@ -53,11 +81,104 @@ class User(object):
             else:
                 password = None
 
-        if password is not None:
-            self.login(password)
+        if password is None:
+            self.session.cookies['logintoken'] = None
 
         else:
-            self.session.cookies['logintoken'] = None
+            self._password = password
+
+            # A token from an earlier login saves a round trip
+            logintoken = tokens.load(username)
+            if logintoken:
+                self.session.cookies['logintoken'] = logintoken
+
+            else:
+                self.login(password)
+
+    def set_rate_limits(self, upload=None, download=None):
+        """Limit upload and download speed for all transfers of this user.
+        Limits may be changed while transfers are running. Process wide
+        limits are set on :data:`pyfilemail.ratelimit.upload_limit` and
+        :data:`pyfilemail.ratelimit.download_limit`.
+
+        :param upload: bytes per second. ``None`` means unlimited
+        :param download: bytes per second. ``None`` means unlimited
+        :type upload: ``int``
+        :type download: ``int``
+        """
+
+        for attr, rate in (('upload_limit', upload),
+                           ('download_limit', download)):
+            bucket = getattr(self, attr)
+            if bucket is None:
+                setattr(self, attr, TokenBucket(rate))
+
+            else:
+                bucket.set_rate(rate)
+
+    def _api_call(self, action, payload=None):
+        """Call Filemail API. Transient errors are retried as decided by
+        :attr:`User.retry_policy`. If the login token has expired the user
+        logs in again and the call is made once more with the new token.
+
+        :param action: name of call in :data:`pyfilemail.urls.api_urls`
+        :param payload: parameters of call
+        :type action: ``str``
+        :type payload: ``dict``
+        :rtype: :class:`requests.Response` with status 200
+        :raises: :class:`pyfilemail.errors.FileMailBaseError` subclass of
+         the error code Filemail responded with
+        """
+
+        method, url = get_URL(action)
+
+        def call():
+            res = getattr(self.session, method)(url, params=payload)
+
+            if res.status_code != 200:
+                hellraiser(res)
+
+            return res
+
+        try:
+            return self.retry_policy.call(action, call)
+
+        except InvalidOrExpiredLoginToken:
+            if action in ('login', 'logout') or not payload:
+                raise
+
+            logintoken = payload.get('logintoken')
+            if logintoken is None or not self._relogin(logintoken):
+                raise
+
+        payload = dict(payload,
+                       logintoken=self.session.cookies.get('logintoken'))
+
+        return self.retry_policy.call(action, call)
+
+    def _relogin(self, logintoken):
+        """Login again after `logintoken` was refused. Calls running at
+        the same time all get the token of the first one to login.
+
+        :param logintoken: token Filemail refused
+        :type logintoken: ``str``
+        :rtype: ``bool`` ``True`` if there's a new token to try
+        """
+
+        with self._login_lock:
+            if self.session.cookies.get('logintoken') != logintoken:
+                # Another call already logged in again
+                return True
+
+            tokens.delete(self.username)
+
+            if self._password is None:
+                return False
+
+            logger.info('Login token expired. Logging in again')
+            self.login(self._password)
+
+            return True
 
     @property
     def is_registered(self):
@@ -83,7 +204,6 @@ class User(object):
         :type password: ``str``
         """
 
-        method, url = get_URL('login')
         payload = {
             'apikey': self.config.get('apikey'),
             'username': self.username,
@@ -91,12 +211,28 @@ class User(object):
             'source': 'Desktop'
             }
 
-        res = getattr(self.session, method)(url, params=payload)
+        # Drop any expired token so it isn't mistaken for the new one
+        remove_cookie_by_name(self.session.cookies, 'logintoken')
 
-        if res.status_code == 200:
-            return True
+        res = self._api_call('login', payload)
+
+        try:
+            logintoken = res.json().get('logintoken')
+
+        except ValueError:
+            logintoken = None
 
-        hellraiser(res)
+        # Filemail sets the token as a cookie too. Keep a single one
+        logintoken = logintoken or self.session.cookies.get('logintoken')
+        remove_cookie_by_name(self.session.cookies, 'logintoken')
+        self.session.cookies['logintoken'] = logintoken
+
+        if logintoken:
+            tokens.save(self.username, logintoken)
+
+        self._password = password
+
+        return True
 
     @login_required
     def logout(self):
@@ -110,14 +246,13 @@ class User(object):
             'logintoken': self.session.cookies.get('logintoken')
             }
 
-        method, url = get_URL('logout')
-        res = getattr(self.session, method)(url, params=payload)
+        # Forget the token even if Filemail already has
+        tokens.delete(self.username)
 
-        if res.status_code == 200:
-            self.session.cookies['logintoken'] = None
-            return True
+        self._api_call('logout', payload)
 
-        hellraiser(res)
+        self.session.cookies['logintoken'] = None
+        return True
 
     @property
     def transfers_complete(self):
@@ -143,8 +278,6 @@ class User(object):
         :rtype: ``list`` of :class:`pyfilemail.Transfer` objects
         """
 
-        method, url = get_URL('get_sent')
-
         payload = {
             'apikey': self.session.cookies.get('apikey'),
             'logintoken': self.session.cookies.get('logintoken'),
@@ -152,12 +285,9 @@ class User(object):
             'getforallusers': for_all
             }
 
-        res = getattr(self.session, method)(url, params=payload)
+        res = self._api_call('get_sent', payload)
 
-        if res.status_code == 200:
-            return self._restore_transfers(res)
-
-        hellraiser(res.json())
+        return self._restore_transfers(res)
 
     @login_required
     def get_user_info(self, save_to_config=True):
@@ -168,24 +298,19 @@ class User(object):
         :rtype: ``dict`` containig user information and default settings.
         """
 
-        method, url = get_URL('user_get')
-
         payload = {
             'apikey': self.config.get('apikey'),
             'logintoken': self.session.cookies.get('logintoken')
             }
 
-        res = getattr(self.session, method)(url, params=payload)
+        res = self._api_call('user_get', payload)
 
-        if res.status_code == 200:
-            settings = res.json()['user']
+        settings = res.json()['user']
 
-            if save_to_config:
-                self.config.update(settings)
+        if save_to_config:
+            self.config.update(settings)
 
-            return settings
-
-        hellraiser(res)
+        return settings
 
     @login_required
     def update_user_info(self, **kwargs):
@@ -199,17 +324,12 @@ class User(object):
         if kwargs:
             self.config.update(kwargs)
 
-        method, url = get_URL('user_update')
-
-        res = getattr(self.session, method)(url, params=self.config)
-
-        if res.status_code == 200:
-            return True
+        self._api_call('user_update', self.config)
 
-        hellraiser(res)
+        return True
 
     @login_required
-    def get_received(self, age=None, for_all=True):
+    def get_received(self, age=None, for_all=True, since=None):
         """Retrieve a list of transfers sent to you or your company
          from other people.
 
@@ -217,14 +337,18 @@ class User(object):
         :param for_all: If ``True`` will return received files for
          all users in the same business. (Available for business account
          members only).
+        :param since: Only transfers received after this unix timestamp.
+         Overrides `age`
         :type age: ``int``
         :type for_all: ``bool``
+        :type since: ``int`` or ``float``
         :rtype: ``list`` of :class:`Transfer` objects.
         """
 
-        method, url = get_URL('received_get')
+        if since is not None:
+            age = int(since)
 
-        if age:
+        elif age:
             if not isinstance(age, int) or age < 0 or age > 90:
                 raise FMBaseError('Age must be <int> between 0-90')
 
@@ -238,12 +362,9 @@ class User(object):
             'from': age
             }
 
-        res = getattr(self.session, method)(url, params=payload)
-
-        if res.status_code == 200:
-            return self._restore_transfers(res)
+        res = self._api_call('received_get', payload)
 
-        hellraiser(res)
+        return self._restore_transfers(res)
 
     def _restore_transfers(self, response):
         """Restore transfers from josn retreived Filemail
@@ -255,32 +376,286 @@ class User(object):
         for transfer_data in response.json()['transfers']:
             transfer = Transfer(self, _restore=True)
             transfer.transfer_info.update(transfer_data)
-            transfer.get_files()
             transfers.append(transfer)
 
         return transfers
 
+    def prefetch_files(self, transfers=None, workers=8):
+        """Fetch files of many transfers at the same time, instead of one
+        by one as :attr:`Transfer.files` of each is used.
+
+        :param transfers: transfers to fetch files of, defaults to all
+         transfers of user
+        :param workers: Number of requests at the same time
+        :type transfers: ``list`` of :class:`Transfer`
+        :type workers: ``int``
+        :rtype: ``list`` of :class:`Transfer`
+        """
+
+        if transfers is None:
+            transfers = self.transfers
+
+        pending = [transfer for transfer in transfers
+                   if not transfer._files_loaded]
+
+        if pending:
+            transport.ensure_pool_size(get_URL('get')[1], workers)
+            pool_map(lambda transfer: transfer.get_files(), pending, workers)
+
+        return transfers
+
+    @login_required
+    def download_received(self,
+                          destination=None,
+                          age=None,
+                          transfers=None,
+                          replace=False,
+                          workers=4,
+                          link_methods=LINK_METHODS,
+                          callback=None,
+                          progress=None,
+                          verify=True,
+                          retries=1):
+        """Download files of all received transfers, each transfer to a
+        folder named after its transferid in `destination`. Files with the
+        same md5 and size in several transfers are downloaded once. The
+        other copies are linked to it with the first of `link_methods` that
+        works, see :func:`pyfilemail.writer.link_file`. Copies are only
+        linked to a file whose md5 matches, otherwise they're downloaded
+        too.
+
+        :param destination: destination path (defaults to users home directory)
+        :param age: between 1 and 90 days, see :func:`User.get_received`
+        :param transfers: transfers to download instead of received
+         transfers
+        :param replace: Download existing files again and replace them
+        :param workers: Number of files to download at the same time
+        :param link_methods: "reflink", "hardlink" and/or "copy" in order of
+         preference
+        :param callback: callback function that will receive total file size
+         and written bytes as arguments
+        :param progress: Receives progress of all downloaded files.
+         Overrides `callback`
+        :param verify: Compare md5 of downloaded files with the md5 from
+         Filemail
+        :param retries: Times to download a file again when the checksum
+         doesn't match
+        :type destination: ``str`` or ``unicode``
+        :type age: ``int``
+        :type transfers: ``list`` of :class:`Transfer`
+        :type replace: ``bool``
+        :type workers: ``int``
+        :type link_methods: ``tuple``
+        :type callback: ``func``
+        :type progress: :class:`pyfilemail.progress.Progress`
+        :type verify: ``bool``
+        :type retries: ``int``
+        :rtype: ``dict`` with number of files ``downloaded``, ``linked``,
+         ``skipped`` and ``failed``, ``bytes_saved`` by not downloading
+         duplicates and a ``files`` ``list`` of results like
+         :func:`Transfer.download` with ``transferid`` and the ``linked``
+         method added
+        """
+
+        if transfers is None:
+            transfers = self.get_received(age=age)
+
+        if destination is None:
+            destination = os.path.expanduser('~')
+
+        if progress is None:
+            progress = Progress(legacy_callback(callback))
+
+        self.prefetch_files(transfers, workers)
+
+        unique = []
+        duplicates = []
+        seen = {}
+
+        for transfer in transfers:
+            folder = os.path.join(destination, transfer.transfer_id)
+
+            for fmfile in transfer.files:
+                checksum = normalize_md5(fmfile.get('md5'))
+                key = checksum and (checksum, fmfile.get('filesize'))
+
+                if key in seen:
+                    duplicates.append((seen[key], transfer, fmfile, folder,
+                                       checksum))
+                    continue
+
+                if key:
+                    seen[key] = len(unique)
+
+                unique.append((transfer, fmfile, folder))
+                progress.add_file(transfer._file_key(fmfile),
+                                  fmfile.get('filename'),
+                                  fmfile.get('filesize'))
+
+        for transfer, fmfile, folder in unique:
+            url = fmfile.get('downloadurl')
+            if url:
+                transport.ensure_pool_size(url, workers)
+
+        def download(job):
+            transfer, fmfile, folder = job
+
+            result = transfer._download_result(fmfile,
+                                               folder,
+                                               replace,
+                                               progress,
+                                               1,
+                                               SEGMENT_MIN_SIZE,
+                                               verify,
+                                               retries)
+            result['transferid'] = transfer.transfer_id
+            result['linked'] = None
+
+            return result
+
+        renderer = None
+        if pm.COMMANDLINE:
+            renderer = ConsoleRenderer(progress).start()
+
+        try:
+            results = pool_map(download, unique, workers)
+
+        finally:
+            if renderer is not None:
+                renderer.stop()
+
+        report = {'files': list(results), 'bytes_saved': 0}
+
+        for index, transfer, fmfile, folder, checksum in duplicates:
+            source = results[index]
+            result = {
+                'filename': fmfile.get('filename'),
+                'path': os.path.join(folder, fmfile.get('filename')),
+                'status': None,
+                'verified': None,
+                'error': None,
+                'transferid': transfer.transfer_id,
+                'linked': None
+                }
+            report['files'].append(result)
+
+            if source['status'] == 'failed':
+                result['status'] = 'failed'
+                result['error'] = source['error']
+                continue
+
+            if os.path.exists(result['path']) and not replace:
+                result['status'] = 'skipped'
+                continue
+
+            # Never spread a corrupt or unchecked file to its copies
+            if not self._has_md5(source, checksum):
+                msg = 'Not linking unverified "{path}", downloading copy'
+                logger.warning(msg.format(path=source['path']))
+
+                progress.add_file(transfer._file_key(fmfile),
+                                  fmfile.get('filename'),
+                                  fmfile.get('filesize'))
+                copy = transfer._download_result(fmfile,
+                                                 folder,
+                                                 replace,
+                                                 progress,
+                                                 1,
+                                                 SEGMENT_MIN_SIZE,
+                                                 verify,
+                                                 retries)
+                result.update(copy)
+                continue
+
+            result['verified'] = True
+
+            try:
+                result['linked'] = self._link(source['path'],
+                                              result['path'],
+                                              link_methods)
+
+            except (FMFileError, EnvironmentError) as e:
+                logger.error(str(e))
+
+                result['status'] = 'failed'
+                result['error'] = str(e)
+                continue
+
+            result['status'] = 'linked'
+            report['bytes_saved'] += fmfile.get('filesize') or 0
+
+        for status in ('downloaded', 'linked', 'skipped', 'failed'):
+            report[status] = len([r for r in report['files']
+                                  if r['status'] == status])
+
+        return report
+
+    @staticmethod
+    def _has_md5(result, checksum):
+        """Whether the file of a download `result` has md5 `checksum`.
+        Files that weren't verified while downloading, e.g. skipped ones,
+        are checked on disk.
+
+        :param result: result from :func:`Transfer._download_result`
+        :param checksum: base64 encoded md5 from Filemail
+        :type result: ``dict``
+        :type checksum: ``str``
+        :rtype: ``bool``
+        """
+
+        if result['verified']:
+            return True
+
+        try:
+            return get_md5(result['path']) == checksum
+
+        except EnvironmentError:
+            return False
+
+    def _link(self, source, target, methods):
+        """Link `source` to `target` through a .part file so `target`
+        only ever appears complete.
+
+        :rtype: ``str`` method used
+        """
+
+        folder = os.path.dirname(target)
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+
+        partpath = target + PART_SUFFIX
+        if os.path.exists(partpath):
+            os.remove(partpath)
+
+        method = link_file(source, partpath, methods)
+        replace_file(partpath, target)
+
+        return method
+
     @login_required
     def get_contacts(self):
         """Get contacts from Filemail. Usually people you've sent files
-         to in the past.
+         to in the past. Contacts are cached in :attr:`User.directory`.
 
         :rtype: ``list`` of ``dict`` objects containing contact information
         """
 
-        method, url = get_URL('contacts_get')
+        return self.directory.contacts()
+
+    def _fetch_contacts(self):
+        """Fetch contacts from Filemail bypassing the cache.
+
+        :rtype: ``list`` of ``dict`` objects containing contact information
+        """
 
         payload = {
             'apikey': self.config.get('apikey'),
             'logintoken': self.session.cookies.get('logintoken')
             }
 
-        res = getattr(self.session, method)(url, params=payload)
+        res = self._api_call('contacts_get', payload)
 
-        if res.status_code == 200:
-            return res.json()['contacts']
-
-        hellraiser(res)
+        return res.json()['contacts']
 
     @login_required
     def get_contact(self, email):
@@ -291,13 +666,7 @@ class User(object):
         :rtype: ``dict`` with contact information
         """
 
-        contacts = self.get_contacts()
-        for contact in contacts:
-            if contact['email'] == email:
-                return contact
-
-        msg = 'No contact with email: "{email}" found.'
-        raise FMBaseError(msg.format(email=email))
+        return self.directory.contact(email)
 
     @login_required
     def update_contact(self, contact):
@@ -311,8 +680,6 @@ class User(object):
         if not isinstance(contact, dict):
             raise AttributeError('contact must be a <dict>')
 
-        method, url = get_URL('contacts_update')
-
         payload = {
             'apikey': self.config.get('apikey'),
             'logintoken': self.session.cookies.get('logintoken'),
@@ -321,12 +688,10 @@ class User(object):
             'email': contact.get('email')
             }
 
-        res = getattr(self.session, method)(url, params=payload)
-
-        if res.status_code == 200:
-            return True
+        self._api_call('contacts_update', payload)
 
-        hellraiser(res)
+        self.directory.put_contact(contact)
+        return True
 
     @login_required
     def add_contact(self, name, email):
@@ -340,8 +705,6 @@ class User(object):
         :rtype: ``dict``
         """
 
-        method, url = get_URL('contacts_add')
-
         payload = {
             'apikey': self.config.get('apikey'),
             'logintoken': self.session.cookies.get('logintoken'),
@@ -349,12 +712,12 @@ class User(object):
             'email': email
             }
 
-        res = getattr(self.session, method)(url, params=payload)
+        res = self._api_call('contacts_add', payload)
 
-        if res.status_code == 200:
-            return res.json()['contact']
+        contact = res.json()['contact']
+        self.directory.put_contact(contact)
 
-        hellraiser(res)
+        return contact
 
     @login_required
     def delete_contact(self, contact):
@@ -368,41 +731,40 @@ class User(object):
         if not isinstance(contact, dict):
             raise AttributeError('contact must be a <dict>')
 
-        method, url = get_URL('contacts_delete')
-
         payload = {
             'apikey': self.config.get('apikey'),
             'logintoken': self.session.cookies.get('logintoken'),
             'contactid': contact.get('contactid')
             }
 
-        res = getattr(self.session, method)(url, params=payload)
-
-        if res.status_code == 200:
-            return True
+        self._api_call('contacts_delete', payload)
 
-        hellraiser(res)
+        self.directory.remove_contact(contact)
+        return True
 
     @login_required
     def get_groups(self):
-        """Get contact groups
+        """Get contact groups. Groups are cached in :attr:`User.directory`.
 
         :rtype: ``list`` of ``dict`` with group data
         """
 
-        method, url = get_URL('groups_get')
+        return self.directory.groups()
+
+    def _fetch_groups(self):
+        """Fetch contact groups from Filemail bypassing the cache.
+
+        :rtype: ``list`` of ``dict`` with group data
+        """
 
         payload = {
             'apikey': self.config.get('apikey'),
             'logintoken': self.session.cookies.get('logintoken')
             }
 
-        res = getattr(self.session, method)(url, params=payload)
-
-        if res.status_code == 200:
-            return res.json()['groups']
+        res = self._api_call('groups_get', payload)
 
-        hellraiser(res)
+        return res.json()['groups']
 
     @login_required
     def get_group(self, name):
@@ -413,13 +775,7 @@ class User(object):
         :rtype: ``dict`` with group data
         """
 
-        groups = self.get_groups()
-        for group in groups:
-            if group['contactgroupname'] == name:
-                return group
-
-        msg = 'No group named: "{name}" found.'
-        raise FMBaseError(msg.format(name=name))
+        return self.directory.group(name)
 
     @login_required
     def add_group(self, name):
@@ -430,20 +786,18 @@ class User(object):
         :rtype: ``dict`` with group data
         """
 
-        method, url = get_URL('group_add')
-
         payload = {
             'apikey': self.config.get('apikey'),
             'logintoken': self.session.cookies.get('logintoken'),
             'name': name
             }
 
-        res = getattr(self.session, method)(url, params=payload)
+        res = self._api_call('group_add', payload)
 
-        if res.status_code == 200:
-            return res.json()['groups']
+        groups = res.json()['groups']
+        self.directory.put_groups(groups)
 
-        hellraiser(res)
+        return groups
 
     @login_required
     def delete_group(self, name):
@@ -456,20 +810,16 @@ class User(object):
 
         group = self.get_group(name)
 
-        method, url = get_URL('group_delete')
-
         payload = {
             'apikey': self.config.get('apikey'),
             'logintoken': self.session.cookies.get('logintoken'),
             'contactgroupid': group['contactgroupid']
             }
 
-        res = getattr(self.session, method)(url, params=payload)
-
-        if res.status_code == 200:
-            return True
+        self._api_call('group_delete', payload)
 
-        hellraiser(res)
+        self.directory.remove_group(group)
+        return True
 
     @login_required
     def rename_group(self, group, newname):
@@ -483,9 +833,7 @@ class User(object):
         """
 
         if isinstance(group, basestring):
-            group = self.get_contact(group)
-
-        method, url = get_URL('group_update')
+            group = self.get_group(group)
 
         payload = {
             'apikey': self.config.get('apikey'),
@@ -494,12 +842,10 @@ class User(object):
             'name': newname
             }
 
-        res = getattr(self.session, method)(url, params=payload)
-
-        if res.status_code == 200:
-            return True
+        self._api_call('group_update', payload)
 
-        hellraiser(res)
+        self.directory.put_groups(dict(group, contactgroupname=newname))
+        return True
 
     @login_required
     def add_contact_to_group(self, contact, group):
@@ -518,8 +864,6 @@ class User(object):
         if isinstance(group, basestring):
             group = self.get_group(group)
 
-        method, url = get_URL('contacts_add_to_group')
-
         payload = {
             'apikey': self.config.get('apikey'),
             'logintoken': self.session.cookies.get('logintoken'),
@@ -527,12 +871,9 @@ class User(object):
             'contactgroupid': group['contactgroupid']
             }
 
-        res = getattr(self.session, method)(url, params=payload)
+        self._api_call('contacts_add_to_group', payload)
 
-        if res.status_code == 200:
-            return True
-
-        hellraiser(res)
+        return True
 
     @login_required
     def remove_contact_from_group(self, contact, group):
@@ -551,8 +892,6 @@ class User(object):
         if isinstance(group, basestring):
             group = self.get_group(group)
 
-        method, url = get_URL('contacts_remove_from_group')
-
         payload = {
             'apikey': self.config.get('apikey'),
             'logintoken': self.session.cookies.get('logintoken'),
@@ -560,12 +899,9 @@ class User(object):
             'contactgroupid': group['contactgroupid']
             }
 
-        res = getattr(self.session, method)(url, params=payload)
+        self._api_call('contacts_remove_from_group', payload)
 
-        if res.status_code == 200:
-            return True
-
-        hellraiser(res)
+        return True
 
     @login_required
     def get_company_info(self):
@@ -574,19 +910,14 @@ class User(object):
         :rtype: ``dict`` with company data
         """
 
-        method, url = get_URL('company_get')
-
         payload = {
             'apikey': self.config.get('apikey'),
             'logintoken': self.session.cookies.get('logintoken')
             }
 
-        res = getattr(self.session, method)(url, params=payload)
-
-        if res.status_code == 200:
-            return res.json()['company']
+        res = self._api_call('company_get', payload)
 
-        hellraiser(res)
+        return res.json()['company']
 
     @login_required
     def update_company(self, company):
@@ -600,8 +931,6 @@ class User(object):
         if not isinstance(company, dict):
             raise AttributeError('company must be a <dict>')
 
-        method, url = get_URL('company_update')
-
         payload = {
             'apikey': self.config.get('apikey'),
             'logintoken': self.session.cookies.get('logintoken')
@@ -609,12 +938,9 @@ class User(object):
 
         payload.update(company)
 
-        res = getattr(self.session, method)(url, params=payload)
-
-        if res.status_code == 200:
-            return True
+        self._api_call('company_update', payload)
 
-        hellraiser(res)
+        return True
 
     @login_required
     def get_company_users(self):
@@ -623,19 +949,14 @@ class User(object):
         :rtype: ``list`` of ``dict`` with user data
         """
 
-        method, url = get_URL('company_get_users')
-
         payload = {
             'apikey': self.config.get('apikey'),
             'logintoken': self.session.cookies.get('logintoken')
             }
 
-        res = getattr(self.session, method)(url, params=payload)
+        res = self._api_call('company_get_users', payload)
 
-        if res.status_code == 200:
-            return res.json()['users']
-
-        hellraiser(res)
+        return res.json()['users']
 
     @login_required
     def get_company_user(self, email):
@@ -671,8 +992,6 @@ class User(object):
         :rtype: ``bool``
         """
 
-        method, url = get_URL('company_add_user')
-
         payload = {
             'apikey': self.config.get('apikey'),
             'logintoken': self.session.cookies.get('logintoken'),
@@ -683,12 +1002,9 @@ class User(object):
             'admin': admin
             }
 
-        res = getattr(self.session, method)(url, params=payload)
-
-        if res.status_code == 200:
-            return True
+        self._api_call('company_add_user', payload)
 
-        hellraiser(res)
+        return True
 
     @login_required
     def update_company_user(self, email, userdata):
@@ -704,8 +1020,6 @@ class User(object):
         if not isinstance(userdata, dict):
             raise AttributeError('userdata must be a <dict>')
 
-        method, url = get_URL('company_update_user')
-
         payload = {
             'apikey': self.config.get('apikey'),
             'logintoken': self.session.cookies.get('logintoken'),
@@ -714,9 +1028,6 @@ class User(object):
 
         payload.update(userdata)
 
-        res = getattr(self.session, method)(url, params=payload)
-
-        if res.status_code == 200:
-            return True
+        self._api_call('company_update_user', payload)
 
-        hellraiser(res)
\ No newline at end of file
+        return True
\ No newline at end of file
@@ -0,0 +1,97 @@
+import os
+import shutil
+
+try:
+    import fcntl
+
+except ImportError:
+    # Windows
+    fcntl = None
+
+from errors import FMFileError
+
+# Linux ioctl sharing the blocks of a file on copy on write file systems
+# such as btrfs and xfs
+FICLONE = 0x40049409
+
+# Ways of putting a copy of a file in place, in order of preference
+LINK_METHODS = ('reflink', 'hardlink', 'copy')
+
+
+def preallocate(file_obj, size):
+    """Reserve `size` bytes on disk for `file_obj`. Uses
+    ``os.posix_fallocate`` where available so the blocks are allocated up
+    front, otherwise the file is extended with ``truncate``.
+
+    :param file_obj: file opened for writing
+    :param size: size of file
+    :type file_obj: ``file``
+    :type size: ``int``
+    """
+
+    fallocate = getattr(os, 'posix_fallocate', None)
+
+    if fallocate is not None and size:
+        try:
+            fallocate(file_obj.fileno(), 0, size)
+            return
+
+        except OSError:
+            # Not supported by file system
+            pass
+
+    file_obj.truncate(size)
+
+
+def reflink(source, target):
+    """Create `target` as a copy on write clone of `source`.
+
+    :raises: ``IOError`` if the file system can't clone files
+    """
+
+    if fcntl is None:
+        raise IOError('Reflinks are not supported on this platform')
+
+    with open(source, 'rb') as src, open(target, 'wb') as dst:
+        fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+
+
+def link_file(source, target, methods=LINK_METHODS):
+    """Put a copy of `source` at `target` with the first of `methods` that
+    works. A reflink shares the blocks of `source` until either file is
+    changed. A hard link is the same file under two names. A copy
+    always works but takes the space and time of a full copy.
+
+    :param source: existing file
+    :param target: path of copy, must not exist
+    :param methods: "reflink", "hardlink" and/or "copy"
+    :type source: ``str`` or ``unicode``
+    :type target: ``str`` or ``unicode``
+    :type methods: ``tuple``
+    :rtype: ``str`` method used
+    :raises: :class:`FMFileError` if none of `methods` works
+    """
+
+    error = None
+
+    for method in methods:
+        try:
+            if method == 'reflink':
+                reflink(source, target)
+
+            elif method == 'hardlink':
+                os.link(source, target)
+
+            else:
+                shutil.copyfile(source, target)
+
+            return method
+
+        except (AttributeError, EnvironmentError) as e:
+            error = e
+
+            if os.path.exists(target):
+                os.remove(target)
+
+    msg = 'Could not copy "{source}" to "{target}": {error}'
+    raise FMFileError(msg.format(source=source, target=target, error=error))
@@ -5,10 +5,11 @@ import pyfilemail
 
 dependencies = [
     'requests',
+    # pyfilemail.transport sizes connection pools through urllib3 internals
+    'urllib3>=1.21.1,<2',
     'requests_toolbelt',
     'appdirs',
-    'keyring',
-    'clint'
+    'keyring'
     ]
 
 with open('README.rst') as f:
@@ -0,0 +1,214 @@
+import os
+import zlib
+import shutil
+import struct
+import zipfile
+import tempfile
+import unittest
+from io import BytesIO
+
+from pyfilemail import archive
+from pyfilemail.errors import FMFileError
+
+CONTENT = {
+    'text.txt': 'hello filemail\n' * 2000,
+    'folder/random.bin': os.urandom(70000),
+    'folder/empty.txt': ''
+    }
+
+
+def make_zip(entries, method=zipfile.ZIP_DEFLATED):
+    """Zip archive with sizes in the local headers.
+
+    :rtype: ``str``
+    """
+
+    buf = BytesIO()
+    with zipfile.ZipFile(buf, 'w', method) as zf:
+        for arcname, data in entries:
+            zf.writestr(arcname, data)
+
+    return buf.getvalue()
+
+
+def make_described_zip(entries):
+    """Zip archive whose crc and sizes only follow the data in data
+    descriptors, as written by streaming zip tools.
+
+    :param entries: (arcname, data, method) tuples
+    :rtype: ``str``
+    """
+
+    parts = []
+    for arcname, data, method in entries:
+        crc = zlib.crc32(data) & 0xffffffff
+
+        if method == archive.ZIP_DEFLATED:
+            compressor = zlib.compressobj(6, zlib.DEFLATED, -zlib.MAX_WBITS)
+            packed = compressor.compress(data) + compressor.flush()
+
+        else:
+            packed = data
+
+        parts.append(archive.LOCAL_HEADER.pack(
+            archive.LOCAL_HEADER_SIGNATURE, 20,
+            archive.FLAG_DATA_DESCRIPTOR, method, 0, 0, 0, 0, 0,
+            len(arcname), 0) + arcname)
+        parts.append(packed)
+        parts.append(archive.DATA_DESCRIPTOR.pack(
+            archive.DATA_DESCRIPTOR_SIGNATURE, crc, len(packed), len(data)))
+
+    parts.append(archive.END_RECORD.pack(archive.END_RECORD_SIGNATURE,
+                                         0, 0, 0, 0, 0, 0, 0))
+
+    return ''.join(parts)
+
+
+class TestExtractZip(unittest.TestCase):
+    """Extracting archives while they're read."""
+
+    def setUp(self):
+        self.destination = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.destination)
+
+    def extract(self, data, blocksize=archive.BLOCKSIZE):
+        return archive.extract_zip(BytesIO(data), self.destination,
+                                   blocksize=blocksize)
+
+    def assertExtracted(self, entries):
+        for arcname, data in entries:
+            path = os.path.join(self.destination, arcname)
+            with open(path, 'rb') as f:
+                self.assertEqual(f.read(), data)
+
+    def test_stored(self):
+        entries = sorted(CONTENT.items())
+        paths = self.extract(make_zip(entries, zipfile.ZIP_STORED))
+
+        self.assertEqual(len(paths), len(entries))
+        self.assertExtracted(entries)
+
+    def test_deflated(self):
+        entries = sorted(CONTENT.items())
+        self.extract(make_zip(entries))
+
+        self.assertExtracted(entries)
+
+    def test_folder(self):
+        self.extract(make_zip([('folder/', ''), ('folder/a.txt', 'a')]))
+
+        self.assertTrue(os.path.isdir(os.path.join(self.destination,
+                                                   'folder')))
+        self.assertExtracted([('folder/a.txt', 'a')])
+
+    def test_data_descriptor(self):
+        entries = sorted(CONTENT.items())
+        data = make_described_zip(
+            [(arcname, content, archive.ZIP_DEFLATED)
+             for arcname, content in entries[:2]] +
+            [(arcname, content, archive.ZIP_STORED)
+             for arcname, content in entries[2:]]
+            )
+
+        # Small blocks make descriptors span block boundaries
+        for blocksize in (7, 1000, archive.BLOCKSIZE):
+            self.extract(data, blocksize)
+            self.assertExtracted(entries)
+
+    def test_stored_descriptor_signature_in_data(self):
+        # Looks like a descriptor, but its crc and sizes don't match
+        fake = archive.DATA_DESCRIPTOR.pack(
+            archive.DATA_DESCRIPTOR_SIGNATURE, 1, 2, 3)
+        content = 'before' + fake + 'after'
+
+        self.extract(make_described_zip(
+            [('fake.bin', content, archive.ZIP_STORED)]
+            ))
+
+        self.assertExtracted([('fake.bin', content)])
+
+    def test_written_archives(self):
+        folder = tempfile.mkdtemp(dir=self.destination)
+        filepaths = []
+        for arcname, data in sorted(CONTENT.items()):
+            path = os.path.join(folder, os.path.basename(arcname))
+            with open(path, 'wb') as f:
+                f.write(data)
+
+            filepaths.append(path)
+
+        zip_filename = os.path.join(self.destination, 'written.zip')
+        archive.write_zip(filepaths, zip_filename, workers=1)
+
+        with open(zip_filename, 'rb') as f:
+            written = f.read()
+
+        streamed = archive.ZipStream(filepaths).read()
+
+        for data in (written, streamed):
+            shutil.rmtree(os.path.join(self.destination, 'out'), True)
+            paths = archive.extract_zip(BytesIO(data),
+                                        os.path.join(self.destination, 'out'))
+
+            for path, filepath in zip(paths, filepaths):
+                with open(path, 'rb') as f:
+                    with open(filepath, 'rb') as source:
+                        self.assertEqual(f.read(), source.read())
+
+    def test_outside_destination(self):
+        for arcname in ('../evil.txt', 'folder/../../evil.txt',
+                        '/tmp/evil.txt'):
+            self.assertRaises(FMFileError, self.extract,
+                              make_zip([(arcname, 'evil')]))
+
+        parent = os.path.dirname(self.destination)
+        self.assertFalse(os.path.exists(os.path.join(parent, 'evil.txt')))
+
+    def test_truncated(self):
+        data = make_zip(sorted(CONTENT.items()))
+        end = data.index(struct.pack('<I', archive.CENTRAL_HEADER_SIGNATURE))
+
+        for size in (0, 10, 40, end // 2, end - 1):
+            shutil.rmtree(self.destination)
+            os.mkdir(self.destination)
+
+            self.assertRaises(FMFileError, self.extract, data[:size])
+
+    def test_truncated_removes_partial_file(self):
+        data = make_zip([('big.bin', os.urandom(100000))],
+                        zipfile.ZIP_STORED)
+
+        self.assertRaises(FMFileError, self.extract, data[:50000])
+        self.assertEqual(os.listdir(self.destination), [])
+
+    def test_bad_crc(self):
+        data = bytearray(make_zip([('a.txt', 'a' * 100)],
+                                  zipfile.ZIP_STORED))
+        offset = archive.LOCAL_HEADER.size + len('a.txt')
+        data[offset] = 'b'
+
+        self.assertRaises(FMFileError, self.extract, str(data))
+
+
+class TestSafePath(unittest.TestCase):
+    """Paths entries are extracted to."""
+
+    def test_inside(self):
+        self.assertEqual(archive.safe_path('/dest', u'a/b.txt'),
+                         '/dest/a/b.txt')
+        self.assertEqual(archive.safe_path('/dest', u'./a//b.txt'),
+                         '/dest/a/b.txt')
+        self.assertEqual(archive.safe_path('/dest', u'a\\b.txt'),
+                         '/dest/a/b.txt')
+
+    def test_outside(self):
+        for arcname in (u'', u'.', u'..', u'../a', u'a/../../b',
+                        u'a\\..\\..\\b', u'/etc/passwd'):
+            self.assertRaises(FMFileError, archive.safe_path, '/dest',
+                              arcname)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import subprocess
+
+try:
+    import resource
+
+except ImportError:
+    resource = None
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# Size of sparse file hashed, far above the memory ceiling
+FILE_SIZE = 512 * 1024 * 1024
+
+# Most memory hashing may add to the interpreter, in bytes
+MEMORY_CEILING = 64 * 1024 * 1024
+
+# Prints peak resident memory before and after hashing argv[1]
+SCRIPT = """
+import sys
+import resource
+from pyfilemail.transfer import get_md5
+
+def peak():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+before = peak()
+get_md5(sys.argv[1], use_mmap=sys.argv[2] == 'mmap')
+print('%d %d' % (before, peak()))
+"""
+
+
+@unittest.skipIf(resource is None, 'resource module not available')
+class TestChecksumMemory(unittest.TestCase):
+    """Hashing a file must use the same memory regardless of its size."""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'sparse.bin')
+
+        with open(self.path, 'wb') as f:
+            f.truncate(FILE_SIZE)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def peak_increase(self, mode):
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.pathsep.join(
+            [ROOT] + [p for p in [env.get('PYTHONPATH')] if p])
+
+        output = subprocess.check_output(
+            [sys.executable, '-c', SCRIPT, self.path, mode], env=env)
+        before, after = [int(n) for n in output.split()]
+
+        # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+        scale = 1 if sys.platform == 'darwin' else 1024
+
+        return (after - before) * scale
+
+    def test_read(self):
+        self.assertLess(self.peak_increase('read'), MEMORY_CEILING)
+
+    def test_mmap(self):
+        self.assertLess(self.peak_increase('mmap'), MEMORY_CEILING)
+
+
+if __name__ == '__main__':
+    unittest.main()
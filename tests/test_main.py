@@ -0,0 +1,49 @@
+import sys
+import logging
+import unittest
+
+from pyfilemail import ratelimit, streamhandler
+from pyfilemail import __main__ as cli
+
+
+class TestParseArgs(unittest.TestCase):
+    """Options that apply to every run, including resumed transfers."""
+
+    def setUp(self):
+        self.argv = sys.argv
+        self.level = streamhandler.level
+
+    def tearDown(self):
+        sys.argv = self.argv
+        streamhandler.setLevel(self.level)
+        ratelimit.upload_limit.set_rate(None)
+        ratelimit.download_limit.set_rate(None)
+
+    def parse(self, *args):
+        sys.argv = ['pyfilemail'] + list(args)
+
+        return cli.parse_args()
+
+    def test_resume_rate_limits(self):
+        args = self.parse('--from', 'me@example.com', '--resume',
+                          '--max-upload-rate', '1M',
+                          '--max-download-rate', '500K')
+
+        self.assertTrue(args.resume)
+        self.assertEqual(ratelimit.upload_limit.rate, 1024 ** 2)
+        self.assertEqual(ratelimit.download_limit.rate, 500 * 1024)
+
+    def test_resume_quiet(self):
+        self.parse('--from', 'me@example.com', '--resume', '--quiet')
+
+        self.assertEqual(streamhandler.level, logging.WARNING)
+
+    def test_send_rate_limits(self):
+        self.parse('--from', 'me@example.com', '--to', 'you@example.com',
+                   '--payload', __file__, '--max-upload-rate', '2M')
+
+        self.assertEqual(ratelimit.upload_limit.rate, 2 * 1024 ** 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
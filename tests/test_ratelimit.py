@@ -0,0 +1,102 @@
+import unittest
+
+from pyfilemail import ratelimit
+from pyfilemail.errors import FMBaseError
+
+
+class FakeClock(object):
+    """Stands in for the time module, sleeping without waiting."""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = []
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+class TestParseRate(unittest.TestCase):
+    """Rates given on the command line."""
+
+    def test_units(self):
+        self.assertEqual(ratelimit.parse_rate('2048'), 2048)
+        self.assertEqual(ratelimit.parse_rate('500K'), 500 * 1024)
+        self.assertEqual(ratelimit.parse_rate('10m'), 10 * 1024 ** 2)
+        self.assertEqual(ratelimit.parse_rate(' 1G '), 1024 ** 3)
+
+    def test_fraction(self):
+        self.assertEqual(ratelimit.parse_rate('1.5M'), 1536 * 1024)
+
+    def test_invalid(self):
+        for rate in ('', 'K', 'fast', '10X', '1..5M'):
+            self.assertRaises(FMBaseError, ratelimit.parse_rate, rate)
+
+
+class TestTokenBucket(unittest.TestCase):
+    """Rate limiting with a fake clock."""
+
+    def setUp(self):
+        self.time = ratelimit.time
+        self.clock = ratelimit.time = FakeClock()
+
+    def tearDown(self):
+        ratelimit.time = self.time
+
+    def test_unlimited(self):
+        bucket = ratelimit.TokenBucket()
+        bucket.consume(10 ** 9)
+
+        self.assertFalse(bucket.limited)
+        self.assertEqual(self.clock.slept, [])
+
+    def test_burst(self):
+        bucket = ratelimit.TokenBucket(1000)
+        bucket.consume(250)
+
+        self.assertTrue(bucket.limited)
+        self.assertEqual(bucket.burst, 250)
+        self.assertEqual(self.clock.slept, [])
+
+    def test_rate(self):
+        bucket = ratelimit.TokenBucket(1000, burst=100)
+        for i in xrange(10):
+            bucket.consume(100)
+
+        # The burst goes at once, the other 900 bytes take 0.9 seconds
+        self.assertAlmostEqual(sum(self.clock.slept), 0.9)
+
+    def test_refill(self):
+        bucket = ratelimit.TokenBucket(1000, burst=100)
+        bucket.consume(100)
+
+        self.clock.now += 10
+        bucket.consume(100)
+
+        # Idle time refills no more than the burst
+        self.assertEqual(self.clock.slept, [])
+        self.assertEqual(bucket.tokens, 0)
+
+    def test_set_rate(self):
+        bucket = ratelimit.TokenBucket(1000, burst=100)
+        bucket.set_rate(None)
+        bucket.consume(10 ** 6)
+
+        self.assertFalse(bucket.limited)
+        self.assertEqual(self.clock.slept, [])
+
+    def test_consume_buckets(self):
+        buckets = [ratelimit.TokenBucket(1000, burst=100), None,
+                   ratelimit.TokenBucket(500, burst=100)]
+        ratelimit.consume(buckets, 300)
+
+        # The slower bucket waits after the faster one has
+        self.assertAlmostEqual(self.clock.slept[0], 0.2)
+        self.assertAlmostEqual(sum(self.clock.slept), 0.6)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,146 @@
+import logging
+import unittest
+
+from requests import exceptions
+
+from pyfilemail import retry, streamhandler
+from pyfilemail.errors import FileMailBaseError, AllFileserversBusy
+
+
+class FakeClock(object):
+    """Stands in for the time module, sleeping without waiting."""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = []
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+def http_error(http_status):
+    """Error of a response with `http_status` but no Filemail error code"""
+
+    return FileMailBaseError('HTTP error', http_status)
+
+
+class Failing(object):
+    """Raises `errors` in turn, then returns "done"."""
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+
+        return 'done'
+
+
+class TestRetryPolicy(unittest.TestCase):
+    """Which calls are retried, how often and how long they wait."""
+
+    def setUp(self):
+        self.time = retry.time
+        self.clock = retry.time = FakeClock()
+        self.policy = retry.RetryPolicy(attempts=3, backoff=1, max_backoff=4)
+
+        # Keep retry warnings out of the test output
+        self.level = streamhandler.level
+        streamhandler.setLevel(logging.ERROR)
+
+    def tearDown(self):
+        retry.time = self.time
+        streamhandler.setLevel(self.level)
+
+    def test_transient(self):
+        policy = self.policy
+
+        self.assertTrue(policy.is_transient(exceptions.ConnectionError()))
+        self.assertTrue(policy.is_transient(exceptions.ReadTimeout()))
+        self.assertTrue(policy.is_transient(http_error(503)))
+        self.assertTrue(policy.is_transient(AllFileserversBusy('busy')))
+
+        self.assertFalse(policy.is_transient(http_error(404)))
+        self.assertFalse(policy.is_transient(ValueError()))
+
+    def test_refused_only(self):
+        policy = self.policy
+
+        # A lost response may mean the transfer was created anyway
+        self.assertFalse(policy.is_transient(exceptions.ReadTimeout(),
+                                             'init'))
+        self.assertTrue(policy.is_transient(exceptions.ConnectTimeout(),
+                                            'init'))
+        self.assertTrue(policy.is_transient(http_error(503), 'init'))
+
+    def test_delay(self):
+        for retry_number in xrange(10):
+            delay = self.policy.delay(retry_number)
+
+            self.assertTrue(0 <= delay <= min(4, 2 ** retry_number))
+
+    def test_call_retries(self):
+        func = Failing(exceptions.ConnectionError(), http_error(502))
+
+        self.assertEqual(self.policy.call('get', func), 'done')
+        self.assertEqual(func.calls, 3)
+        self.assertEqual(len(self.clock.slept), 2)
+
+        stats = self.policy.stats()['get']
+        self.assertEqual((stats['calls'], stats['retries'], stats['failed']),
+                         (1, 2, 0))
+        self.assertAlmostEqual(stats['seconds'], sum(self.clock.slept))
+
+    def test_call_gives_up(self):
+        error = exceptions.ConnectionError()
+        func = Failing(exceptions.ConnectionError(), exceptions.Timeout(),
+                       error)
+
+        with self.assertRaises(exceptions.ConnectionError) as raised:
+            self.policy.call('get', func)
+
+        self.assertIs(raised.exception, error)
+        self.assertEqual(func.calls, 3)
+        self.assertEqual(self.policy.stats()['get']['failed'], 1)
+
+    def test_call_permanent(self):
+        func = Failing(http_error(404))
+
+        self.assertRaises(FileMailBaseError, self.policy.call, 'get', func)
+        self.assertEqual(func.calls, 1)
+        self.assertEqual(self.clock.slept, [])
+
+    def test_budgets(self):
+        policy = retry.RetryPolicy(budgets={'get': 5})
+
+        self.assertEqual(policy.budget('get'), 5)
+        self.assertEqual(policy.budget('complete'), 1)
+        self.assertEqual(policy.budget('unknown'), retry.ATTEMPTS)
+
+        func = Failing(exceptions.ConnectionError())
+        self.assertRaises(exceptions.ConnectionError,
+                          self.policy.call, 'complete', func)
+        self.assertEqual(func.calls, 1)
+
+    def test_attempts_override(self):
+        func = Failing(*[exceptions.ConnectionError()] * 5)
+
+        self.assertEqual(self.policy.call('get', func, attempts=6), 'done')
+        self.assertEqual(func.calls, 6)
+
+    def test_reset_stats(self):
+        self.policy.call('get', Failing())
+        self.policy.reset_stats()
+
+        self.assertEqual(self.policy.stats(), {})
+
+
+if __name__ == '__main__':
+    unittest.main()